@@ -0,0 +1,235 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Entries kept in memory per cache (LRU)
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "128"))
+# Optional directory for the on-disk tier (survives restarts), empty = memory only
+CACHE_DIR = os.getenv("CACHE_DIR", "")
+# Upper bound of each on-disk tier, least recently used files are deleted beyond it
+CACHE_DISK_MAX_BYTES = int(os.getenv("CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+# Distinct question strings shared between sessions
+QUESTION_POOL_SIZE = int(os.getenv("QUESTION_POOL_SIZE", "20000"))
+
+
+_disk_writer: Optional[ThreadPoolExecutor] = None
+_disk_writer_lock = threading.Lock()
+
+
+def _get_disk_writer() -> ThreadPoolExecutor:
+    """Single thread for background disk writes, created on first use"""
+    global _disk_writer
+    with _disk_writer_lock:
+        if _disk_writer is None:
+            _disk_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-writer")
+        return _disk_writer
+
+
+def content_hash(data: Union[bytes, str]) -> str:
+    """SHA-256 hex digest of the content"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class ContentCache:
+    """
+    LRU cache keyed by content hash, values must be JSON-serializable
+    if a disk tier is used
+    With a disk directory, entries are also written to
+    <dir>/<name>/<key[:2]>/<key>.json and read back on a memory miss;
+    the files are kept below disk_max_bytes (LRU, existing files are
+    indexed by modification time on first use)
+    Disk lookups and writes block: call get/set from a worker thread
+    if blocking_io is set, or set(background=True) while holding a lock
+    """
+
+    def __init__(
+        self, name: str, max_entries: int = CACHE_MAX_ENTRIES, disk_dir: str = CACHE_DIR,
+        disk_max_bytes: int = CACHE_DISK_MAX_BYTES
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.disk_dir = os.path.join(disk_dir, name) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        # key -> file size of the disk tier, LRU order (built lazily)
+        self._disk_entries: "Optional[OrderedDict[str, int]]" = None
+        self._disk_bytes = 0
+        self._disk_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._put(key, value)
+        with self._disk_lock:
+            index = self._disk_index()
+            if key in index:
+                index.move_to_end(key)
+        return value
+
+    @property
+    def blocking_io(self) -> bool:
+        return self.disk_dir is not None
+
+    def set(self, key: str, value: Any, background: bool = False):
+        """
+        Store the value; with `background` the disk write is queued on a
+        writer thread (the value must not be changed afterwards)
+        """
+        with self._lock:
+            self._put(key, value)
+        if not self.disk_dir:
+            return
+        if background:
+            _get_disk_writer().submit(self._write_disk, key, value)
+        else:
+            self._write_disk(key, value)
+
+    def _put(self, key: str, value: Any):
+        # Caller holds self._lock
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[Any]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Unreadable %s cache entry %s: %s", self.name, key, e)
+            return None
+
+    def _write_disk(self, key: str, value: Any):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write + rename so concurrent readers never see partial files
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            logger.warning("Could not write %s cache entry %s: %s", self.name, key, e)
+            return
+        with self._disk_lock:
+            index = self._disk_index()
+            self._disk_bytes += size - index.pop(key, 0)
+            index[key] = size
+            self._evict_disk(index)
+
+    def _disk_index(self) -> "OrderedDict[str, int]":
+        # Caller holds self._disk_lock
+        if self._disk_entries is None:
+            files = []
+            for root, _, names in os.walk(self.disk_dir):
+                for name in names:
+                    if not name.endswith(".json"):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(root, name))
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, name[:-len(".json")], stat.st_size))
+            files.sort()
+            self._disk_entries = OrderedDict((key, size) for _, key, size in files)
+            self._disk_bytes = sum(self._disk_entries.values())
+            self._evict_disk(self._disk_entries)
+        return self._disk_entries
+
+    def _evict_disk(self, index: "OrderedDict[str, int]"):
+        # Caller holds self._disk_lock, the newest entry is always kept
+        while self._disk_bytes > self.disk_max_bytes and len(index) > 1:
+            key, size = index.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Could not delete %s cache entry %s: %s", self.name, key, e)
+
+    def get_stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "disk": self.disk_dir is not None,
+            "disk_entries": len(self._disk_entries or ()),
+            "disk_bytes": self._disk_bytes,
+        }
+
+
+class StringPool:
+    """
+    Bounded LRU pool of strings: equal strings stored by many sessions
+    (the same lecture's questions) share one object
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def intern(self, value: str) -> str:
+        with self._lock:
+            pooled = self._entries.get(value)
+            if pooled is not None:
+                self._entries.move_to_end(value)
+                return pooled
+            self._entries[value] = value
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return value
+
+    def intern_all(self, values: List[str]) -> List[str]:
+        return [self.intern(value) for value in values]
+
+    def get_stats(self) -> dict:
+        return {"entries": len(self._entries), "max_entries": self.max_entries}
+
+
+# Extracted PDF text, keyed by the hash of the PDF bytes
+pdf_text_cache = ContentCache("pdf_text")
+# Generated decks (questions + origins), keyed by the hashes of the documents + question count
+question_cache = ContentCache("questions")
+# Sentence/paragraph index of a document (memory only, holds the whole
+# normalized text, so kept small)
+document_index_cache = ContentCache("document_index", max_entries=16, disk_dir="")
+# Question texts, shared by all sessions holding the same deck
+question_pool = StringPool(QUESTION_POOL_SIZE)
+# Encoded (and compressed) deck bodies, keyed by deck id + generated questions
+deck_body_cache = ContentCache("deck_body", max_entries=64, disk_dir="")
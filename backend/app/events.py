@@ -0,0 +1,145 @@
+import asyncio
+import json
+from typing import Dict, Optional, Set, Tuple
+
+
+# Max. buffered events per subscriber before a slow client gets disconnected
+# (the browser's EventSource reconnects and receives a fresh snapshot)
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class EventBroker:
+    """
+    Per-session fan-out of state changes to server-sent-event subscribers.
+
+    publish() is thread-safe: SessionService methods run in FastAPI's
+    threadpool and hand their events over to the event loop.
+    """
+
+    def __init__(self):
+        # session_id -> {(role, queue)}
+        self._subscribers: Dict[str, Set[Tuple[str, asyncio.Queue]]] = {}
+        # session_id -> futures of long-poll requests waiting for a new version
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """Attach the broker to the server's event loop (called from the app lifespan)"""
+        self._loop = loop
+
+    def subscribe(self, session_id: str, role: str) -> asyncio.Queue:
+        """Register a subscriber; must be called from the event loop"""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(session_id, set()).add((role, queue))
+        return queue
+
+    def unsubscribe(self, session_id: str, role: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(session_id)
+        if subscribers is None:
+            return
+        subscribers.discard((role, queue))
+        if not subscribers:
+            del self._subscribers[session_id]
+
+    def has_subscribers(self, session_id: str) -> bool:
+        return session_id in self._subscribers
+
+    def publish(self, session_id: str, role: str, event: str, data: dict):
+        """Send an event to all subscribers of a session with the given role"""
+        if self._loop is None or session_id not in self._subscribers:
+            return
+        self.publish_message(session_id, role, format_sse(event, data))
+
+    def publish_message(self, session_id: str, role: str, message: str):
+        """Like publish(), with an event encoded already (format_sse / format_sse_json)"""
+        if self._loop is None or session_id not in self._subscribers:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._dispatch, session_id, role, message)
+        except RuntimeError:
+            # Event loop already closed (shutdown)
+            pass
+
+    def _dispatch(self, session_id: str, role: str, message: str):
+        for sub_role, queue in list(self._subscribers.get(session_id, ())):
+            if sub_role != role:
+                continue
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Too slow: drop it, the stream handler closes on None
+                self.unsubscribe(session_id, sub_role, queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    def close_session(self, session_id: str):
+        """End all streams and long-polls of a removed session (thread-safe)"""
+        if self._loop is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._close, session_id)
+        except RuntimeError:
+            pass
+
+    def _close(self, session_id: str):
+        for _, queue in self._subscribers.pop(session_id, ()):
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+        self._wake(session_id)
+
+    def notify_changed(self, session_id: str):
+        """Wake up long-poll requests waiting on this session (thread-safe)"""
+        if self._loop is None or session_id not in self._waiters:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wake, session_id)
+        except RuntimeError:
+            pass
+
+    def _wake(self, session_id: str):
+        for waiter in self._waiters.pop(session_id, ()):
+            if not waiter.done():
+                waiter.set_result(True)
+
+    async def wait_for_change(self, session, seen_version: int, timeout: float) -> bool:
+        """
+        Wait until the session's version differs from seen_version
+        or the timeout expires
+        Returns: True if it changed
+        """
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        session_id = session.id
+        waiter = self._loop.create_future()
+        self._waiters.setdefault(session_id, set()).add(waiter)
+        try:
+            # Re-check after registering: a mutation in the threadpool may
+            # have happened just before we were visible to notify_changed()
+            if session.version != seen_version:
+                return True
+            return await asyncio.wait_for(waiter, timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters = self._waiters.get(session_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[session_id]
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Encode one server-sent event"""
+    return format_sse_json(event, json.dumps(data, separators=(',', ':')))
+
+
+def format_sse_json(event: str, data: str) -> str:
+    """Encode one server-sent event whose data is serialized JSON already"""
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+# Global broker
+broker = EventBroker()
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.events import broker
+from app.models import store
+
+logger = logging.getLogger(__name__)
+
+# Jobs processed concurrently (each job still fans its files out to the extraction backend)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Max. jobs waiting for a worker, further submissions are rejected with 429
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "16"))
+# Finished jobs stay queryable for this long
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+
+
+class QueueFullError(Exception):
+    """Too many jobs are waiting, the client should retry later"""
+
+
+@dataclass
+class Job:
+    """Background upload / generation job with per-file progress"""
+    id: str
+    session_id: str
+    status: str = "queued"  # queued | running | done | failed
+    stage: str = "queued"  # queued | extracting | generating | done
+    files: List[Dict] = field(default_factory=list)  # [{filename, size, status, characters}]
+    question_count: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Shared store: a newer state waits to be written / the write in progress
+    _dirty: bool = field(default=False, repr=False)
+    _writer: Optional[asyncio.Future] = field(default=None, repr=False)
+
+    def update_file(self, index: int, **changes):
+        self.files[index].update(changes)
+        self.notify()
+
+    def set_stage(self, stage: str):
+        self.stage = stage
+        self.notify()
+
+    def notify(self):
+        """Push the current progress to the session's examiners (and other workers)"""
+        broker.publish(self.session_id, "examiner", "job", self.to_dict())
+        if store.shared:
+            self._persist()
+
+    async def persist(self):
+        """Write the current state to a shared store and wait for it"""
+        if store.shared:
+            await self._persist()
+
+    def _persist(self) -> asyncio.Future:
+        # Called on the event loop. Writes run in the threadpool, one at a
+        # time per job and always with the latest state, so none is lost
+        # or overtaken by an older one
+        self._dirty = True
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self._write())
+        return self._writer
+
+    async def _write(self):
+        while self._dirty:
+            self._dirty = False
+            # Serialized here: the files are changed on the loop meanwhile
+            data = json.dumps(self.to_dict(), separators=(",", ":"))
+            try:
+                await run_in_threadpool(store.save_job, self.session_id, self.id, data, self.finished_at)
+            except Exception:
+                logger.exception("Could not save job %s", self.id)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "files": self.files,
+            "files_done": sum(1 for f in self.files if f["status"] in ("done", "failed")),
+            "question_count": self.question_count,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    Bounded queue of background jobs, processed by a fixed number of
+    worker tasks on the event loop. Jobs run in this process; with a
+    shared session store their status is also saved there, so every
+    worker can report it.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_SIZE):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._jobs: Dict[str, Job] = {}
+        self._running = 0
+
+    def start(self):
+        """Start the worker tasks; must be called from the event loop"""
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Let jobs that never ran release their resources (temp files)
+        while self._queue is not None and not self._queue.empty():
+            job, _, discard = self._queue.get_nowait()
+            if discard is not None:
+                discard(job)
+        self._queue = None
+
+    def full(self) -> bool:
+        return self._queue is not None and self._queue.full()
+
+    def create(self, session_id: str, files: List[Dict]) -> Job:
+        """New job for a session, not queued yet"""
+        return Job(id=uuid.uuid4().hex, session_id=session_id, files=files)
+
+    def submit(
+        self,
+        job: Job,
+        run: Callable[[Job], Awaitable[None]],
+        discard: Optional[Callable[[Job], None]] = None
+    ) -> Job:
+        """
+        Queue `run(job)` for a worker, `discard(job)` is called instead if
+        the server shuts down before the job started
+        Raises QueueFullError if JOB_QUEUE_SIZE jobs are already waiting
+        """
+        self.start()
+        try:
+            self._queue.put_nowait((job, run, discard))
+        except asyncio.QueueFull:
+            raise QueueFullError()
+        self._prune()
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, session_id: str, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is None or job.session_id != session_id:
+            return None
+        return job
+
+    async def _worker(self):
+        while True:
+            job, run, _ = await self._queue.get()
+            self._running += 1
+            job.status = "running"
+            job.started_at = time.time()
+            job.notify()
+            try:
+                await run(job)
+                job.status = "done"
+                job.stage = "done"
+            except Exception as e:
+                logger.exception("Job %s for session %s failed", job.id, job.session_id)
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                self._running -= 1
+                job.finished_at = time.time()
+                job.notify()
+                self._queue.task_done()
+
+    def _prune(self):
+        """Forget finished jobs after JOB_RETENTION_SECONDS"""
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get_stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queued": self.max_queued,
+            "running": self._running,
+            "tracked": len(self._jobs),
+        }
+
+
+# Global job queue
+jobs = JobQueue()
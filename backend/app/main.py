@@ -1,14 +1,148 @@
-from fastapi import FastAPI, HTTPException, Header, UploadFile, File, Depends
+import fastapi.routing
+from fastapi import FastAPI, HTTPException, Header, UploadFile, File, Depends, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional, List
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.convertors import Convertor, register_url_convertor
+from contextlib import asynccontextmanager
+from typing import Optional, List, Tuple
+import asyncio
+import hashlib
+import inspect
+import logging
+import secrets
 import tempfile
+import time
 import os
 
-from app.models import store
+from app.logging_config import setup_logging
+from app.cache import ContentCache, deck_body_cache, document_index_cache, pdf_text_cache, question_cache, question_pool
+from app.compression import CompressionMiddleware
+from app.models import (
+    ExaminerExistsError, SessionData, SessionConflictError, SessionFilter, SessionFullError, SessionSnapshot,
+    session_etag, store, SWEEP_INTERVAL_SECONDS
+)
+from app.events import broker, format_sse, format_sse_json
+from app.jobs import Job, JOB_RETENTION_SECONDS, QueueFullError, jobs
+from app.schemas import (
+    AdminSessions, Deck, EventsTicket, GenerateRequest, GenerateResponse, GradeRequest, JobStatus, JoinRequest,
+    JoinResponse, JumpResponse, LearnerCurrent, SessionCreated, SessionStatus, StatusResponse,
+    UploadAccepted,
+)
 from app.services import SessionService
-from app.utils import extract_text_from_pdf
+from app import metrics
+from app.metrics import MetricsMiddleware, extraction_seconds_per_page, upload_bytes
+from app.utils import (
+    extract_pdf, generate_token, get_document_index, normalize_session_code, MAX_UPLOAD_BYTES,
+    MAX_UPLOAD_REQUEST_BYTES, DEFAULT_NUM_QUESTIONS, MAX_NUM_QUESTIONS
+)
+from app.workers import EXTRACTION_BACKEND, run_cpu_bound, shutdown_executor
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Close event streams of sessions that expire or get evicted
+store.add_removal_listener(broker.close_session)
+
+
+async def sweep_sessions():
+    """Background task: expire idle sessions and enforce store limits"""
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+        try:
+            removed = await store_call(store.sweep)
+            if removed:
+                logger.info("Removed %d expired/evicted sessions", len(removed))
+            await store_call(store.expire_jobs, time.time() - JOB_RETENTION_SECONDS)
+        except Exception:
+            logger.exception("Session sweep failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("PDF extraction backend: %s", EXTRACTION_BACKEND)
+    broker.bind(asyncio.get_running_loop())
+    sweeper = asyncio.create_task(sweep_sessions())
+    jobs.start()
+    yield
+    sweeper.cancel()
+    await jobs.stop()
+    shutdown_executor()
+
+
+def default_response_class() -> type:
+    """
+    ORJSONResponse if orjson is installed (renders bodies several times faster
+    than json.dumps). Newer FastAPI versions serialize response models to
+    JSON bytes themselves and deprecate it, there JSONResponse is kept.
+    """
+    if "dump_json" in inspect.signature(fastapi.routing.serialize_response).parameters:
+        return JSONResponse
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
+        return JSONResponse
+    from fastapi.responses import ORJSONResponse
+    return ORJSONResponse
+
+
+DefaultResponse = default_response_class()
+
+
+class SessionCodeConvertor(Convertor):
+    """{session_id:code}: codes typed by hand reach the store in canonical form"""
+    regex = "[^/]+"
+
+    def convert(self, value: str) -> str:
+        return normalize_session_code(value)
+
+    def to_string(self, value: str) -> str:
+        return value
+
+
+register_url_convertor("code", SessionCodeConvertor())
+
+
+class UploadLimitMiddleware:
+    """
+    Pure ASGI middleware: caps upload request bodies at max_bytes before
+    Starlette spools the multipart form to disk. A larger Content-Length is
+    refused right away, otherwise the body is counted as it arrives and the
+    request fails with 413 as soon as it passes the limit.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].endswith("/upload"):
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Upload exceeds the limit of {self.max_bytes} bytes"
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit() and int(value) > self.max_bytes:
+                    await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+                    return
+                break
+
+        received = 0
 
-app = FastAPI(title="StudyDuel API")
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised inside the form parsing, the app answers it like any HTTPException
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+app = FastAPI(title="StudyDuel API", lifespan=lifespan, default_response_class=DefaultResponse)
 
 # CORS configuration
 cors_origins_env = os.getenv("CORS_ORIGINS", "")
@@ -23,9 +157,7 @@ if cors_origins_env:
     additional_origins = [o.strip() for o in cors_origins_env.split(",") if o.strip()]
     cors_origins.extend(additional_origins)
 
-# Debug: Print CORS origins on startup
-print(f"[CORS] Configured origins: {cors_origins}")
-print(f"[CORS] Environment variable CORS_ORIGINS: {cors_origins_env or 'NOT SET'}")
+logger.info("CORS origins: %s (CORS_ORIGINS: %s)", cors_origins, cors_origins_env or "NOT SET")
 
 app.add_middleware(
     CORSMiddleware,
@@ -33,53 +165,125 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
+app.add_middleware(UploadLimitMiddleware)
+app.add_middleware(CompressionMiddleware)
+# Outermost, so the latency includes CORS handling and compression
+app.add_middleware(MetricsMiddleware)
+
 
+@app.exception_handler(SessionConflictError)
+async def session_conflict(request: Request, exc: SessionConflictError):
+    """Another worker changed the session concurrently, the client should retry"""
+    return JSONResponse(
+        status_code=409,
+        content={"detail": f"Session {exc} was modified concurrently, please retry"}
+    )
 
-# Dependency for token verification
+
+# Token verification, returns the resolved session
 def verify_token(
     session_id: str,
     required_role: str,
     x_token: Optional[str] = Header(None)
-):
+) -> SessionData:
     if not x_token:
-        print(f"[AUTH ERROR] Missing X-Token header for session {session_id}")
+        logger.debug("Missing X-Token header for session %s", session_id)
         raise HTTPException(status_code=401, detail="Missing X-Token header")
     
-    session = store.get_session(session_id)
-    if not session:
-        print(f"[AUTH ERROR] Session {session_id} not found. Available: {list(store.sessions.keys())}")
+    # Fast path: one lookup in the global token index
+    session = SessionService.verify_token(session_id, x_token, required_role)
+    if session is not None:
+        return session
+    
+    if not store.get_session(session_id):
+        logger.debug("Session %s not found", session_id)
         raise HTTPException(status_code=404, detail=f"Session {session_id} not found. It may have expired.")
     
-    if not SessionService.verify_token(session_id, x_token, required_role):
-        print(f"[AUTH ERROR] Token verification failed for session {session_id}, role {required_role}")
-        raise HTTPException(status_code=403, detail=f"Invalid token or insufficient permissions for role: {required_role}")
+    logger.info("Token verification failed for session %s, role %s", session_id, required_role)
+    raise HTTPException(status_code=403, detail=f"Invalid token or insufficient permissions for role: {required_role}")
+
+
+async def store_call(func, *args):
+    """
+    Call into the store (or code that takes session locks while saving)
+    In-memory lookups run right on the event loop; with a store doing I/O
+    they go to the threadpool, a busy database must not stall the loop
+    """
+    if store.blocking_io:
+        return await run_in_threadpool(func, *args)
+    return func(*args)
+
+
+async def cache_call(cache: ContentCache, func, *args):
+    """Like store_call, for caches whose disk tier reads and writes files"""
+    if cache.blocking_io:
+        return await run_in_threadpool(func, *args)
+    return func(*args)
+
+
+# Dependencies (async: no threadpool hop for the in-memory store)
+async def require_examiner(session_id: str, x_token: Optional[str] = Header(None)) -> SessionData:
+    return await store_call(verify_token, session_id, "examiner", x_token)
+
+
+async def require_learner(session_id: str, x_token: Optional[str] = Header(None)) -> SessionData:
+    return await store_call(verify_token, session_id, "learner", x_token)
+
+
+# Upper bound for ?wait= long-polling on the read endpoints
+LONG_POLL_MAX_SECONDS = 30
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of If-None-Match (a list of tags or "*") with the current tag"""
+    if not if_none_match:
+        return False
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == opaque:
+            return True
+    return False
+
+
+async def not_modified(session: SessionData, if_none_match: Optional[str], wait: float) -> Optional[Response]:
+    """
+    Conditional GET for the polling endpoints
+    Returns a 304 response if the client's ETag is still current
+    (after waiting up to `wait` seconds for a change), otherwise None
+    """
+    etag = session_etag(session)
+    if not etag_matches(if_none_match, etag):
+        return None
+    
+    if wait > 0:
+        timeout = min(wait, LONG_POLL_MAX_SECONDS)
+        if await broker.wait_for_change(session, session.version, timeout):
+            return None
     
-    return x_token
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def set_etag(response: Response, session: SessionData):
+    response.headers["ETag"] = session_etag(session)
+    response.headers["Cache-Control"] = "no-cache"
+
+
+def snapshot_response(body: bytes, snapshot: SessionSnapshot) -> Response:
+    """A view from the session's snapshot, tagged with the version it was built for"""
+    return Response(body, media_type="application/json", headers={
+        "ETag": snapshot.etag,
+        "Cache-Control": "no-cache"
+    })
 
 
 # ============================================================================
 # Session Management Endpoints
 # ============================================================================
 
-@app.get("/debug/sessions")
-def debug_sessions():
-    """Debug endpoint to check active sessions (development only)"""
-    sessions_info = []
-    for session_id, session in store.sessions.items():
-        sessions_info.append({
-            "id": session_id,
-            "roles": list(session.tokens.values()),
-            "questions_count": len(session.questions),
-            "current_index": session.current_index,
-            "revealed": session.revealed
-        })
-    return {
-        "total_sessions": len(store.sessions),
-        "sessions": sessions_info
-    }
-
-@app.post("/session")
+@app.post("/session", response_model=SessionCreated)
 def create_session():
     """Create a new session, returns examiner_token"""
     session_id, examiner_token = SessionService.create_session()
@@ -89,22 +293,25 @@ def create_session():
     }
 
 
-@app.post("/session/{session_id}/join")
-def join_session(session_id: str, body: dict):
+@app.post("/session/{session_id:code}/join", response_model=JoinResponse)
+def join_session(session_id: str, body: JoinRequest, x_token: Optional[str] = Header(None)):
     """
     Join an existing session
     Body: { "role": "learner" | "examiner" }
+    X-Token (optional): token from an earlier join, returned again
     Returns: { "token": "..." }
     """
     # Validate session exists
     if not store.get_session(session_id):
         raise HTTPException(status_code=404, detail="Session not found")
     
-    role = body.get("role")
-    if role not in ["learner", "examiner"]:
-        raise HTTPException(status_code=400, detail="Invalid role")
-    
-    token = SessionService.join_session(session_id, role)
+    role = body.role
+    try:
+        token = SessionService.join_session(session_id, role, x_token)
+    except SessionFullError:
+        raise HTTPException(status_code=409, detail="Session is full")
+    except ExaminerExistsError:
+        raise HTTPException(status_code=403, detail="Session already has an examiner")
     if not token:
         raise HTTPException(status_code=400, detail="Could not join session")
     
@@ -114,212 +321,515 @@ def join_session(session_id: str, body: dict):
     }
 
 
+# Uploads are streamed to disk in chunks of this size
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Files of one upload read / extracted / indexed at the same time
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+
+
+async def spool_upload(file: UploadFile) -> Tuple[str, int, str]:
+    """
+    Stream an upload into a temp file, hashing it on the way
+    Returns: (path, size, sha256) - the caller deletes the file
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File {file.filename} exceeds the upload limit of {MAX_UPLOAD_BYTES} bytes"
+                )
+            hasher.update(chunk)
+            tmp.write(chunk)
+    except BaseException:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise
+    tmp.close()
+    return tmp.name, size, hasher.hexdigest()
+
+
+async def extract_text(path: str, key: str) -> str:
+    """Extract PDF text from a spooled upload, reusing earlier results for identical files"""
+    text = await cache_call(pdf_text_cache, pdf_text_cache.get, key)
+    if text is None:
+        start = time.perf_counter()
+        text, pages = await run_cpu_bound(extract_pdf, path)
+        if pages:
+            extraction_seconds_per_page.observe((time.perf_counter() - start) / pages)
+        await cache_call(pdf_text_cache, pdf_text_cache.set, key, text)
+    return text
+
+
 # ============================================================================
 # Learner Endpoints
 # ============================================================================
 
-@app.post("/session/{session_id}/upload")
+@app.post("/session/{session_id:code}/upload", status_code=202, response_model=UploadAccepted)
 async def upload_pdfs(
     session_id: str,
     files: List[UploadFile] = File(...),
-    x_token: Optional[str] = Header(None)
+    num_questions: int = Query(DEFAULT_NUM_QUESTIONS, ge=1, le=MAX_NUM_QUESTIONS),
+    append: bool = Query(False),
+    session: SessionData = Depends(require_examiner)
 ):
     """
     Upload PDFs for learning material
     Examiner only (the creator uploads the study material)
+    ?num_questions=<n> sets the deck size
+    ?append=true adds the questions behind the current deck (only the new files are scanned)
+    Files are stored and queued, extraction and question generation run
+    as a background job - poll GET /session/{id}/jobs/{job_id}
     """
+    if not files:
+        raise HTTPException(status_code=400, detail="No files provided")
+    
+    for file in files:
+        if not file.filename.lower().endswith('.pdf'):
+            raise HTTPException(status_code=400, detail=f"File {file.filename} is not a PDF")
+    
+    # Reject before reading the bodies if no job could be queued anyway
+    if jobs.full():
+        raise queue_full()
+    
+    logger.info("Starting upload for session %s, %d files", session_id, len(files))
+    
+    limit = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+    spooled: List[Optional[Tuple[str, str]]] = [None] * len(files)  # [(path, sha256)]
+    job_files: List[dict] = [{} for _ in files]
+    
+    async def spool(index: int, file: UploadFile):
+        async with limit:
+            logger.debug("Reading %s", file.filename)
+            started = time.perf_counter()
+            path, size, key = await spool_upload(file)
+            spooled[index] = (path, key)
+            upload_bytes.inc(size)
+            job_files[index] = {
+                "filename": file.filename, "size": size, "status": "queued", "characters": 0,
+                "timings": {"read": round(time.perf_counter() - started, 4)}
+            }
+    
     try:
-        verify_token(session_id, "examiner", x_token)
-        
-        if not files:
-            raise HTTPException(status_code=400, detail="No files provided")
-        
-        print(f"[UPLOAD] Starting upload for session {session_id}, {len(files)} files")
-        
-        pdf_texts = {}
-        for file in files:
-            if not file.filename.lower().endswith('.pdf'):
-                raise HTTPException(status_code=400, detail=f"File {file.filename} is not a PDF")
-            
-            print(f"[UPLOAD] Processing {file.filename}")
-            content = await file.read()
-            SessionService.add_pdf_metadata(session_id, file.filename, len(content))
-            
+        # Every file is read to the end (or cleans up after itself) before this returns
+        results = await asyncio.gather(*(spool(i, f) for i, f in enumerate(files)), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            raise errors[0]
+    except BaseException:
+        remove_spooled([s for s in spooled if s is not None])
+        raise
+    
+    job = jobs.create(session_id, job_files)
+    try:
+        jobs.submit(
+            job,
+            lambda job: process_upload(job, spooled, num_questions, append),
+            lambda job: remove_spooled(spooled)
+        )
+    except QueueFullError:
+        remove_spooled(spooled)
+        raise queue_full()
+    # Polls may reach another worker right away
+    await job.persist()
+    
+    logger.info("Queued job %s for session %s", job.id, session_id)
+    return {
+        "status": "accepted",
+        "job_id": job.id,
+        "uploaded": len(files),
+        "files": [f.filename for f in files]
+    }
+
+
+def queue_full() -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Too many uploads in progress, please retry later",
+        headers={"Retry-After": "5"}
+    )
+
+
+def remove_spooled(spooled: List[Tuple[str, str]]):
+    for path, _ in spooled:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass  # removed once its file was extracted
+
+
+def current_session(job: Job) -> SessionData:
+    """The job's session as currently stored (it may have changed while the job waited)"""
+    session = store.get_session(job.session_id)
+    if session is None:
+        raise RuntimeError("Session not found")
+    return session
+
+
+async def process_upload(job: Job, spooled: List[Tuple[str, str]], num_questions: int, append: bool = False):
+    """
+    Background job: extract and index the spooled PDFs, then generate the questions
+    Files go through the pipeline concurrently (UPLOAD_CONCURRENCY at a time);
+    a file that fails is reported and left out, the others are still used
+    """
+    limit = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+    
+    async def process(index: int, path: str, key: str) -> Optional[str]:
+        filename = job.files[index]["filename"]
+        timings = job.files[index]["timings"]
+        async with limit:
+            job.update_file(index, status="extracting")
+            started = time.perf_counter()
             try:
-                text = extract_text_from_pdf(content)
-                pdf_texts[file.filename] = text
-                print(f"[UPLOAD] Extracted {len(text)} characters from {file.filename}")
+                text = await extract_text(path, key)
             except Exception as e:
-                print(f"[UPLOAD ERROR] Failed to extract text from {file.filename}: {e}")
-                # Continue with other files
-                pdf_texts[file.filename] = ""
-
-        # Auto-generate questions after upload
-        print(f"[UPLOAD] Generating questions...")
-        success = SessionService.generate_questions(session_id, pdf_texts)
-        if not success:
-            raise HTTPException(status_code=500, detail="Failed to generate questions")
+                logger.warning("Failed to extract text from %s: %s", filename, e)
+                timings["extract"] = round(time.perf_counter() - started, 4)
+                job.update_file(index, status="failed", error=str(e))
+                return None
+            finally:
+                os.unlink(path)
+            timings["extract"] = round(time.perf_counter() - started, 4)
+            if not text.strip():
+                logger.warning("No text in %s", filename)
+                job.update_file(index, status="failed", error="No text found (scanned PDF?)")
+                return None
+            
+            # Segment it now, while other files are still being extracted
+            job.update_file(index, status="indexing")
+            started = time.perf_counter()
+            await run_in_threadpool(get_document_index, text)
+            timings["index"] = round(time.perf_counter() - started, 4)
         
-        print(f"[UPLOAD] Upload complete")
-        return {
-            "status": "success",
-            "uploaded": len(files),
-            "files": [f.filename for f in files]
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"[UPLOAD ERROR] Unexpected error: {e}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+        session = await store_call(current_session, job)
+        await store_call(SessionService.add_pdf_metadata, session, filename, job.files[index]["size"])
+        job.update_file(index, status="done", characters=len(text))
+        logger.info("Extracted %d characters from %s", len(text), filename)
+        return text
+    
+    job.set_stage("extracting")
+    tasks = [asyncio.ensure_future(process(index, path, key)) for index, (path, key) in enumerate(spooled)]
+    try:
+        # A failure that is not the file's own (e.g. the session was deleted)
+        # ends the job: the other files need not be extracted any more
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Remove the files (not reached, or cancelled on shutdown) only
+        # once no task can read them or report into the job any more
+        await asyncio.gather(*tasks, return_exceptions=True)
+        remove_spooled(spooled)
+        for index, task in enumerate(tasks):
+            if task.cancelled():
+                job.update_file(index, status="failed", error="Cancelled")
+            elif task.exception() is not None:
+                job.update_file(index, status="failed", error=str(task.exception()))
+    errors = [task.exception() for task in tasks if not task.cancelled() and task.exception() is not None]
+    if errors:
+        raise errors[0]
+    texts = [task.result() for task in tasks]
+    
+    pdf_texts = {}
+    for f, text in zip(job.files, texts):
+        if text is not None:
+            # Same filename twice: keep both documents
+            name = f["filename"] if f["filename"] not in pdf_texts else f"{f['filename']} ({len(pdf_texts) + 1})"
+            pdf_texts[name] = text
+    if not pdf_texts:
+        raise RuntimeError("No text could be extracted from any of the files")
+    
+    # Auto-generate questions after upload
+    job.set_stage("generating")
+    logger.debug("Generating questions for session %s from %d files", job.session_id, len(pdf_texts))
+    session = await store_call(current_session, job)
+    success = await run_in_threadpool(SessionService.generate_questions, session, pdf_texts, num_questions, append)
+    if not success:
+        raise RuntimeError("Failed to generate questions")
+    
+    job.question_count = session.question_count
+    logger.info("Upload complete for session %s", job.session_id)
 
 
-@app.post("/session/{session_id}/generate")
-def generate_questions(
+@app.get("/session/{session_id:code}/jobs/{job_id}", response_model=JobStatus)
+def get_job(
     session_id: str,
-    body: dict,
-    x_token: Optional[str] = Header(None)
+    job_id: str,
+    session: SessionData = Depends(require_examiner)
+):
+    """
+    Progress of an upload job (per file)
+    Examiner only
+    """
+    job = jobs.get(session_id, job_id)
+    if job is not None:
+        return job.to_dict()
+    # Accepted by another worker
+    saved = store.get_job(session_id, job_id)
+    if saved is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return saved
+
+
+@app.post("/session/{session_id:code}/generate", response_model=GenerateResponse)
+def generate_questions(
+    body: GenerateRequest,
+    session: SessionData = Depends(require_learner)
 ):
     """
     Generate questions from uploaded PDFs
     Learner only
-    Body: { "pdf_texts": { "filename": "text content", ... } }
+    Body: { "pdf_texts": { "filename": "text content", ... }, "num_questions": 10, "append": false }
     """
-    verify_token(session_id, "learner", x_token)
-    session = store.get_session(session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
-    pdf_texts = body.get("pdf_texts", {})
-    
-    if not pdf_texts:
-        raise HTTPException(status_code=400, detail="No PDF texts provided")
-    
-    success = SessionService.generate_questions(session_id, pdf_texts)
+    success = SessionService.generate_questions(session, body.pdf_texts, body.num_questions, body.append)
     if not success:
         raise HTTPException(status_code=400, detail="Failed to generate questions")
     
     return {
         "status": "success",
-        "question_count": len(session.questions)
+        "question_count": session.question_count
     }
 
 
-@app.get("/session/{session_id}/current")
-def get_current_question(
-    session_id: str,
-    x_token: Optional[str] = Header(None)
+# Locked / completed states carry no "question" key
+@app.get("/session/{session_id:code}/current", response_model=LearnerCurrent, response_model_exclude_none=True)
+async def get_current_question(
+    wait: float = Query(0, ge=0),
+    if_none_match: Optional[str] = Header(None),
+    session: SessionData = Depends(require_learner)
 ):
     """
     Get current question for learner
     Learner only
     Returns locked state if not revealed, or the actual question if revealed
+    Supports If-None-Match (304) and long-polling via ?wait=<seconds>
     """
-    verify_token(session_id, "learner", x_token)
-    result = SessionService.get_learner_current(session_id)
-    if result is None:
-        raise HTTPException(status_code=404, detail="Session not found")
+    unchanged = await not_modified(session, if_none_match, wait)
+    if unchanged is not None:
+        return unchanged
     
-    return result
+    # Serialized by the last mutation, the same bytes for every learner
+    snapshot = await store_call(SessionService.get_snapshot, session)
+    return snapshot_response(snapshot.learner, snapshot)
 
 
 # ============================================================================
 # Examiner Endpoints
 # ============================================================================
 
-@app.get("/session/{session_id}/questions")
-def get_all_questions(
-    session_id: str,
-    x_token: Optional[str] = Header(None)
+@app.get("/session/{session_id:code}/questions", response_model=SessionStatus)
+async def get_all_questions(
+    response: Response,
+    wait: float = Query(0, ge=0),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    if_none_match: Optional[str] = Header(None),
+    session: SessionData = Depends(require_examiner)
 ):
     """
     Get all questions for examiner
-    Examiner only - returns full question list with metadata
+    Examiner only - returns the questions generated so far with metadata
+    ?offset=&limit= return a page of the questions
+    Supports If-None-Match (304) and long-polling via ?wait=<seconds>
     """
-    verify_token(session_id, "examiner", x_token)
-    result = SessionService.get_session_status(session_id, "examiner")
-    if result is None:
-        raise HTTPException(status_code=404, detail="Session not found")
+    unchanged = await not_modified(session, if_none_match, wait)
+    if unchanged is not None:
+        return unchanged
+    
+    # Polling for new questions when all are loaded: only the status changes
+    snapshot = await store_call(SessionService.get_snapshot, session)
+    if offset == snapshot.examiner_offset:
+        return snapshot_response(snapshot.examiner, snapshot)
     
-    return result
+    set_etag(response, session)
+    return await store_call(SessionService.get_session_status, session, offset, limit)
 
 
-@app.post("/session/{session_id}/reveal")
-def reveal_current_question(
-    session_id: str,
-    x_token: Optional[str] = Header(None)
+@app.get("/session/{session_id:code}/deck", response_model=Deck)
+def get_deck(
+    request: Request,
+    if_none_match: Optional[str] = Header(None),
+    session: SessionData = Depends(require_examiner)
 ):
+    """
+    Questions generated so far, without the mutable session state
+    Examiner only - served from a cached, pre-compressed body with a strong
+    ETag that only changes when questions are added or regenerated
+    """
+    key, body = SessionService.get_deck(session)
+    encoding = body.encoding_for(request.headers.get("accept-encoding", ""))
+    # One tag per representation, the bytes differ per encoding
+    etag = f'"deck-{key}-{encoding}"' if encoding else f'"deck-{key}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body.encoded(encoding), media_type="application/json", headers=headers)
+
+
+@app.post("/session/{session_id:code}/reveal", response_model=StatusResponse)
+def reveal_current_question(session: SessionData = Depends(require_examiner)):
     """
     Reveal current question to learner
     Examiner only
     """
-    verify_token(session_id, "examiner", x_token)
-    success = SessionService.reveal_current_question(session_id)
+    success = SessionService.reveal_current_question(session)
     if not success:
         raise HTTPException(status_code=404, detail="Session not found")
     
     return {"status": "revealed"}
 
 
-@app.post("/session/{session_id}/next")
-def next_question(
-    session_id: str,
-    x_token: Optional[str] = Header(None)
-):
+@app.post("/session/{session_id:code}/next", response_model=StatusResponse)
+def next_question(session: SessionData = Depends(require_examiner)):
     """
     Move to next question
     Examiner only
     """
-    verify_token(session_id, "examiner", x_token)
-    success = SessionService.next_question(session_id)
+    success = SessionService.next_question(session)
     if not success:
         raise HTTPException(status_code=400, detail="No more questions or session not found")
     
     return {"status": "success"}
 
-@app.post("/session/{session_id}/jump/{index}")
+@app.post("/session/{session_id:code}/jump/{index}", response_model=JumpResponse)
 def jump_to_question(
-    session_id: str,
     index: int,
-    x_token: Optional[str] = Header(None)
+    session: SessionData = Depends(require_examiner)
 ):
     """
     Jump to a specific question by index
     Examiner only
     """
-    verify_token(session_id, "examiner", x_token)
-    success = SessionService.jump_to_question(session_id, index)
+    success = SessionService.jump_to_question(session, index)
     if not success:
         raise HTTPException(status_code=400, detail="Invalid question index or session not found")
     
     return {"status": "jumped", "index": index}
 
-@app.post("/session/{session_id}/grade")
+@app.post("/session/{session_id:code}/grade", response_model=StatusResponse)
 def grade_question(
-    session_id: str,
-    body: dict,
-    x_token: Optional[str] = Header(None)
+    body: GradeRequest,
+    session: SessionData = Depends(require_examiner)
 ):
     """
     Grade a question
     Examiner only
     Body: { "index": int, "status": "ok" | "meh" | "fail" }
     """
-    verify_token(session_id, "examiner", x_token)
-    index = body.get("index")
-    status = body.get("status")
-    
-    if index is None or status is None:
-        raise HTTPException(status_code=400, detail="Missing index or status")
-    
-    success = SessionService.grade_question(session_id, index, status)
+    success = SessionService.grade_question(session, body.index, body.status)
     if not success:
-        raise HTTPException(status_code=400, detail="Invalid grade status")
+        raise HTTPException(status_code=400, detail="Question index out of range")
     
     return {"status": "graded"}
 
 
+# ============================================================================
+# Server-Push (Server-Sent Events)
+# ============================================================================
+
+# Comment line sent when idle so proxies don't close the stream
+EVENTS_KEEPALIVE_SECONDS = 15
+# Lifetime of a ticket for opening an event stream
+EVENTS_TICKET_SECONDS = 30
+
+
+def require_events():
+    """Event streams are fed in-process: refuse them when workers share the sessions, clients poll"""
+    if store.shared:
+        raise HTTPException(status_code=503, detail="Event streams are not available with a shared session store, use polling")
+
+
+async def resolve_session_token(session_id: str, token: Optional[str]) -> Tuple[SessionData, str]:
+    """(session, role) for a token of this session, either role"""
+    if not token:
+        raise HTTPException(status_code=401, detail="Missing X-Token header")
+    
+    resolved = await store_call(store.resolve_token, token)
+    if resolved is None or resolved[0].id != session_id:
+        if not await store_call(store.get_session, session_id):
+            raise HTTPException(status_code=404, detail=f"Session {session_id} not found. It may have expired.")
+        raise HTTPException(status_code=403, detail="Invalid token")
+    return resolved
+
+
+@app.post("/session/{session_id:code}/events/ticket", response_model=EventsTicket)
+async def create_events_ticket(session_id: str, x_token: Optional[str] = Header(None)):
+    """
+    Single-use, short-lived ticket for GET /events?ticket=
+    EventSource cannot set headers, the ticket keeps the token out of
+    URLs and access logs
+    503 with a session store shared by several workers (clients poll)
+    """
+    require_events()
+    await resolve_session_token(session_id, x_token)
+    ticket = generate_token()
+    await store_call(store.add_ticket, ticket, x_token, time.time() + EVENTS_TICKET_SECONDS)
+    return {"ticket": ticket, "expires_in": EVENTS_TICKET_SECONDS}
+
+
+@app.get("/session/{session_id:code}/events")
+async def session_events(
+    session_id: str,
+    request: Request,
+    ticket: Optional[str] = None,
+    x_token: Optional[str] = Header(None)
+):
+    """
+    Event stream with the session's state changes (learner + examiner)
+    Token via X-Token header or a ticket from POST /events/ticket
+    (EventSource cannot set headers)
+    Learner events: current
+    Examiner events: snapshot, questions, position, grade
+    The polling endpoints stay available as fallback
+    """
+    require_events()
+    token = x_token
+    if ticket is not None:
+        token = await store_call(store.take_ticket, ticket)
+        if token is None:
+            raise HTTPException(status_code=403, detail="Invalid or expired ticket")
+    
+    session, role = await resolve_session_token(session_id, token)
+    queue = broker.subscribe(session_id, role)
+    if role == "examiner":
+        initial = format_sse("snapshot", await store_call(SessionService.get_session_status, session))
+    else:
+        snapshot = await store_call(SessionService.get_snapshot, session)
+        initial = format_sse_json("current", snapshot.learner.decode("utf-8"))
+
+    async def stream():
+        try:
+            yield initial
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            broker.unsubscribe(session_id, role, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # ============================================================================
 # Health Check
 # ============================================================================
@@ -329,11 +839,99 @@ def root():
     """Root endpoint"""
     return {"message": "LearnTogether API is running", "cors_origins": cors_origins}
 
-@app.get("/health")
+@app.get("/health", response_model=StatusResponse)
 def health():
     """Health check endpoint"""
     return {"status": "ok"}
 
+@app.get("/stats")
+def stats():
+    """Store statistics (sessions, expiry/eviction counters), cache hit rates and job queue"""
+    return {
+        "store": store.get_stats(),
+        "jobs": jobs.get_stats(),
+        "cache": {
+            "pdf_text": pdf_text_cache.get_stats(),
+            "questions": question_cache.get_stats(),
+            "document_index": document_index_cache.get_stats(),
+            "deck_body": deck_body_cache.get_stats(),
+            "question_pool": question_pool.get_stats()
+        }
+    }
+
+
+# ============================================================================
+# Admin Endpoints (disabled unless ADMIN_TOKEN is set)
+# ============================================================================
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.get("/admin/sessions", response_model=AdminSessions, dependencies=[Depends(require_admin)])
+def admin_sessions(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    min_age: Optional[float] = Query(None, ge=0),
+    max_age: Optional[float] = Query(None, ge=0),
+    min_tokens: Optional[int] = Query(None, ge=0),
+    max_tokens: Optional[int] = Query(None, ge=0),
+    min_questions: Optional[int] = Query(None, ge=0),
+    max_questions: Optional[int] = Query(None, ge=0)
+):
+    """
+    Page of sessions, most recently used first
+    Ages in seconds since creation; totals come from the store counters
+    """
+    session_filter = SessionFilter(min_age, max_age, min_tokens, max_tokens, min_questions, max_questions)
+    # One extra entry tells whether there is a next page
+    sessions = store.list_sessions(offset, limit + 1, session_filter)
+    store_stats = store.get_stats()
+    return {
+        "total_sessions": store_stats["sessions"],
+        "total_tokens": store_stats["tokens"],
+        "offset": offset,
+        "next_offset": offset + limit if len(sessions) > limit else None,
+        "sessions": sessions[:limit]
+    }
+
+
+def collect_metrics():
+    """Copy store, cache and job queue stats into the metrics (called per scrape)"""
+    store_stats = store.get_stats()
+    metrics.sessions.set(store_stats["sessions"])
+    metrics.tokens.set(store_stats["tokens"])
+    metrics.store_bytes.set(store_stats["estimated_bytes"])
+    for name, cache in [
+        ("pdf_text", pdf_text_cache),
+        ("questions", question_cache),
+        ("document_index", document_index_cache),
+        ("deck_body", deck_body_cache),
+    ]:
+        cache_stats = cache.get_stats()
+        metrics.cache_entries.set(cache_stats["entries"], name)
+        for result in ("hits", "disk_hits", "misses"):
+            metrics.cache_lookups.set_total(cache_stats[result], name, result)
+    metrics.cache_entries.set(question_pool.get_stats()["entries"], "question_pool")
+    job_stats = jobs.get_stats()
+    metrics.jobs_queued.set(job_stats["queued"])
+    metrics.jobs_running.set(job_stats["running"])
+
+
+metrics.registry.add_collector(collect_metrics)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text exposition format"""
+    return Response(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 
 if __name__ == "__main__":
     import uvicorn
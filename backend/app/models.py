@@ -1,38 +1,509 @@
-from typing import Optional, Dict, List
-from dataclasses import dataclass, field
-from datetime import datetime
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import islice
+from typing import Callable, Optional, Dict, Iterator, List, Tuple
+
+
+# Where sessions live: "memory" (single process) or "sqlite" (shared by uvicorn --workers N)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "studyduel.db")
+
+# Sessions idle for longer than this are removed by the sweeper
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", str(24 * 3600)))
+# Optional limits, least recently used sessions are evicted first (0 = unlimited)
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "0"))
+MAX_STORE_BYTES = int(os.getenv("MAX_STORE_BYTES", "0"))
+# How often the background sweeper runs
+SWEEP_INTERVAL_SECONDS = float(os.getenv("SWEEP_INTERVAL_SECONDS", "60"))
+
+# Rough fixed cost of an empty session (objects, dicts, tokens)
+SESSION_BASE_BYTES = 1024
+# Per issued token: the token string, its entries in the session and the token index
+TOKEN_BYTES = 200
+# Per question origin: the tuple and its offsets (the filename is shared)
+ORIGIN_BYTES = 120
+
+# Mutations of one session are serialized by one of these locks. Striped by
+# session id: no lock object per session and no global lock.
+SESSION_LOCK_STRIPES = 64
+_session_locks = [threading.RLock() for _ in range(SESSION_LOCK_STRIPES)]
+
+
+def session_lock(session_id: str) -> threading.RLock:
+    """Lock guarding read-modify-write of the session's state"""
+    return _session_locks[hash(session_id) % SESSION_LOCK_STRIPES]
+
+
+# Grades are stored as one byte per question
+GRADES = ("ok", "meh", "fail")
+_GRADE_CODES = {status: code for code, status in enumerate(GRADES, start=1)}
+
+
+class PdfInfo:
+    """Metadata of an uploaded PDF"""
+    __slots__ = ("filename", "size")
+
+    def __init__(self, filename: str, size: int):
+        self.filename = filename
+        self.size = size
+
+    def to_dict(self) -> dict:
+        return {"filename": self.filename, "size": self.size}
+
+
+class SessionSnapshot:
+    """
+    Serialized read views of one session version
+    Built once when the version changes and never modified afterwards, so
+    polls answer with the same bytes without taking the session lock
+    """
+    __slots__ = ("version", "etag", "learner", "examiner", "examiner_offset")
+
+    def __init__(self, version: int, etag: str, learner: bytes, examiner: bytes, examiner_offset: int):
+        self.version = version
+        self.etag = etag
+        self.learner = learner  # GET /current
+        self.examiner = examiner  # GET /questions?offset=<examiner_offset>: status, no questions
+        self.examiner_offset = examiner_offset
+
+
+# Where a question comes from: (filename, start, end), offsets into the
+# whitespace-normalized document text, None for generic questions
+QuestionOrigin = Tuple[str, Optional[int], Optional[int]]
+
+
+def origins_to_dicts(origins: List[QuestionOrigin]) -> List[dict]:
+    return [{"document": document, "start": start, "end": end} for document, start, end in origins]
+
+
+class DeckProgress:
+    """
+    Generator of a partly generated deck, continued batch by batch
+    Per process and not persisted: without it the seeded deck is re-run
+    once and skipped forward
+    """
+    __slots__ = ("key", "iterator", "position")
+
+    def __init__(self, key: Optional[str], iterator: Iterator, position: int):
+        self.key = key  # question_cache key of the complete deck, None = compute when needed
+        self.iterator = iterator
+        self.position = position  # questions taken from it (within the generated part)
 
 
-@dataclass
 class SessionData:
-    """In-memory session storage"""
-    id: str
-    tokens: Dict[str, str] = field(default_factory=dict)  # token -> role
-    pdfs: List[Dict] = field(default_factory=list)  # [{filename, size}]
-    questions: List[str] = field(default_factory=list)
-    current_index: int = 0
-    revealed: bool = False
-    grades: Dict[int, str] = field(default_factory=dict)  # index -> "ok"|"meh"|"fail"
-    created_at: datetime = field(default_factory=datetime.now)
-
-
-class SessionStore:
-    """Global session store (in-memory)"""
+    """
+    In-memory session storage
+    Slotted, grades in a bytearray: tens of thousands of idle sessions
+    are kept in memory, so the per-object overhead matters
+    """
+    __slots__ = (
+        "id", "tokens", "examiner_token", "learner_count", "pdfs", "questions",
+        "question_origins", "question_count", "question_source", "question_seed",
+        "question_base", "question_progress", "current_index", "revealed", "grades", "created_at",
+        "version", "last_access", "size_bytes", "snapshot", "stored_version", "stored_source",
+    )
+
+    def __init__(
+        self,
+        id: str,
+        tokens: Optional[Dict[str, str]] = None,
+        pdfs: Optional[List[PdfInfo]] = None,
+        questions: Optional[List[str]] = None,
+        question_origins: Optional[List[QuestionOrigin]] = None,
+        question_count: int = 0,
+        question_source: Optional[Dict[str, str]] = None,
+        question_seed: int = 0,
+        question_base: int = 0,
+        current_index: int = 0,
+        revealed: bool = False,
+        grades: Optional[bytearray] = None,
+        created_at: Optional[float] = None,
+        version: int = 0,
+        last_access: Optional[float] = None,
+        size_bytes: int = SESSION_BASE_BYTES,
+    ):
+        self.id = id
+        self.tokens: Dict[str, str] = {}  # token -> role
+        # Kept with the tokens, sessions hold hundreds of learner tokens
+        self.examiner_token: Optional[str] = None
+        self.learner_count = 0
+        for token, role in (tokens or {}).items():
+            self.add_token(token, role)
+        self.pdfs: List[PdfInfo] = pdfs if pdfs is not None else []
+        self.questions: List[str] = questions if questions is not None else []  # generated so far, in batches
+        self.question_origins: List[QuestionOrigin] = question_origins if question_origins is not None else []
+        self.question_count = question_count  # full deck size
+        self.question_source = question_source  # {filename: text} for the remaining batches, dropped once complete
+        self.question_seed = question_seed
+        self.question_base = question_base  # questions before the part of the deck question_source generates
+        self.question_progress: Optional[DeckProgress] = None  # where question_source's deck stands
+        self.current_index = current_index
+        self.revealed = revealed
+        self.grades = grades if grades is not None else bytearray()  # index -> grade code, 0 = not graded
+        self.created_at = created_at if created_at is not None else time.time()
+        self.version = version  # bumped by every mutation, used for ETag / long-polling
+        self.last_access = last_access if last_access is not None else time.time()
+        self.size_bytes = size_bytes  # estimate, see SessionStore.update_size
+        self.snapshot: Optional[SessionSnapshot] = None  # read views of the current version
+        # Database stores: version and question_source of the row this copy was
+        # read from / last written to (optimistic concurrency, per copy)
+        self.stored_version = version
+        self.stored_source = question_source
+
+    def add_token(self, token: str, role: str):
+        """Register an issued token (called by the store)"""
+        self.tokens[token] = role
+        if role == "examiner":
+            self.examiner_token = token
+        else:
+            self.learner_count += 1
+
+    def remove_token(self, token: str):
+        """Undo add_token (the store could not persist it)"""
+        role = self.tokens.pop(token, None)
+        if role == "examiner":
+            self.examiner_token = None
+        elif role is not None:
+            self.learner_count -= 1
+
+    def set_grade(self, index: int, status: str):
+        if index >= len(self.grades):
+            self.grades.extend(bytes(index + 1 - len(self.grades)))
+        self.grades[index] = _GRADE_CODES[status]
+
+    def grades_dict(self) -> Dict[int, str]:
+        """{index: "ok"|"meh"|"fail"} for graded questions"""
+        return {index: GRADES[code - 1] for index, code in enumerate(self.grades) if code}
+
+
+def session_etag(session: SessionData) -> str:
+    """
+    Entity tag of the session's current version (polling endpoints)
+    Weak: the compression middleware serves gzip and identity bodies under it
+    """
+    return f'W/"{session.id}-{session.version}"'
+
+
+class SessionConflictError(Exception):
+    """The session was modified by another worker since it was loaded"""
+
+
+class SessionExistsError(Exception):
+    """A session with this id exists already (session code collision)"""
+
+
+class SessionFullError(Exception):
+    """No more learners can join the session (MAX_LEARNERS_PER_SESSION)"""
+
+
+class ExaminerExistsError(Exception):
+    """The session has an examiner; its token is only given to whoever created the session"""
+
+
+@dataclass
+class SessionFilter:
+    """Admin listing filter, None = no bound"""
+    min_age: Optional[float] = None  # seconds since creation
+    max_age: Optional[float] = None
+    min_tokens: Optional[int] = None  # issued tokens
+    max_tokens: Optional[int] = None
+    min_questions: Optional[int] = None  # deck size
+    max_questions: Optional[int] = None
+
+    def matches(self, session: SessionData, now: float) -> bool:
+        return (
+            _within(now - session.created_at, self.min_age, self.max_age)
+            and _within(len(session.tokens), self.min_tokens, self.max_tokens)
+            and _within(session.question_count, self.min_questions, self.max_questions)
+        )
+
+
+def _within(value: float, low: Optional[float], high: Optional[float]) -> bool:
+    return (low is None or value >= low) and (high is None or value <= high)
+
+
+def session_summary(session: SessionData) -> dict:
+    """Admin listing entry, no questions or tokens"""
+    return {
+        "id": session.id,
+        "created_at": session.created_at,
+        "last_access": session.last_access,
+        "roles": (["examiner"] if session.examiner_token else []) + (["learner"] if session.learner_count else []),
+        "question_count": session.question_count,
+        "current_index": session.current_index,
+        "size_bytes": session.size_bytes,
+    }
+
+
+def estimate_session_bytes(session: SessionData) -> int:
+    """Cheap estimate of the memory held by a session"""
+    size = SESSION_BASE_BYTES
+    size += sum(len(q) + 64 for q in session.questions)
+    size += ORIGIN_BYTES * len(session.question_origins)
+    size += sum(len(text) for text in (session.question_source or {}).values())
+    size += sum(len(pdf.filename) + 64 for pdf in session.pdfs)
+    size += len(session.grades)
+    size += TOKEN_BYTES * max(0, len(session.tokens) - 2)  # examiner + one learner are in the base
+    return size
+
+
+class SessionStore(ABC):
+    """
+    Session store interface
+    Implementations: InMemorySessionStore (default),
+    SQLiteSessionStore (SESSION_BACKEND=sqlite, shared by multiple workers)
+    """
+
+    # Calls may block on I/O (database locks): async endpoints then run them in the threadpool
+    blocking_io = False
+    # Other worker processes change the sessions too: in-process push
+    # (event streams) would miss their updates
+    shared = False
+
+    def __init__(self):
+        self._removal_listeners: List[Callable[[str], None]] = []
+
+    @abstractmethod
+    def create_session(self, session_id: str) -> SessionData:
+        """Raises SessionExistsError if the id is taken, never overwrites"""
+
+    @abstractmethod
+    def get_session(self, session_id: str) -> Optional[SessionData]:
+        ...
+
+    @abstractmethod
+    def save(self, session: SessionData):
+        """Persist a session after it was mutated"""
+
+    @abstractmethod
+    def add_token(self, session: SessionData, token: str, role: str):
+        """Register a token for a role in the session"""
+
+    @abstractmethod
+    def resolve_token(self, token: str) -> Optional[Tuple[SessionData, str]]:
+        """Return (session, role) for a token and mark the session as used, or None if unknown"""
+
+    @abstractmethod
+    def add_ticket(self, ticket: str, token: str, expires: float):
+        """Register a single-use stand-in for a token, valid until `expires` (event streams)"""
+
+    @abstractmethod
+    def take_ticket(self, ticket: str) -> Optional[str]:
+        """Remove a ticket and return its token, None if unknown, used or expired"""
+
+    @abstractmethod
+    def update_size(self, session: SessionData):
+        """Re-estimate a session's size after its content changed"""
+
+    @abstractmethod
+    def delete_session(self, session_id: str):
+        ...
+
+    @abstractmethod
+    def list_sessions(self, offset: int, limit: int, filter: SessionFilter) -> List[dict]:
+        """
+        Summaries (session_summary) of matching sessions, most recently
+        used first; reads at most offset + limit matches
+        """
+
+    @abstractmethod
+    def expire_idle(self, now: Optional[float] = None) -> List[str]:
+        """
+        Remove sessions idle for longer than SESSION_TTL_SECONDS
+        Returns: ids of the removed sessions
+        """
+
+    @abstractmethod
+    def enforce_limits(self) -> List[str]:
+        """
+        Evict least recently used sessions until MAX_SESSIONS and
+        MAX_STORE_BYTES are respected
+        Returns: ids of the evicted sessions
+        """
+
+    @abstractmethod
+    def get_stats(self) -> dict:
+        ...
+
+    def save_job(self, session_id: str, job_id: str, data: str, finished_at: Optional[float]):
+        """Persist a job's status (JSON) so every worker can answer for it (shared stores only)"""
+
+    def get_job(self, session_id: str, job_id: str) -> Optional[dict]:
+        """Status of a job saved by any worker, None if unknown or not a shared store"""
+        return None
+
+    def expire_jobs(self, before: float):
+        """Drop saved jobs that finished before `before`"""
+
+    def sweep(self) -> List[str]:
+        """Expire idle sessions and enforce limits (called periodically)"""
+        return self.expire_idle() + self.enforce_limits()
+
+    def add_removal_listener(self, callback: Callable[[str], None]):
+        """Call `callback(session_id)` whenever a session is deleted, expired or evicted"""
+        self._removal_listeners.append(callback)
+
+    def _notify_removed(self, session_ids: List[str]):
+        for session_id in session_ids:
+            for callback in self._removal_listeners:
+                callback(session_id)
+
+
+class InMemorySessionStore(SessionStore):
+    """Session store in process memory, LRU-ordered by last access"""
     def __init__(self):
-        self.sessions: Dict[str, SessionData] = {}
+        super().__init__()
+        # Least recently used first
+        self.sessions: "OrderedDict[str, SessionData]" = OrderedDict()
+        # Global token index: token -> session, one lookup per request
+        self.tokens: Dict[str, SessionData] = {}
+        # Event stream tickets: ticket -> (token, expires), oldest first
+        self.tickets: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {"expired": 0, "evicted": 0}
+        self._lock = threading.Lock()
 
     def create_session(self, session_id: str) -> SessionData:
         session = SessionData(id=session_id)
-        self.sessions[session_id] = session
+        with self._lock:
+            if session_id in self.sessions:
+                raise SessionExistsError(session_id)
+            self.sessions[session_id] = session
+            self.total_bytes += session.size_bytes
+        self.enforce_limits()
         return session
 
     def get_session(self, session_id: str) -> Optional[SessionData]:
         return self.sessions.get(session_id)
 
+    def save(self, session: SessionData):
+        # Sessions are live objects, nothing to persist
+        pass
+
+    def add_token(self, session: SessionData, token: str, role: str):
+        with self._lock:
+            session.add_token(token, role)
+            self.tokens[token] = session
+
+    def resolve_token(self, token: str) -> Optional[Tuple[SessionData, str]]:
+        session = self.tokens.get(token)
+        if session is None:
+            return None
+        self.touch(session)
+        return session, session.tokens[token]
+
+    def add_ticket(self, ticket: str, token: str, expires: float):
+        with self._lock:
+            self.tickets[ticket] = (token, expires)
+
+    def take_ticket(self, ticket: str) -> Optional[str]:
+        with self._lock:
+            entry = self.tickets.pop(ticket, None)
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry[0]
+
+    def touch(self, session: SessionData):
+        """Mark the session as recently used"""
+        session.last_access = time.time()
+        with self._lock:
+            if session.id in self.sessions:
+                self.sessions.move_to_end(session.id)
+
+    def update_size(self, session: SessionData):
+        size = estimate_session_bytes(session)
+        with self._lock:
+            if session.id in self.sessions:
+                self.total_bytes += size - session.size_bytes
+            session.size_bytes = size
+        if MAX_STORE_BYTES:
+            self.enforce_limits()
+
     def delete_session(self, session_id: str):
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+        with self._lock:
+            removed = self._remove(session_id)
+        if removed is not None:
+            self._notify_removed([session_id])
+
+    def list_sessions(self, offset: int, limit: int, filter: SessionFilter) -> List[dict]:
+        now = time.time()
+        # Copy the LRU order under the lock (a plain C-level list copy) and
+        # filter outside it, so touch() on the event loop never waits for a scan
+        with self._lock:
+            sessions = list(self.sessions.values())
+        matches = (s for s in reversed(sessions) if filter.matches(s, now))
+        return [session_summary(s) for s in islice(matches, offset, offset + limit)]
+
+    def _remove(self, session_id: str) -> Optional[SessionData]:
+        # Caller holds self._lock
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return None
+        for token in session.tokens:
+            self.tokens.pop(token, None)
+        self.total_bytes -= session.size_bytes
+        return session
+
+    def expire_idle(self, now: Optional[float] = None) -> List[str]:
+        cutoff = (now or time.time()) - SESSION_TTL_SECONDS
+        removed = []
+        with self._lock:
+            # LRU order: stop at the first session that is still fresh
+            while self.sessions:
+                session = next(iter(self.sessions.values()))
+                if session.last_access >= cutoff:
+                    break
+                self._remove(session.id)
+                removed.append(session.id)
+            self.stats["expired"] += len(removed)
+            # Unused tickets, issued with the same lifetime so in expiry order
+            now = now or time.time()
+            while self.tickets and next(iter(self.tickets.values()))[1] < now:
+                self.tickets.popitem(last=False)
+        self._notify_removed(removed)
+        return removed
+
+    def enforce_limits(self) -> List[str]:
+        removed = []
+        with self._lock:
+            while self.sessions and (
+                (MAX_SESSIONS and len(self.sessions) > MAX_SESSIONS)
+                or (MAX_STORE_BYTES and self.total_bytes > MAX_STORE_BYTES)
+            ):
+                session_id = next(iter(self.sessions))
+                self._remove(session_id)
+                removed.append(session_id)
+            self.stats["evicted"] += len(removed)
+        self._notify_removed(removed)
+        return removed
+
+    def get_stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "sessions": len(self.sessions),
+            "tokens": len(self.tokens),
+            "estimated_bytes": self.total_bytes,
+            "expired": self.stats["expired"],
+            "evicted": self.stats["evicted"],
+            "ttl_seconds": SESSION_TTL_SECONDS,
+            "max_sessions": MAX_SESSIONS,
+            "max_bytes": MAX_STORE_BYTES,
+        }
+
+
+def create_store() -> SessionStore:
+    """Instantiate the store selected by SESSION_BACKEND"""
+    if SESSION_BACKEND == "sqlite":
+        from app.sqlite_store import SQLiteSessionStore
+        return SQLiteSessionStore(SESSION_DB_PATH)
+    if SESSION_BACKEND != "memory":
+        raise ValueError(f"Unknown SESSION_BACKEND: {SESSION_BACKEND}")
+    return InMemorySessionStore()
 
 
 # Global store
-store = SessionStore()
+store = create_store()
@@ -0,0 +1,145 @@
+from typing import Dict, List, Literal, Optional
+
+from pydantic import BaseModel, Field, StrictInt
+
+from app.utils import DEFAULT_NUM_QUESTIONS, MAX_NUM_QUESTIONS
+
+Role = Literal["learner", "examiner"]
+Grade = Literal["ok", "meh", "fail"]
+
+
+# ============================================================================
+# Requests
+# ============================================================================
+
+class JoinRequest(BaseModel):
+    role: Role
+
+
+class GenerateRequest(BaseModel):
+    pdf_texts: Dict[str, str] = Field(min_length=1)  # {filename: text}
+    num_questions: StrictInt = Field(DEFAULT_NUM_QUESTIONS, ge=1, le=MAX_NUM_QUESTIONS)
+    append: bool = False  # add behind the current deck instead of replacing it
+
+
+class GradeRequest(BaseModel):
+    index: StrictInt = Field(ge=0)
+    status: Grade
+
+
+# ============================================================================
+# Responses
+# ============================================================================
+
+class StatusResponse(BaseModel):
+    status: str
+
+
+class SessionCreated(BaseModel):
+    session_id: str
+    examiner_token: str
+
+
+class JoinResponse(BaseModel):
+    token: str
+    role: Role
+
+
+class EventsTicket(BaseModel):
+    ticket: str
+    expires_in: int  # seconds
+
+
+class UploadAccepted(BaseModel):
+    status: Literal["accepted"]
+    job_id: str
+    uploaded: int
+    files: List[str]
+
+
+class JobFile(BaseModel):
+    filename: str
+    size: int
+    status: str  # queued | extracting | indexing | done | failed
+    characters: int
+    error: Optional[str] = None
+    timings: Dict[str, float] = {}  # seconds per stage: read, extract, index
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str  # queued | running | done | failed
+    stage: str  # queued | extracting | generating | done
+    files: List[JobFile]
+    files_done: int
+    question_count: int
+    error: Optional[str]
+    created_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
+
+
+class GenerateResponse(BaseModel):
+    status: Literal["success"]
+    question_count: int
+
+
+class LearnerCurrent(BaseModel):
+    status: Literal["locked", "revealed", "completed"]
+    index: int
+    total: int
+    question: Optional[str] = None  # only once revealed
+
+
+class QuestionOrigin(BaseModel):
+    document: str  # filename
+    start: Optional[int]  # character offsets into the normalized document text,
+    end: Optional[int]  # null for generic questions
+
+
+class PdfMetadata(BaseModel):
+    filename: str
+    size: int
+
+
+class SessionStatus(BaseModel):
+    session_id: str
+    questions: List[str]
+    origins: List[QuestionOrigin]  # one per question
+    offset: int
+    question_count: int
+    deck_id: str
+    current_index: int
+    revealed: bool
+    grades: Dict[int, Grade]
+    pdfs: List[PdfMetadata]
+
+
+class Deck(BaseModel):
+    deck_id: str
+    question_count: int
+    questions: List[str]  # generated so far
+    origins: List[QuestionOrigin]
+
+
+class JumpResponse(BaseModel):
+    status: Literal["jumped"]
+    index: int
+
+
+class SessionSummary(BaseModel):
+    id: str
+    created_at: float
+    last_access: float
+    roles: List[str]
+    question_count: int
+    current_index: int
+    size_bytes: int
+
+
+class AdminSessions(BaseModel):
+    total_sessions: int
+    total_tokens: int
+    offset: int
+    next_offset: Optional[int]
+    sessions: List[SessionSummary]
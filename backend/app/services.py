@@ -1,12 +1,32 @@
-from typing import Optional, Tuple
-from app.models import SessionData, store
+import logging
+import os
+import time
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+from app.models import (
+    GRADES, DeckProgress, ExaminerExistsError, PdfInfo, QuestionOrigin, SessionData, SessionExistsError, SessionFullError,
+    SessionSnapshot, origins_to_dicts, session_etag, session_lock, store
+)
+from app.events import broker, format_sse_json
+from app.metrics import question_generation_seconds
+from app.cache import content_hash, deck_body_cache, question_cache, question_pool
+from app.compression import EncodedBody
+from app.schemas import Deck, LearnerCurrent, SessionStatus
 from app.utils import (
     generate_session_code, 
     generate_token, 
-    extract_text_from_pdf,
-    generate_questions_from_text
+    iter_questions_from_documents,
+    DEFAULT_NUM_QUESTIONS,
+    QUESTION_BATCH_SIZE
 )
 
+logger = logging.getLogger(__name__)
+
+# New codes tried before create_session gives up
+SESSION_CODE_ATTEMPTS = 16
+# Learners (tokens) per session, 0 = unlimited
+MAX_LEARNERS_PER_SESSION = int(os.getenv("MAX_LEARNERS_PER_SESSION", "500"))
+
 
 class SessionService:
     """Service for session management"""
@@ -17,19 +37,32 @@ class SessionService:
         Create a new session
         Returns: (session_id, examiner_token)
         """
-        session_code = generate_session_code()
-        session = store.create_session(session_code)
+        # 40-bit random codes rarely collide, but the store never overwrites
+        for attempt in range(SESSION_CODE_ATTEMPTS):
+            session_code = generate_session_code()
+            try:
+                session = store.create_session(session_code)
+                break
+            except SessionExistsError:
+                logger.warning("Session code collision (attempt %d)", attempt + 1)
+        else:
+            raise SessionExistsError(session_code)
         
         examiner_token = generate_token()
-        session.tokens[examiner_token] = "examiner"
+        store.add_token(session, examiner_token, "examiner")
         
         return session_code, examiner_token
 
     @staticmethod
-    def join_session(session_id: str, role: str) -> Optional[str]:
+    def join_session(session_id: str, role: str, token: Optional[str] = None) -> Optional[str]:
         """
         Join an existing session
+        Every learner gets a token of their own
+        `token`: issued to the caller before (page reload), it is kept and no
+        new learner slot is used
         Returns: token for the role, or None if session doesn't exist
+        Raises: SessionFullError if MAX_LEARNERS_PER_SESSION learners joined already,
+        ExaminerExistsError for an examiner join without the examiner token
         """
         session = store.get_session(session_id)
         if not session:
@@ -38,174 +71,418 @@ class SessionService:
         if role not in ["learner", "examiner"]:
             return None
         
-        # Check if role already exists
-        for token, existing_role in session.tokens.items():
-            if existing_role == role:
-                # Role already exists, return that token
+        if token is not None:
+            resolved = store.resolve_token(token)
+            if resolved is not None and resolved[0].id == session.id and resolved[1] == role:
                 return token
         
-        # Create new token for this role
-        token = generate_token()
-        session.tokens[token] = role
-        return token
+        with session_lock(session.id):
+            if role == "examiner":
+                # Knowing the session code must not be enough to take over grading
+                if session.examiner_token is not None:
+                    raise ExaminerExistsError(session.id)
+            elif MAX_LEARNERS_PER_SESSION and session.learner_count >= MAX_LEARNERS_PER_SESSION:
+                raise SessionFullError(session.id)
+            
+            # Create new token for this role. Tokens are part of no view: the
+            # version stays, so a class joining does not wake every poller
+            token = generate_token()
+            store.add_token(session, token, role)
+            store.update_size(session)
+            return token
 
     @staticmethod
-    def verify_token(session_id: str, token: str, required_role: str) -> bool:
+    def verify_token(session_id: str, token: str, required_role: str) -> Optional[SessionData]:
         """
         Verify if token has the required role in the session
+        Returns: the session, or None if the token is not valid for it
         """
-        session = store.get_session(session_id)
-        if not session:
-            print(f"[AUTH ERROR] Session {session_id} not found")
-            print(f"[AUTH ERROR] Available sessions: {list(store.sessions.keys())}")
-            return False
-        
-        if not token:
-            print(f"[AUTH ERROR] Token is empty or None")
-            return False
-        
-        role = session.tokens.get(token)
-        print(f"[AUTH] Session {session_id} - Token {token[:8] if len(token) > 8 else token}... has role: {role}, required: {required_role}")
-        print(f"[AUTH] All tokens in session: {list(session.tokens.values())}")
-        print(f"[AUTH] Total tokens in session: {len(session.tokens)}")
+        resolved = store.resolve_token(token)
+        if resolved is None:
+            return None
         
-        if role != required_role:
-            print(f"[AUTH ERROR] Role mismatch: got '{role}', required '{required_role}'")
-            return False
+        session, role = resolved
+        if session.id != session_id or role != required_role:
+            logger.debug("Role mismatch in session %s: got %r, required %r", session_id, role, required_role)
+            return None
         
-        return True
+        return session
 
     @staticmethod
-    def add_pdf_metadata(session_id: str, filename: str, size: int) -> bool:
+    def add_pdf_metadata(session: SessionData, filename: str, size: int) -> bool:
         """Store PDF metadata"""
-        session = store.get_session(session_id)
-        if not session:
-            return False
-        
-        session.pdfs.append({
-            "filename": filename,
-            "size": size
-        })
+        with session_lock(session.id):
+            session.pdfs.append(PdfInfo(filename, size))
+            store.update_size(session)
+            SessionService._bump_version(session)
         return True
 
     @staticmethod
     def generate_questions(
-        session_id: str, 
-        pdf_texts: dict  # {filename: text}
+        session: SessionData, 
+        pdf_texts: dict,  # {filename: text}
+        num_questions: int = DEFAULT_NUM_QUESTIONS,
+        append: bool = False
     ) -> bool:
         """
         Generate questions from PDF texts and store them
-        Returns: success
+        Each document contributes its own questions (merged, not re-joined)
+        With `append` they are added behind the current deck instead: only the
+        new documents are scanned, position and grades are kept
+        Only the first batch is generated now, the rest as the examiner advances
+        Returns: success (False if the deck was replaced while appending)
         """
-        session = store.get_session(session_id)
-        if not session:
-            return False
+        # Documents without text would only add placeholder questions
+        documents = {name: text for name, text in pdf_texts.items() if text.strip()} or dict(pdf_texts)
         
-        # Combine all texts
-        combined_text = "\n\n".join(pdf_texts.values())
+        # Same material + count -> same (seeded) deck, complete decks are cached
+        key = SessionService._deck_key(num_questions, documents)
+        base = 0
+        if append:
+            # The part before the new questions must be complete, its source is dropped then
+            SessionService._ensure_questions(session, session.question_count - 1)
+            with session_lock(session.id):
+                base = session.question_count
+                previous_seed = session.question_seed
+            if base:
+                # Seed (and deck id) depend on the deck it extends
+                key = content_hash(f"{previous_seed:x}\0{key}")
+        seed = int(key[:16], 16)
         
-        # Generate questions
-        questions = generate_questions_from_text(combined_text, num_questions=10)
-        session.questions = questions
-        session.current_index = 0
-        session.revealed = False
+        cached = question_cache.get(key) if not base else None
+        source = None
+        progress = None
+        if isinstance(cached, dict):
+            names = list(documents)
+            questions = cached["questions"]
+            origins = [(names[document], start, end) for document, start, end in cached["origins"]]
+        else:
+            # First batch is generated before taking the lock, readers are not blocked
+            source = documents
+            questions, origins, deck = SessionService._generate_slice(
+                source, num_questions, seed, 0, min(num_questions, QUESTION_BATCH_SIZE)
+            )
+            progress = DeckProgress(None if base else key, deck, len(questions))
         
+        # Swap in the new deck (or part) at once
+        with session_lock(session.id):
+            if base:
+                if session.question_seed != previous_seed or len(session.questions) != base:
+                    logger.warning("Deck of session %s changed while appending questions", session.id)
+                    return False
+                session.questions.extend(question_pool.intern_all(questions))
+                session.question_origins.extend(origins)
+            else:
+                session.questions = question_pool.intern_all(questions)
+                session.question_origins = origins
+                session.current_index = 0
+                session.revealed = False
+            session.question_count = base + num_questions
+            session.question_seed = seed
+            session.question_source = source
+            session.question_base = base
+            session.question_progress = progress
+            SessionService._complete_deck(session)
+            store.update_size(session)
+            SessionService._bump_version(session)
+            
+            broker.publish(session.id, "examiner", "questions", {
+                "questions": session.questions,
+                "origins": origins_to_dicts(session.question_origins),
+                "question_count": session.question_count,
+                "deck_id": SessionService._deck_id(session),
+                "current_index": session.current_index,
+                "revealed": session.revealed,
+                "grades": session.grades_dict()
+            })
+            SessionService._publish_learner_view(session)
         return True
 
     @staticmethod
-    def reveal_current_question(session_id: str) -> bool:
+    def reveal_current_question(session: SessionData) -> bool:
         """Set revealed flag to true"""
-        session = store.get_session(session_id)
-        if not session:
-            return False
-        
-        session.revealed = True
+        with session_lock(session.id):
+            session.revealed = True
+            SessionService._bump_version(session)
+            SessionService._publish_position(session)
         return True
 
     @staticmethod
-    def next_question(session_id: str) -> bool:
+    def next_question(session: SessionData) -> bool:
         """Move to next question"""
-        session = store.get_session(session_id)
-        if not session:
-            return False
+        # Prepare the next question and the one after it outside the lock
+        SessionService._ensure_questions(session, session.current_index + 2)
         
-        if session.current_index < len(session.questions) - 1:
+        with session_lock(session.id):
+            if session.current_index >= session.question_count - 1:
+                return False  # No more questions
+            
             session.current_index += 1
             session.revealed = False
-            return True
-        
-        return False  # No more questions
+            # No-op unless concurrent calls advanced past the prepared batch
+            SessionService._ensure_questions(session, session.current_index + 1)
+            SessionService._bump_version(session)
+            SessionService._publish_position(session)
+        return True
 
     @staticmethod
-    def jump_to_question(session_id: str, index: int) -> bool:
+    def jump_to_question(session: SessionData, index: int) -> bool:
         """Jump to a specific question by index"""
-        session = store.get_session(session_id)
-        if not session:
+        if index < 0 or index >= session.question_count:
             return False
         
-        if index < 0 or index >= len(session.questions):
-            return False
+        SessionService._ensure_questions(session, index + 1)
         
-        session.current_index = index
-        session.revealed = False
+        with session_lock(session.id):
+            # The deck may have been regenerated meanwhile
+            if index >= session.question_count:
+                return False
+            
+            session.current_index = index
+            session.revealed = False
+            SessionService._ensure_questions(session, index + 1)
+            SessionService._bump_version(session)
+            SessionService._publish_position(session)
         return True
 
     @staticmethod
-    def grade_question(session_id: str, index: int, status: str) -> bool:
+    def grade_question(session: SessionData, index: int, status: str) -> bool:
         """Grade a question"""
-        session = store.get_session(session_id)
-        if not session:
-            return False
-        
-        if status not in ["ok", "meh", "fail"]:
+        if status not in GRADES or index < 0:
             return False
         
-        session.grades[index] = status
+        with session_lock(session.id):
+            if index >= session.question_count:
+                return False
+            session.set_grade(index, status)
+            SessionService._bump_version(session)
+            broker.publish(session.id, "examiner", "grade", {"index": index, "status": status})
         return True
 
     @staticmethod
-    def get_session_status(session_id: str, role: str):
-        """Get full session status (examiner only)"""
-        session = store.get_session(session_id)
-        if not session:
-            return None
-        
-        if role != "examiner":
-            return None
-        
-        return {
-            "session_id": session.id,
-            "questions": session.questions,
-            "current_index": session.current_index,
-            "revealed": session.revealed,
-            "grades": session.grades,
-            "pdfs": session.pdfs
-        }
+    def get_session_status(session: SessionData, offset: int = 0, limit: Optional[int] = None) -> dict:
+        """
+        Get full session status (examiner only)
+        `offset`/`limit` select a page of the questions generated so far
+        """
+        end = None if limit is None else offset + limit
+        # Consistent snapshot, copies so serialization never races a mutation
+        with session_lock(session.id):
+            return {
+                "session_id": session.id,
+                "questions": session.questions[offset:end],
+                "origins": origins_to_dicts(session.question_origins[offset:end]),
+                "offset": offset,
+                "question_count": session.question_count,
+                "deck_id": SessionService._deck_id(session),
+                "current_index": session.current_index,
+                "revealed": session.revealed,
+                "grades": session.grades_dict(),
+                "pdfs": [pdf.to_dict() for pdf in session.pdfs]
+            }
 
     @staticmethod
-    def get_learner_current(session_id: str):
-        """Get current question for learner"""
-        session = store.get_session(session_id)
-        if not session:
-            return None
-        
-        if not session.revealed:
+    def get_deck(session: SessionData) -> Tuple[str, EncodedBody]:
+        """
+        Questions generated so far as an encoded JSON body, with its entity tag
+        The seeded deck never changes for the same deck id and length, so the
+        body is encoded and compressed once and shared by all sessions with it.
+        The origins name the session's files: the same material uploaded under
+        other filenames has the same deck id, so the names are part of the key
+        """
+        with session_lock(session.id):
+            deck_id = SessionService._deck_id(session)
+            names = dict.fromkeys(document for document, _, _ in session.question_origins)
+            key = f"{deck_id}-{len(session.questions)}-{content_hash(chr(0).join(names))[:16]}"
+            body = deck_body_cache.get(key)
+            if body is None:
+                questions = list(session.questions)
+                origins = origins_to_dicts(session.question_origins)
+                question_count = session.question_count
+        if body is None:
+            deck = Deck(deck_id=deck_id, question_count=question_count, questions=questions, origins=origins)
+            body = EncodedBody(deck.model_dump_json().encode("utf-8"))
+            deck_body_cache.set(key, body)
+        return key, body
+
+    @staticmethod
+    def get_learner_current(session: SessionData) -> dict:
+        """Get current question for learner (never the full question list)"""
+        with session_lock(session.id):
+            if not session.revealed:
+                return {
+                    "status": "locked",
+                    "index": session.current_index,
+                    "total": session.question_count
+                }
+            
+            if session.current_index < len(session.questions):
+                return {
+                    "status": "revealed",
+                    "index": session.current_index,
+                    "question": session.questions[session.current_index],
+                    "total": session.question_count
+                }
+            
             return {
-                "status": "locked",
+                "status": "completed",
                 "index": session.current_index,
-                "total": len(session.questions)
+                "total": session.question_count
             }
+
+    @staticmethod
+    def get_snapshot(session: SessionData) -> SessionSnapshot:
+        """
+        Serialized learner and examiner views of the session's current version
+        Built by every mutation, so a poll only picks up the finished bytes;
+        the same snapshot answers all learners of the session
+        """
+        snapshot = session.snapshot
+        if snapshot is not None and snapshot.version == session.version:
+            return snapshot
+        # Loaded from the store by another worker's change, or not built yet
+        with session_lock(session.id):
+            snapshot = session.snapshot
+            if snapshot is None or snapshot.version != session.version:
+                snapshot = SessionService._build_snapshot(session)
+            return snapshot
+
+    @staticmethod
+    def _build_snapshot(session: SessionData) -> SessionSnapshot:
+        """Serialize the read views; caller holds the session lock"""
+        learner = LearnerCurrent(**SessionService.get_learner_current(session))
+        # Questions are left out: the examiner polls for new ones from the
+        # count it has, and a full copy per session would double their memory
+        offset = len(session.questions)
+        examiner = SessionStatus(**SessionService.get_session_status(session, offset))
+        snapshot = session.snapshot = SessionSnapshot(
+            session.version,
+            session_etag(session),
+            learner.model_dump_json(exclude_none=True).encode("utf-8"),
+            examiner.model_dump_json().encode("utf-8"),
+            offset,
+        )
+        return snapshot
+
+    @staticmethod
+    def _deck_id(session: SessionData) -> str:
+        """Identifies the generated deck, changes when questions are regenerated"""
+        return format(session.question_seed, "x")
+
+    @staticmethod
+    def _ensure_questions(session: SessionData, index: int):
+        """
+        Generate the next batch(es) until question `index` exists
+        Generation runs without the session lock unless the caller holds it
+        """
+        with session_lock(session.id):
+            source = session.question_source
+            start = len(session.questions)
+            if index < start or source is None:
+                return
+            count = session.question_count
+            seed = session.question_seed
+            base = session.question_base
+            # Taken while generating: a concurrent call must not advance it as well
+            progress, session.question_progress = session.question_progress, None
         
-        if session.current_index < len(session.questions):
-            return {
-                "status": "revealed",
-                "index": session.current_index,
-                "question": session.questions[session.current_index],
-                "total": len(session.questions)
-            }
+        end = min(count, max(index + 1, start + QUESTION_BATCH_SIZE))
+        batch, origins, deck = SessionService._generate_slice(
+            source, count - base, seed, start - base, end - base, progress
+        )
         
-        return {
-            "status": "completed",
-            "index": session.current_index,
-            "total": len(session.questions)
-        }
+        with session_lock(session.id):
+            # Regenerated or extended by a concurrent call in the meantime
+            if session.question_source is not source or len(session.questions) != start:
+                return
+            session.questions.extend(question_pool.intern_all(batch))
+            session.question_origins.extend(origins)
+            session.question_progress = DeckProgress(progress.key if progress else None, deck, start - base + len(batch))
+            logger.debug("Generated questions %d-%d of %d for session %s", start, end - 1, count, session.id)
+            SessionService._complete_deck(session)
+            store.update_size(session)
+            # A change like any other: saved for the other workers, new
+            # snapshot and ETag, so pollers see the questions too
+            SessionService._bump_version(session)
+            broker.publish(session.id, "examiner", "batch", {
+                "offset": start,
+                "questions": batch,
+                "origins": origins_to_dicts(origins)
+            })
+
+    @staticmethod
+    def _deck_key(num_questions: int, documents: Dict[str, str]) -> str:
+        """Cache key (and seed) of the deck: question count + content of the documents"""
+        hashes = "\0".join(content_hash(text) for text in documents.values())
+        return content_hash(f"{num_questions}\0{hashes}")
+
+    @staticmethod
+    def _generate_slice(
+        source: Dict[str, str], count: int, seed: int, start: int, end: int,
+        progress: Optional[DeckProgress] = None
+    ) -> Tuple[List[str], List[QuestionOrigin], Iterator]:
+        """
+        Questions start..end-1 of the deck and where they come from
+        The generator in `progress` is continued if it stands at `start`;
+        otherwise the seeded deck is re-run (same questions) and skipped forward
+        Returns: (questions, origins, generator standing at `end`)
+        """
+        started = time.perf_counter()
+        names = list(source)
+        if progress is not None and progress.position == start:
+            deck, skip = progress.iterator, 0
+        else:
+            deck, skip = iter_questions_from_documents(list(source.values()), count, seed), start
+        questions = []
+        origins = []
+        for document, question, offset, offset_end in islice(deck, skip, skip + end - start):
+            questions.append(question)
+            origins.append((names[document], offset, offset_end))
+        question_generation_seconds.observe(time.perf_counter() - started)
+        return questions, origins, deck
+
+    @staticmethod
+    def _complete_deck(session: SessionData):
+        """
+        Once all questions exist, cache the deck and drop the source text
+        Called under the session lock: the disk tier is written in the background
+        """
+        if session.question_source is None or len(session.questions) < session.question_count:
+            return
+        # Appended parts are not cached: their seed depends on the deck they extend
+        if not session.question_base:
+            progress = session.question_progress
+            key = progress.key if progress is not None and progress.key else SessionService._deck_key(
+                session.question_count, session.question_source
+            )
+            names = {name: document for document, name in enumerate(session.question_source)}
+            question_cache.set(key, {
+                "questions": list(session.questions),
+                "origins": [(names[name], start, end) for name, start, end in session.question_origins],
+            }, background=True)
+        session.question_source = None
+        session.question_progress = None
+
+    @staticmethod
+    def _bump_version(session: SessionData):
+        """Mark the session as changed (ETag / long-poll), persist it and rebuild its snapshot"""
+        session.version += 1
+        store.save(session)
+        SessionService._build_snapshot(session)
+        broker.notify_changed(session.id)
+
+    @staticmethod
+    def _publish_position(session: SessionData):
+        """Push the new current_index / revealed state to subscribers"""
+        broker.publish(session.id, "examiner", "position", {
+            "current_index": session.current_index,
+            "revealed": session.revealed
+        })
+        SessionService._publish_learner_view(session)
+
+    @staticmethod
+    def _publish_learner_view(session: SessionData):
+        # One message for all learners of the session, from the bytes their polls get
+        if broker.has_subscribers(session.id):
+            learner = SessionService.get_snapshot(session).learner
+            broker.publish_message(session.id, "learner", format_sse_json("current", learner.decode("utf-8")))
@@ -0,0 +1,524 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.models import (
+    PdfInfo,
+    SessionData,
+    SessionStore,
+    SessionConflictError,
+    SessionExistsError,
+    SessionFilter,
+    estimate_session_bytes,
+    SESSION_TTL_SECONDS,
+    MAX_SESSIONS,
+    MAX_STORE_BYTES,
+)
+from app.cache import question_pool
+
+logger = logging.getLogger(__name__)
+
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+# Hot sessions kept deserialized in this worker (validated by version on every read)
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "256"))
+# last_access is written at most this often per session
+TOUCH_INTERVAL_SECONDS = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access);
+CREATE TABLE IF NOT EXISTS tokens (
+    token TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    role TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tokens_session ON tokens (session_id);
+-- Material for not yet generated questions, large, so only written when it changes
+CREATE TABLE IF NOT EXISTS question_sources (
+    session_id TEXT PRIMARY KEY REFERENCES sessions (id) ON DELETE CASCADE,
+    text TEXT NOT NULL
+);
+-- Single-use event stream tickets, removed with their token
+CREATE TABLE IF NOT EXISTS stream_tickets (
+    ticket TEXT PRIMARY KEY,
+    token TEXT NOT NULL REFERENCES tokens (token) ON DELETE CASCADE,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stream_tickets_expires ON stream_tickets (expires);
+-- Upload job status, so GET /jobs works on every worker
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    finished_at REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_session ON jobs (session_id);
+CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+-- Totals kept up to date by triggers, so get_stats() needs no table scan.
+-- Seeded once for databases created before the triggers existed.
+INSERT OR IGNORE INTO counters (name, value) SELECT 'sessions', COUNT(*) FROM sessions;
+INSERT OR IGNORE INTO counters (name, value) SELECT 'bytes', COALESCE(SUM(size_bytes), 0) FROM sessions;
+INSERT OR IGNORE INTO counters (name, value) SELECT 'tokens', COUNT(*) FROM tokens;
+CREATE TRIGGER IF NOT EXISTS sessions_insert AFTER INSERT ON sessions BEGIN
+    UPDATE counters SET value = value + 1 WHERE name = 'sessions';
+    UPDATE counters SET value = value + NEW.size_bytes WHERE name = 'bytes';
+END;
+CREATE TRIGGER IF NOT EXISTS sessions_delete AFTER DELETE ON sessions BEGIN
+    UPDATE counters SET value = value - 1 WHERE name = 'sessions';
+    UPDATE counters SET value = value - OLD.size_bytes WHERE name = 'bytes';
+END;
+CREATE TRIGGER IF NOT EXISTS sessions_resize AFTER UPDATE OF size_bytes ON sessions
+WHEN NEW.size_bytes != OLD.size_bytes BEGIN
+    UPDATE counters SET value = value + NEW.size_bytes - OLD.size_bytes WHERE name = 'bytes';
+END;
+CREATE TRIGGER IF NOT EXISTS tokens_insert AFTER INSERT ON tokens BEGIN
+    UPDATE counters SET value = value + 1 WHERE name = 'tokens';
+END;
+CREATE TRIGGER IF NOT EXISTS tokens_delete AFTER DELETE ON tokens BEGIN
+    UPDATE counters SET value = value - 1 WHERE name = 'tokens';
+END;
+"""
+
+# Constant statement strings so sqlite3's per-connection statement cache
+# reuses the prepared statements
+SQL_INSERT_SESSION = "INSERT INTO sessions (id, version, last_access, size_bytes, data) VALUES (?, ?, ?, ?, ?)"
+SQL_UPDATE_SESSION = "UPDATE sessions SET version = ?, last_access = ?, size_bytes = ?, data = ? WHERE id = ? AND version = ?"
+SQL_SESSION_VERSION = "SELECT version FROM sessions WHERE id = ?"
+SQL_SESSION_DATA = (
+    "SELECT s.version, s.data, q.text "
+    "FROM sessions s LEFT JOIN question_sources q ON q.session_id = s.id WHERE s.id = ?"
+)
+SQL_RESOLVE_TOKEN = (
+    "SELECT t.session_id, t.role, s.version, s.last_access "
+    "FROM tokens t JOIN sessions s ON s.id = t.session_id WHERE t.token = ?"
+)
+SQL_INSERT_TOKEN = "INSERT INTO tokens (token, session_id, role) VALUES (?, ?, ?)"
+SQL_DELETE_TOKEN = "DELETE FROM tokens WHERE token = ?"
+SQL_SESSION_TOKENS = "SELECT token, role FROM tokens WHERE session_id = ?"
+SQL_INSERT_TICKET = "INSERT INTO stream_tickets (ticket, token, expires) VALUES (?, ?, ?)"
+SQL_TICKET = "SELECT token, expires FROM stream_tickets WHERE ticket = ?"
+SQL_DELETE_TICKET = "DELETE FROM stream_tickets WHERE ticket = ?"
+SQL_DELETE_EXPIRED_TICKETS = "DELETE FROM stream_tickets WHERE expires < ?"
+SQL_SAVE_JOB = "INSERT OR REPLACE INTO jobs (id, session_id, finished_at, data) VALUES (?, ?, ?, ?)"
+SQL_JOB = "SELECT data FROM jobs WHERE id = ? AND session_id = ?"
+SQL_DELETE_FINISHED_JOBS = "DELETE FROM jobs WHERE finished_at < ?"
+SQL_TOUCH = "UPDATE sessions SET last_access = ? WHERE id = ?"
+SQL_DELETE_SESSION = "DELETE FROM sessions WHERE id = ?"
+SQL_IDLE_SESSIONS = "SELECT id FROM sessions WHERE last_access < ?"
+SQL_LRU_SESSIONS = "SELECT id, size_bytes FROM sessions ORDER BY last_access"
+# Admin listing, {where} is built from the SessionFilter bounds
+SQL_LIST_SESSIONS = (
+    "SELECT id, json_extract(data, '$.created_at'), last_access, "
+    "(SELECT group_concat(DISTINCT role) FROM tokens t WHERE t.session_id = s.id), "
+    "json_extract(data, '$.question_count'), json_extract(data, '$.current_index'), size_bytes "
+    "FROM sessions s {where} ORDER BY last_access DESC LIMIT ? OFFSET ?"
+)
+# SessionFilter field -> (SQL expression, comparison)
+_FILTER_SQL = {
+    "min_age": ("? - json_extract(data, '$.created_at')", ">="),
+    "max_age": ("? - json_extract(data, '$.created_at')", "<="),
+    "min_tokens": ("(SELECT COUNT(*) FROM tokens t WHERE t.session_id = s.id)", ">="),
+    "max_tokens": ("(SELECT COUNT(*) FROM tokens t WHERE t.session_id = s.id)", "<="),
+    "min_questions": ("json_extract(data, '$.question_count')", ">="),
+    "max_questions": ("json_extract(data, '$.question_count')", "<="),
+}
+SQL_SET_SOURCE = "INSERT OR REPLACE INTO question_sources (session_id, text) VALUES (?, ?)"
+SQL_DELETE_SOURCE = "DELETE FROM question_sources WHERE session_id = ?"
+SQL_ADD_COUNTER = (
+    "INSERT INTO counters (name, value) VALUES (?, ?) "
+    "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value"
+)
+SQL_COUNTERS = "SELECT name, value FROM counters"
+
+
+def session_to_json(session: SessionData) -> str:
+    return json.dumps({
+        "id": session.id,
+        "pdfs": [pdf.to_dict() for pdf in session.pdfs],
+        "questions": session.questions,
+        "question_origins": session.question_origins,
+        "question_count": session.question_count,
+        "question_seed": session.question_seed,
+        "question_base": session.question_base,
+        "current_index": session.current_index,
+        "revealed": session.revealed,
+        "grades": session.grades_dict(),
+        "created_at": session.created_at,
+        "version": session.version,
+        "last_access": session.last_access,
+        "size_bytes": session.size_bytes,
+    }, separators=(",", ":"))
+
+
+def source_to_json(question_source: Dict[str, str]) -> str:
+    return json.dumps(question_source, separators=(",", ":"))
+
+
+def source_from_json(data: Optional[str]) -> Optional[Dict[str, str]]:
+    """{filename: text}; older versions stored the documents joined into one text"""
+    if data is None:
+        return None
+    try:
+        source = json.loads(data)
+    except ValueError:
+        source = None
+    return source if isinstance(source, dict) else {"": data}
+
+
+def session_from_json(
+    data: str,
+    question_source: Optional[str] = None,
+    tokens: Optional[Dict[str, str]] = None
+) -> SessionData:
+    """question_source and the tokens are stored separately (question_sources / tokens table)"""
+    raw = json.loads(data)
+    raw["question_source"] = source_from_json(question_source)
+    # Older versions kept a copy in the data; a join does not bump the version,
+    # so other workers' copies of the data may lack tokens - the table is complete
+    raw.pop("tokens", None)
+    raw["tokens"] = tokens
+    raw.pop("roles", None)  # written by older versions, derived from tokens now
+    raw["pdfs"] = [PdfInfo(**pdf) for pdf in raw["pdfs"]]
+    raw["questions"] = question_pool.intern_all(raw["questions"])
+    # Written by older versions without origins: documents unknown
+    names: Dict[str, str] = {}  # one filename string per document
+    origins = [(names.setdefault(name, name), start, end) for name, start, end in raw.get("question_origins", [])]
+    origins += [("", None, None)] * (len(raw["questions"]) - len(origins))
+    raw["question_origins"] = origins
+    grades = raw.pop("grades")
+    if isinstance(raw["created_at"], str):
+        raw["created_at"] = datetime.fromisoformat(raw["created_at"]).timestamp()
+    session = SessionData(**raw)
+    for index, status in grades.items():
+        session.set_grade(int(index), status)
+    return session
+
+
+class ConnectionPool:
+    """Fixed-size pool of SQLite connections shared by the threadpool"""
+
+    def __init__(self, path: str, size: int):
+        self._connections: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        for _ in range(size):
+            conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._connections.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connections.get()
+        try:
+            yield conn
+        finally:
+            self._connections.put(conn)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Session store in an SQLite database (WAL mode), so several uvicorn
+    workers on one machine share sessions
+
+    Writes use optimistic concurrency on the version column: if another
+    worker saved the session in the meantime, save() raises
+    SessionConflictError. Long-polls are still per-worker and event
+    streams are refused (shared); polling and ETags work across workers.
+    """
+
+    blocking_io = True
+    shared = True
+
+    def __init__(self, path: str, pool_size: int = SQLITE_POOL_SIZE, cache_size: int = SQLITE_CACHE_SIZE):
+        super().__init__()
+        self.path = path
+        self._pool = ConnectionPool(path, pool_size)
+        with self._pool.connection() as conn:
+            conn.executescript(SCHEMA)
+        # Deserialized copies; each knows the row version it was read from /
+        # written to (stored_version), so an evicted copy can still be saved
+        self._cache: "OrderedDict[str, SessionData]" = OrderedDict()
+        self._cache_size = cache_size
+        # Version being written by a save() in progress: the cached copy holds it already
+        self._saving: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    # ------------------------------------------------------------------
+    # Read-through cache
+    # ------------------------------------------------------------------
+
+    def _cached(self, session_id: str, version: int) -> Optional[SessionData]:
+        with self._lock:
+            session = self._cache.get(session_id)
+            if session is None:
+                self.cache_misses += 1
+                return None
+            # Versions only grow: a copy at least as new as the row read is current
+            known = max(session.stored_version, self._saving.get(session_id, -1))
+            if version > known:
+                self.cache_misses += 1
+                return None
+            self._cache.move_to_end(session_id)
+            self.cache_hits += 1
+            return session
+
+    def _remember(self, session: SessionData):
+        # Caller holds self._lock
+        self._cache[session.id] = session
+        self._cache.move_to_end(session.id)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def _forget(self, session_id: str):
+        with self._lock:
+            self._cache.pop(session_id, None)
+
+    def _load(self, conn: sqlite3.Connection, session_id: str, version: int) -> Optional[SessionData]:
+        session = self._cached(session_id, version)
+        if session is not None:
+            return session
+        row = conn.execute(SQL_SESSION_DATA, (session_id,)).fetchone()
+        if row is None:
+            self._forget(session_id)
+            return None
+        tokens = dict(conn.execute(SQL_SESSION_TOKENS, (session_id,)).fetchall())
+        session = session_from_json(row[1], row[2], tokens)
+        session.stored_version = row[0]
+        session.stored_source = session.question_source
+        with self._lock:
+            self._remember(session)
+        return session
+
+    # ------------------------------------------------------------------
+    # SessionStore interface
+    # ------------------------------------------------------------------
+
+    def create_session(self, session_id: str) -> SessionData:
+        session = SessionData(id=session_id)
+        try:
+            with self._pool.connection() as conn, conn:
+                conn.execute(SQL_INSERT_SESSION, (
+                    session.id, session.version, session.last_access,
+                    session.size_bytes, session_to_json(session)
+                ))
+        except sqlite3.IntegrityError:
+            # Primary key: the code is taken (possibly by another worker)
+            raise SessionExistsError(session_id)
+        with self._lock:
+            self._remember(session)
+        self.enforce_limits()
+        return session
+
+    def get_session(self, session_id: str) -> Optional[SessionData]:
+        with self._pool.connection() as conn:
+            row = conn.execute(SQL_SESSION_VERSION, (session_id,)).fetchone()
+            if row is None:
+                self._forget(session_id)
+                return None
+            return self._load(conn, session_id, row[0])
+
+    def save(self, session: SessionData):
+        # The copy's own row version: a stale copy (another copy or worker
+        # saved since) fails the check, an evicted but current one passes
+        expected = session.stored_version
+        source_changed = session.stored_source is not session.question_source
+        with self._lock:
+            self._saving[session.id] = session.version
+        updated = 0
+        try:
+            with self._pool.connection() as conn, conn:
+                updated = conn.execute(SQL_UPDATE_SESSION, (
+                    session.version, session.last_access, session.size_bytes,
+                    session_to_json(session), session.id, expected
+                )).rowcount
+                if updated and source_changed:
+                    if session.question_source is None:
+                        conn.execute(SQL_DELETE_SOURCE, (session.id,))
+                    else:
+                        conn.execute(SQL_SET_SOURCE, (session.id, source_to_json(session.question_source)))
+        finally:
+            with self._lock:
+                self._saving.pop(session.id, None)
+                if updated:
+                    session.stored_version = session.version
+                    session.stored_source = session.question_source
+                    # The newest copy, readers must get this one
+                    self._remember(session)
+        if not updated:
+            # Changed by another worker (or deleted): reload on next access
+            self._forget(session.id)
+            raise SessionConflictError(session.id)
+
+    def add_token(self, session: SessionData, token: str, role: str):
+        session.add_token(token, role)
+        with self._pool.connection() as conn, conn:
+            conn.execute(SQL_INSERT_TOKEN, (token, session.id, role))
+        try:
+            self.save(session)
+        except SessionConflictError:
+            # Stale copy: the slot was never granted
+            session.remove_token(token)
+            with self._pool.connection() as conn, conn:
+                conn.execute(SQL_DELETE_TOKEN, (token,))
+            raise
+
+    def resolve_token(self, token: str) -> Optional[Tuple[SessionData, str]]:
+        with self._pool.connection() as conn:
+            row = conn.execute(SQL_RESOLVE_TOKEN, (token,)).fetchone()
+            if row is None:
+                return None
+            session_id, role, version, last_access = row
+            session = self._load(conn, session_id, version)
+            if session is None:
+                return None
+            now = time.time()
+            session.last_access = now
+            if now - last_access > TOUCH_INTERVAL_SECONDS:
+                with conn:
+                    conn.execute(SQL_TOUCH, (now, session_id))
+        return session, role
+
+    def add_ticket(self, ticket: str, token: str, expires: float):
+        with self._pool.connection() as conn, conn:
+            conn.execute(SQL_INSERT_TICKET, (ticket, token, expires))
+
+    def take_ticket(self, ticket: str) -> Optional[str]:
+        with self._pool.connection() as conn, conn:
+            row = conn.execute(SQL_TICKET, (ticket,)).fetchone()
+            # Only the worker whose delete succeeds may use it
+            if row is None or not conn.execute(SQL_DELETE_TICKET, (ticket,)).rowcount:
+                return None
+        token, expires = row
+        return token if expires >= time.time() else None
+
+    def update_size(self, session: SessionData):
+        # Persisted with the next save()
+        session.size_bytes = estimate_session_bytes(session)
+        if MAX_STORE_BYTES:
+            self.enforce_limits()
+
+    def delete_session(self, session_id: str):
+        with self._pool.connection() as conn, conn:
+            deleted = conn.execute(SQL_DELETE_SESSION, (session_id,)).rowcount
+        self._forget(session_id)
+        if deleted:
+            self._notify_removed([session_id])
+
+    def list_sessions(self, offset: int, limit: int, filter: SessionFilter) -> List[dict]:
+        now = time.time()
+        conditions, params = [], []
+        for name, (expression, op) in _FILTER_SQL.items():
+            bound = getattr(filter, name)
+            if bound is None:
+                continue
+            conditions.append(f"{expression} {op} ?")
+            params.extend([now, bound] if "?" in expression else [bound])
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        with self._pool.connection() as conn:
+            rows = conn.execute(SQL_LIST_SESSIONS.format(where=where), params + [limit, offset]).fetchall()
+        return [
+            {
+                "id": session_id,
+                "created_at": created_at,
+                "last_access": last_access,
+                "roles": sorted(roles.split(",")) if roles else [],
+                "question_count": question_count,
+                "current_index": current_index,
+                "size_bytes": size_bytes,
+            }
+            for session_id, created_at, last_access, roles, question_count, current_index, size_bytes in rows
+        ]
+
+    def _remove_many(self, conn: sqlite3.Connection, session_ids: List[str]):
+        conn.executemany(SQL_DELETE_SESSION, [(session_id,) for session_id in session_ids])
+        for session_id in session_ids:
+            self._forget(session_id)
+
+    def expire_idle(self, now: Optional[float] = None) -> List[str]:
+        now = now or time.time()
+        cutoff = now - SESSION_TTL_SECONDS
+        with self._pool.connection() as conn, conn:
+            conn.execute(SQL_DELETE_EXPIRED_TICKETS, (now,))
+            removed = [row[0] for row in conn.execute(SQL_IDLE_SESSIONS, (cutoff,))]
+            if removed:
+                self._remove_many(conn, removed)
+                conn.execute(SQL_ADD_COUNTER, ("expired", len(removed)))
+        self._notify_removed(removed)
+        return removed
+
+    def enforce_limits(self) -> List[str]:
+        if not MAX_SESSIONS and not MAX_STORE_BYTES:
+            return []
+        removed = []
+        with self._pool.connection() as conn, conn:
+            counters = dict(conn.execute(SQL_COUNTERS).fetchall())
+            count, total_bytes = counters["sessions"], counters["bytes"]
+            if (MAX_SESSIONS and count > MAX_SESSIONS) or (MAX_STORE_BYTES and total_bytes > MAX_STORE_BYTES):
+                for session_id, size_bytes in conn.execute(SQL_LRU_SESSIONS).fetchall():
+                    if not ((MAX_SESSIONS and count > MAX_SESSIONS)
+                            or (MAX_STORE_BYTES and total_bytes > MAX_STORE_BYTES)):
+                        break
+                    removed.append(session_id)
+                    count -= 1
+                    total_bytes -= size_bytes
+                self._remove_many(conn, removed)
+                conn.execute(SQL_ADD_COUNTER, ("evicted", len(removed)))
+        self._notify_removed(removed)
+        return removed
+
+    def save_job(self, session_id: str, job_id: str, data: str, finished_at: Optional[float]):
+        try:
+            with self._pool.connection() as conn, conn:
+                conn.execute(SQL_SAVE_JOB, (job_id, session_id, finished_at, data))
+        except sqlite3.IntegrityError:
+            # Session deleted meanwhile, its jobs are gone with it
+            pass
+
+    def get_job(self, session_id: str, job_id: str) -> Optional[dict]:
+        with self._pool.connection() as conn:
+            row = conn.execute(SQL_JOB, (job_id, session_id)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def expire_jobs(self, before: float):
+        with self._pool.connection() as conn, conn:
+            conn.execute(SQL_DELETE_FINISHED_JOBS, (before,))
+
+    def get_stats(self) -> dict:
+        with self._pool.connection() as conn:
+            counters = dict(conn.execute(SQL_COUNTERS).fetchall())
+        return {
+            "backend": "sqlite",
+            "sessions": counters["sessions"],
+            "tokens": counters["tokens"],
+            "estimated_bytes": counters["bytes"],
+            "expired": counters.get("expired", 0),
+            "evicted": counters.get("evicted", 0),
+            "ttl_seconds": SESSION_TTL_SECONDS,
+            "max_sessions": MAX_SESSIONS,
+            "max_bytes": MAX_STORE_BYTES,
+            "cache": {
+                "size": len(self._cache),
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+            },
+        }
@@ -1,153 +1,375 @@
-import string
+import heapq
+import logging
+import os
 import random
 import re
-from typing import List
+import secrets
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
 from io import BytesIO
+from itertools import accumulate, islice
 
+from app.cache import content_hash, document_index_cache
 
-def generate_session_code(length: int = 8) -> str:
-    """Generate a random session code"""
-    chars = string.ascii_uppercase + string.digits
-    return ''.join(random.choices(chars, k=length))
+logger = logging.getLogger(__name__)
+
+# Limits for uploaded PDFs
+MAX_PDF_PAGES = int(os.getenv("MAX_PDF_PAGES", "1000"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+# Whole upload request (all files), enforced while the body streams in
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(4 * MAX_UPLOAD_BYTES)))
+
+# Deck size: default, upper limit, and how many questions are generated at once
+DEFAULT_NUM_QUESTIONS = int(os.getenv("DEFAULT_NUM_QUESTIONS", "10"))
+MAX_NUM_QUESTIONS = int(os.getenv("MAX_NUM_QUESTIONS", "500"))
+QUESTION_BATCH_SIZE = int(os.getenv("QUESTION_BATCH_SIZE", "20"))
+
+
+# Session codes: a random integer shown in Crockford base32 (no I, L, O, U,
+# so codes can be read out loud), 8 characters = 40 bits
+SESSION_CODE_LENGTH = 8
+_SESSION_CODE_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_SESSION_CODE_BITS = 5 * SESSION_CODE_LENGTH
+# Two characters (10 bits) per lookup
+_SESSION_CODE_PAIRS = [a + b for a in _SESSION_CODE_ALPHABET for b in _SESSION_CODE_ALPHABET]
+
+
+def encode_session_code(number: int) -> str:
+    """Display form of a session number (0 <= number < 2**40)"""
+    pairs = _SESSION_CODE_PAIRS
+    return (
+        pairs[(number >> 30) & 0x3FF] + pairs[(number >> 20) & 0x3FF]
+        + pairs[(number >> 10) & 0x3FF] + pairs[number & 0x3FF]
+    )
+
+
+# Typed codes: the letters left out of the alphabet are read as the digits they look like
+_SESSION_CODE_TYPOS = str.maketrans({"O": "0", "I": "1", "L": "1", "-": None, " ": None})
+
+
+def normalize_session_code(code: str) -> str:
+    """Canonical form of a code as typed by a user ("abcd-efgo" -> "ABCDEFG0")"""
+    return code.strip().upper().translate(_SESSION_CODE_TYPOS)
+
+
+def generate_session_code() -> str:
+    """Generate a random session code (CSPRNG, uniqueness is checked by the store)"""
+    return encode_session_code(secrets.randbits(_SESSION_CODE_BITS))
 
 
 def generate_token(length: int = 32) -> str:
-    """Generate a random token"""
-    chars = string.ascii_letters + string.digits
-    return ''.join(random.choices(chars, k=length))
+    """Generate a random URL-safe token (CSPRNG, 6 bits per character)"""
+    return secrets.token_urlsafe(length * 3 // 4)
 
 
-def extract_text_from_pdf(pdf_bytes: bytes) -> str:
-    """Extract text from PDF using pdfplumber"""
+def iter_pdf_pages(source: Union[str, bytes], max_pages: int = MAX_PDF_PAGES) -> Iterator[str]:
+    """
+    Yield the text of each page (file path or PDF bytes)
+    Each page's parsed layout objects are released right after its text
+    is extracted, so memory stays bounded by one page
+    """
+    import pdfplumber
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    with pdfplumber.open(source) as pdf:
+        for number, page in enumerate(pdf.pages):
+            if max_pages and number >= max_pages:
+                logger.warning("PDF has more than %d pages, ignoring the rest", max_pages)
+                break
+            yield page.extract_text() or ""
+            # Page.close() is pdfplumber >= 0.11, flush_cache() before that
+            getattr(page, "close", page.flush_cache)()
+
+
+def extract_text_from_pdf(source: Union[str, bytes]) -> str:
+    """Extract text from PDF (file path or bytes) using pdfplumber"""
+    return extract_pdf(source)[0]
+
+
+def extract_pdf(source: Union[str, bytes]) -> Tuple[str, int]:
+    """
+    Extract text and number of pages read from PDF (file path or bytes)
+    Raises ValueError if the PDF cannot be read (plain, so it crosses process boundaries)
+    """
+    pages = 0
+    parts = []
     try:
-        import pdfplumber
-        with pdfplumber.open(BytesIO(pdf_bytes)) as pdf:
-            text = ""
-            for page in pdf.pages:
-                text += page.extract_text() or ""
-                text += "\n"
-            return text
+        for page_text in iter_pdf_pages(source):
+            parts.append(f"{page_text}\n")
+            pages += 1
     except Exception as e:
-        print(f"Error extracting PDF text: {e}")
-        return ""
+        raise ValueError(f"Could not read PDF: {e}") from None
+    return "".join(parts), pages
+
+
+# ============================================================================
+# Question generation - patterns compiled once at import
+# ============================================================================
+
+_WHITESPACE_RE = re.compile(r'\s+')
+# Sentence tokenizer: text up to and including the next terminator
+_SEGMENT_RE = re.compile(r'[^.!?]*[.!?]')
+_NUMBERING_RE = re.compile(r'^\s*\d+[\.)]\s*')
+_ENUMERATION_RE = re.compile(r'^\s*[a-z][\.)]\s*', re.IGNORECASE)
+
+# Common question starters (even without ?). Applied to whitespace-normalized
+# text, so "^" can only match at the very start of the document.
+_QUESTION_STARTER_RES = [
+    re.compile(pattern, re.MULTILINE | re.IGNORECASE)
+    for pattern in [
+        r'(?:^|\n)\s*(?:Wie|Was|Warum|Wann|Wo|Welche|Welcher|Welches|Wer|Wozu|Womit|Wodurch)\s+[^.!?]{10,150}[.?]',
+        r'(?:^|\n)\s*(?:Erklären Sie|Beschreiben Sie|Nennen Sie|Erläutern Sie|Definieren Sie)\s+[^.!?]{10,150}[.?]',
+        r'(?:^|\n)\s*(?:Was versteht man unter|Was bedeutet|Was ist)\s+[^.!?]{10,150}[.?]',
+    ]
+]
+
+# Capitalized phrases (potential proper nouns, technical terms)
+_CAPITALIZED_RE = re.compile(r'\b[A-ZÄÖÜ][a-zäöüß]+(?:\s+[A-ZÄÖÜ][a-zäöüß]+)*\b')
+# Common sentence starters that are not topics
+_TOPIC_STOP_WORDS = frozenset(['Der', 'Die', 'Das', 'Ein', 'Eine', 'Im', 'In', 'Auf', 'Bei', 'Mit', 'Für'])
 
+# Phrases after common definition patterns
+_CONCEPT_RES = [
+    re.compile(r'(?:wird bezeichnet als|ist|bedeutet|bezeichnet|definiert als)\s+([^.?!]{10,80})'),
+    re.compile(r'(?:Unter|Begriff|Konzept von)\s+([A-ZÄÖÜ][a-zäöüß\s]{5,50})'),
+    re.compile(r'(?:Verfahren|Methode|Prinzip|Ansatz)\s+(?:der|des|zur)\s+([^.?!]{10,60})'),
+]
 
-def generate_questions_from_text(text: str, num_questions: int = 10) -> List[str]:
+# Question templates with more variety (template, weight)
+_TOPIC_TEMPLATES = [
+    ("Erkläre das Konzept: {}", 0.2),
+    ("Was versteht man unter {}?", 0.2),
+    ("Beschreibe die Bedeutung von: {}", 0.15),
+    ("Welche Rolle spielt {}?", 0.15),
+    ("Wie funktioniert {}?", 0.15),
+    ("Was sind die Hauptmerkmale von {}?", 0.15),
+]
+_TOPIC_TEMPLATE_TEXTS = [t[0] for t in _TOPIC_TEMPLATES]
+_TOPIC_CUM_WEIGHTS = list(accumulate(t[1] for t in _TOPIC_TEMPLATES))
+
+# Fallback templates for plain sentences
+_SENTENCE_TEMPLATES = [
+    "Erläutere folgenden Aspekt: {}",
+    "Was wird mit folgendem gemeint: {}",
+    "Erkläre den Zusammenhang: {}",
+]
+# Sentences usable as fallback snippets (length in characters)
+_FALLBACK_SENTENCE_MIN = 30
+_FALLBACK_SENTENCE_MAX = 150
+
+# (question, start, end): character offsets of the passage the question was
+# made from, in the whitespace-normalized document text (DocumentIndex.text);
+# None for generic questions that are not tied to a passage
+SourcedQuestion = Tuple[str, Optional[int], Optional[int]]
+
+# Paragraphs are separated by blank lines in the extracted text
+_PARAGRAPH_SPLIT_RE = re.compile(r'\n\s*\n')
+
+
+@dataclass(frozen=True)
+class DocumentIndex:
+    """
+    Sentence / paragraph segmentation of a document, built once per text
+    Offsets are (start, end) into the whitespace-normalized text
+    """
+    text: str
+    sentences: List[Tuple[int, int]]
+    paragraphs: List[Tuple[int, int]]
+    fallback_sentences: List[int]  # indices into sentences, in document order
+
+    def sentence(self, i: int) -> str:
+        start, end = self.sentences[i]
+        return self.text[start:end]
+
+    def paragraph(self, i: int) -> str:
+        start, end = self.paragraphs[i]
+        return self.text[start:end]
+
+
+def build_document_index(text: str) -> DocumentIndex:
+    """Normalize whitespace and segment the text into paragraphs and sentences"""
+    parts: List[str] = []
+    paragraphs: List[Tuple[int, int]] = []
+    pos = 0
+    for raw in _PARAGRAPH_SPLIT_RE.split(text):
+        para = _WHITESPACE_RE.sub(' ', raw).strip()
+        if not para:
+            continue
+        if parts:
+            pos += 1  # joining space
+        paragraphs.append((pos, pos + len(para)))
+        parts.append(para)
+        pos += len(para)
+    normalized = ' '.join(parts)
+
+    sentences: List[Tuple[int, int]] = []
+    fallback: List[int] = []
+    for para_start, para_end in paragraphs:
+        end = para_start
+        for match in _SEGMENT_RE.finditer(normalized, para_start, para_end):
+            start, end = match.span()
+            _add_sentence(normalized, start, end, sentences, fallback)
+        # Trailing text without a terminator is a sentence as well
+        _add_sentence(normalized, end, para_end, sentences, fallback)
+
+    return DocumentIndex(normalized, sentences, paragraphs, fallback)
+
+
+def _add_sentence(text: str, start: int, end: int, sentences: List[Tuple[int, int]], fallback: List[int]):
+    while start < end and text[start] == ' ':
+        start += 1
+    if start == end:
+        return
+    if _FALLBACK_SENTENCE_MIN <= end - start <= _FALLBACK_SENTENCE_MAX:
+        fallback.append(len(sentences))
+    sentences.append((start, end))
+
+
+def get_document_index(text: str) -> DocumentIndex:
+    """Index for the text, reused while the same material is regenerated"""
+    key = content_hash(text)
+    index = document_index_cache.get(key)
+    if index is None:
+        index = build_document_index(text)
+        document_index_cache.set(key, index)
+    return index
+
+
+def _clean_question(q: str) -> str:
+    """Strip numbering like "1." or "a)" from a question"""
+    q = _NUMBERING_RE.sub('', q)
+    q = _ENUMERATION_RE.sub('', q)
+    return q.strip()
+
+
+def _stripped_span(text: str, start: int, end: int) -> Tuple[int, int]:
+    """(start, end) without surrounding whitespace"""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _iter_extracted_questions(text: str) -> Iterator[SourcedQuestion]:
+    """
+    Existing questions in document order, deduplicated: first all
+    sentences ending with "?", then sentences with a question starter.
+    Produced lazily, the text is only scanned as far as it is consumed.
+    """
+    seen = set()
+
+    # Single pass over the sentences
+    for match in _SEGMENT_RE.finditer(text):
+        segment = match.group()
+        if segment[-1] != '?':
+            continue
+        q = segment.strip()
+        # Filter out very short or very long questions
+        if 10 < len(q) < 200:
+            q = _clean_question(q)
+            if q and q not in seen:
+                seen.add(q)
+                yield (q, *_stripped_span(text, *match.span()))
+
+    for pattern in _QUESTION_STARTER_RES:
+        match = pattern.match(text)
+        if match is None:
+            continue
+        q = match.group().strip()
+        if q and q not in seen and len(q) > 15:
+            q = _clean_question(q)
+            if q:
+                seen.add(q)
+                yield (q, *_stripped_span(text, *match.span()))
+
+
+def _iter_topics(text: str) -> Iterator[SourcedQuestion]:
+    """Potential key concepts in order with their offsets, produced lazily"""
+    seen = set()
+    for match in _CAPITALIZED_RE.finditer(text):
+        word = match.group()
+        if word not in _TOPIC_STOP_WORDS and len(word) > 3 and word not in seen:
+            seen.add(word)
+            yield (word, *match.span())
+
+    for pattern in _CONCEPT_RES:
+        for match in pattern.finditer(text):
+            concept = match.group(1).strip()
+            if concept and len(concept) > 5:
+                yield (concept, *_stripped_span(text, *match.span(1)))
+
+
+def generate_questions_from_text(text: str, num_questions: int = 10, rng: Optional[random.Random] = None) -> List[str]:
     """
     Extract questions from the text and generate similar ones.
+    See iter_questions_from_text
+    """
+    return list(iter_questions_from_text(text, num_questions, rng))
+
+
+def iter_questions_from_text(text: str, num_questions: int = 10, rng: Optional[random.Random] = None) -> Iterator[str]:
+    """
+    Produce the deck of `num_questions` questions lazily.
+    See iter_sourced_questions_from_text
+    """
+    for question, _, _ in iter_sourced_questions_from_text(text, num_questions, rng):
+        yield question
+
+
+def iter_sourced_questions_from_text(
+    text: str,
+    num_questions: int = 10,
+    rng: Optional[random.Random] = None
+) -> Iterator[SourcedQuestion]:
+    """
+    Produce the deck of `num_questions` questions lazily, each with the
+    offsets of the passage it was made from.
     Strategy: 
     1. First, extract existing questions from the document
     2. Then generate contextual questions from content
     3. Combine both for variety
+    Each stage only scans as far into the text as it needs to. With a
+    seeded `rng` the deck is deterministic, so any slice of it can be
+    produced again later by re-running the iterator.
     """
-    questions = []
+    rng = rng or random
+    count = 0
     
-    # Clean text and normalize whitespace
-    text = re.sub(r'\s+', ' ', text.strip())
+    # Clean text, normalize whitespace and segment it (cached per text)
+    index = get_document_index(text)
+    text = index.text
     
     if not text or len(text) < 50:
-        return [f"Frage {i+1}: Erklären Sie den Inhalt des Dokuments" for i in range(num_questions)]
+        for i in range(num_questions):
+            yield f"Frage {i+1}: Erklären Sie den Inhalt des Dokuments", None, None
+        return
     
     # ========================================================================
     # STEP 1: Extract existing questions from the document
     # ========================================================================
-    extracted_questions = []
-    
-    # Pattern 1: Sentences ending with question mark
-    question_pattern = r'([^.!?]*\?)'
-    potential_questions = re.findall(question_pattern, text)
-    
-    for q in potential_questions:
-        q = q.strip()
-        # Filter out very short or very long questions
-        if 10 < len(q) < 200:
-            # Clean up numbering (e.g., "1.", "a)", etc.)
-            q = re.sub(r'^\s*\d+[\.)]\s*', '', q)
-            q = re.sub(r'^\s*[a-z][\.)]\s*', '', q, flags=re.IGNORECASE)
-            q = q.strip()
-            if q and q not in extracted_questions:
-                extracted_questions.append(q)
-    
-    # Pattern 2: Common question starters (even without ?)
-    question_starters = [
-        r'(?:^|\n)\s*(?:Wie|Was|Warum|Wann|Wo|Welche|Welcher|Welches|Wer|Wozu|Womit|Wodurch)\s+[^.!?]{10,150}[.?]',
-        r'(?:^|\n)\s*(?:Erklären Sie|Beschreiben Sie|Nennen Sie|Erläutern Sie|Definieren Sie)\s+[^.!?]{10,150}[.?]',
-        r'(?:^|\n)\s*(?:Was versteht man unter|Was bedeutet|Was ist)\s+[^.!?]{10,150}[.?]',
-    ]
-    
-    for pattern in question_starters:
-        matches = re.findall(pattern, text, re.MULTILINE | re.IGNORECASE)
-        for match in matches:
-            q = match.strip()
-            if q and q not in extracted_questions and len(q) > 15:
-                # Clean up
-                q = re.sub(r'^\s*\d+[\.)]\s*', '', q)
-                q = re.sub(r'^\s*[a-z][\.)]\s*', '', q, flags=re.IGNORECASE)
-                q = q.strip()
-                if q:
-                    extracted_questions.append(q)
+    for sourced in islice(_iter_extracted_questions(text), num_questions):
+        yield sourced
+        count += 1
     
-    # Add extracted questions to our list
-    questions.extend(extracted_questions[:num_questions])
+    logger.debug("Extracted %d questions from document", count)
     
-    print(f"[QUESTIONS] Extracted {len(extracted_questions)} questions from document")
-    
-    # If we have enough questions, return them
-    if len(questions) >= num_questions:
-        return questions[:num_questions]
+    # If we have enough questions, stop
+    if count >= num_questions:
+        return
     
     # ========================================================================
     # STEP 2: Generate additional questions from content
     # ========================================================================
+    remaining_needed = num_questions - count
     
-    # Identify potential key concepts (words that appear to be important)
-    # Look for capitalized words (except sentence starts), technical terms
-    potential_topics = []
-    
-    # Only generate additional questions if needed
-    remaining_needed = num_questions - len(questions)
-    if remaining_needed <= 0:
-        return questions[:num_questions]
-    
-    print(f"[QUESTIONS] Need {remaining_needed} more questions, generating from content...")
-    
-    # Extract capitalized phrases (potential proper nouns, technical terms)
-    capitalized_pattern = r'\b[A-ZÄÖÜ][a-zäöüß]+(?:\s+[A-ZÄÖÜ][a-zäöüß]+)*\b'
-    for match in re.finditer(capitalized_pattern, text):
-        word = match.group()
-        # Skip common sentence starters
-        if word not in ['Der', 'Die', 'Das', 'Ein', 'Eine', 'Im', 'In', 'Auf', 'Bei', 'Mit', 'Für']:
-            if len(word) > 3 and word not in potential_topics:
-                potential_topics.append(word)
-    
-    # Extract phrases after common patterns
-    concept_patterns = [
-        r'(?:wird bezeichnet als|ist|bedeutet|bezeichnet|definiert als)\s+([^.?!]{10,80})',
-        r'(?:Unter|Begriff|Konzept von)\s+([A-ZÄÖÜ][a-zäöüß\s]{5,50})',
-        r'(?:Verfahren|Methode|Prinzip|Ansatz)\s+(?:der|des|zur)\s+([^.?!]{10,60})'
-    ]
-    
-    for pattern in concept_patterns:
-        for match in re.finditer(pattern, text):
-            concept = match.group(1).strip()
-            if concept and len(concept) > 5:
-                potential_topics.append(concept)
-    
-    # Question templates with more variety
-    templates = [
-        ("Erkläre das Konzept: {}", 0.2),
-        ("Was versteht man unter {}?", 0.2),
-        ("Beschreibe die Bedeutung von: {}", 0.15),
-        ("Welche Rolle spielt {}?", 0.15),
-        ("Wie funktioniert {}?", 0.15),
-        ("Was sind die Hauptmerkmale von {}?", 0.15),
-    ]
+    logger.debug("Need %d more questions, generating from content", remaining_needed)
     
     # Generate questions from topics
     used_topics = set()
-    for topic in potential_topics[:remaining_needed * 2]:
-        if len(questions) >= num_questions:
-            break
+    for topic, start, end in islice(_iter_topics(text), remaining_needed * 2):
+        if count >= num_questions:
+            return
         
         # Avoid duplicates
         topic_lower = topic.lower()
@@ -155,54 +377,95 @@ def generate_questions_from_text(text: str, num_questions: int = 10) -> List[str
             continue
         
         # Choose template based on weights
-        template = random.choices(
-            [t[0] for t in templates],
-            weights=[t[1] for t in templates],
-            k=1
-        )[0]
+        template = rng.choices(_TOPIC_TEMPLATE_TEXTS, cum_weights=_TOPIC_CUM_WEIGHTS, k=1)[0]
         
         # Truncate if too long
         if len(topic) > 80:
             topic = topic[:77] + "..."
         
-        questions.append(template.format(topic))
+        yield template.format(topic), start, end
+        count += 1
         used_topics.add(topic_lower)
     
-    # Fill remaining with sentence-based questions
-    sentence_templates = [
-        "Erläutere folgenden Aspekt: {}",
-        "Was wird mit folgendem gemeint: {}",
-        "Erkläre den Zusammenhang: {}",
-    ]
-    
-    for sentence in sentences:
-        if len(questions) >= num_questions:
-            break
-        
-        # Skip very short or very long sentences
-        if len(sentence) < 30 or len(sentence) > 150:
-            continue
+    # ========================================================================
+    # STEP 3: Fill remaining from the precomputed sentence/paragraph index
+    # ========================================================================
+    for i in index.fallback_sentences:
+        if count >= num_questions:
+            return
         
         # Truncate and add
+        sentence = index.sentence(i)
         snippet = sentence[:120]
         if len(sentence) > 120:
             snippet += "..."
         
-        template = random.choice(sentence_templates)
-        questions.append(template.format(snippet))
+        template = rng.choice(_SENTENCE_TEMPLATES)
+        yield (template.format(snippet), *index.sentences[i])
+        count += 1
     
     # Fill remaining with paragraph-based questions
-    for i, para in enumerate(paragraphs):
-        if len(questions) >= num_questions:
-            break
+    for i in range(len(index.paragraphs)):
+        if count >= num_questions:
+            return
         
+        para = index.paragraph(i)
         snippet = para[:100]
         if len(para) > 100:
             snippet += "..."
-        questions.append(f"Erkläre den Inhalt: {snippet}")
+        yield (f"Erkläre den Inhalt: {snippet}", *index.paragraphs[i])
+        count += 1
     
     # If still not enough, add generic questions
-    while len(questions) < num_questions:
-        questions.append(f"Erläutere einen weiteren wichtigen Aspekt des Themas")
-    
-    return questions[:num_questions]
+    while count < num_questions:
+        yield "Erläutere einen weiteren wichtigen Aspekt des Themas", None, None
+        count += 1
+
+
+def allocate_questions(lengths: Sequence[int], num_questions: int) -> List[int]:
+    """
+    Split `num_questions` across documents proportionally to their length
+    (largest remainder), every document gets at least one while there are enough
+    """
+    total = sum(lengths)
+    if not total:
+        lengths, total = [1] * len(lengths), len(lengths)
+    guaranteed = 1 if num_questions >= len(lengths) else 0
+    rest = num_questions - guaranteed * len(lengths)
+    shares = [rest * length / total for length in lengths]
+    quotas = [guaranteed + int(share) for share in shares]
+    by_remainder = sorted(range(len(lengths)), key=lambda i: (int(shares[i]) - shares[i], i))
+    for i in by_remainder[:num_questions - sum(quotas)]:
+        quotas[i] += 1
+    return quotas
+
+
+def iter_questions_from_documents(
+    texts: Sequence[str],
+    num_questions: int,
+    seed: int
+) -> Iterator[Tuple[int, str, Optional[int], Optional[int]]]:
+    """
+    Deck of `num_questions` questions from several documents, lazily, as
+    (document, question, start, end) with the position of the document in
+    `texts` and the offsets of the passage (see SourcedQuestion)
+    Every document gets its own seeded deck (iter_sourced_questions_from_text)
+    with a share proportional to its length; the decks are interleaved evenly,
+    so each batch draws from all documents. Nothing is re-joined into one text,
+    the per-document indexes built during upload are reused as they are.
+    A single document yields the same deck as iter_questions_from_text.
+    """
+    quotas = allocate_questions([len(text) for text in texts], num_questions)
+    decks = [
+        iter_sourced_questions_from_text(text, quota, random.Random(seed + i))
+        for i, (text, quota) in enumerate(zip(texts, quotas))
+    ]
+    # Next question from the document furthest behind its share
+    heap = [(0.5 / quota, i, 0) for i, quota in enumerate(quotas) if quota]
+    heapq.heapify(heap)
+    while heap:
+        _, i, taken = heapq.heappop(heap)
+        yield (i, *next(decks[i]))
+        taken += 1
+        if taken < quotas[i]:
+            heapq.heappush(heap, ((taken + 0.5) / quotas[i], i, taken))
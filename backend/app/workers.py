@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Where CPU-heavy work (PDF parsing) runs:
+#   "process" - ProcessPoolExecutor, parses files in parallel across cores (default)
+#   "thread"  - ThreadPoolExecutor, keeps the event loop free but shares the GIL
+#   "inline"  - directly in the event loop (old behaviour, useful for debugging)
+EXTRACTION_BACKEND = os.getenv("EXTRACTION_BACKEND", "process").lower()
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "0")) or None  # None = os.cpu_count()
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> Optional[Executor]:
+    """Return the shared extraction executor, creating it on first use"""
+    global _executor
+    if EXTRACTION_BACKEND == "inline":
+        return None
+    with _executor_lock:
+        if _executor is None:
+            if EXTRACTION_BACKEND == "thread":
+                _executor = ThreadPoolExecutor(
+                    max_workers=EXTRACTION_WORKERS,
+                    thread_name_prefix="extract",
+                )
+            elif EXTRACTION_BACKEND == "process":
+                # "spawn" so workers never inherit the event loop or server threads
+                _executor = ProcessPoolExecutor(
+                    max_workers=EXTRACTION_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                raise ValueError(f"Unknown EXTRACTION_BACKEND: {EXTRACTION_BACKEND}")
+        return _executor
+
+
+def _discard_executor(broken: Executor):
+    """Drop a broken pool, the next get_executor() starts a new one"""
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_cpu_bound(func: Callable[..., Any], *args: Any) -> Any:
+    """
+    Run a CPU-heavy, picklable function on the extraction backend
+    and await its result without blocking the event loop
+    If a worker process dies (crash, OOM kill on a hostile PDF) the calls
+    running in that pool fail and the pool is replaced for later calls
+    """
+    executor = get_executor()
+    if executor is None:
+        return func(*args)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(executor, partial(func, *args))
+    except BrokenProcessPool:
+        logger.error("Extraction worker died, restarting the process pool")
+        _discard_executor(executor)
+        raise
+
+
+def shutdown_executor():
+    """Stop the extraction workers (called from the app lifespan)"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
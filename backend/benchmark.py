@@ -0,0 +1,1082 @@
+#!/usr/bin/env python3
+"""
+StudyDuel - Benchmark Script
+
+Misst die Antwortzeiten der Polling-Endpoints, während ein großes PDF
+hochgeladen wird. Läuft komplett in-process (ASGI), kein Server nötig.
+
+Usage:
+    python benchmark.py                      # Alle Szenarien
+    python benchmark.py upload --backend inline   # Vergleich: Parsing im Event-Loop
+    python benchmark.py upload --pages 200 --pollers 20
+    python benchmark.py current-rps --requests 5000
+    python benchmark.py memory --pages 500 --backend inline   # Peak-RSS beim Upload
+    python benchmark.py questions            # Fragengenerierung 10 KB / 1 MB / 10 MB
+    python benchmark.py stress --concurrency 32   # Parallele Clients pro Session, prüft Invarianten
+    python benchmark.py sessions --sessions 100000  # Speicher pro Session
+    python benchmark.py codes --codes 1000000   # Session-Codes/Tokens: Tempo, Kollisionen
+    python benchmark.py serialization        # JSON-Serialisierung von /questions (10/100/1000 Fragen)
+    python benchmark.py compression          # Bytes/Zeit von /questions und /deck mit gzip
+    python benchmark.py pollers --pollers 1000 --rounds 10   # Viele gleichzeitige Poller ohne ETag
+    python benchmark.py upload-files --files 8 --pages 50    # Upload-Pipeline: mehrere PDFs, eines defekt
+    python benchmark.py append --files 8     # Datei hinzufügen: nur neues Dokument vs. alles neu generieren
+    python benchmark.py worker-crash         # Extraktions-Worker stirbt: nur dieser Job scheitert, der nächste läuft
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import resource
+import sys
+import time
+from typing import List
+
+
+class Colors:
+    OK = "\033[92m"
+    FAIL = "\033[91m"
+    INFO = "\033[94m"
+    END = "\033[0m"
+
+
+def header(name: str):
+    print(f"\n{Colors.INFO}{'='*60}")
+    print(f"BENCHMARK: {name}")
+    print(f"{'='*60}{Colors.END}\n")
+
+
+def info(msg: str):
+    print(f"{Colors.INFO}ℹ {msg}{Colors.END}")
+
+
+def result(msg: str):
+    print(f"{Colors.OK}✓ {msg}{Colors.END}")
+
+
+def fail(msg: str):
+    print(f"{Colors.FAIL}✗ {msg}{Colors.END}")
+
+
+# ============================================================================
+# Synthetic PDFs
+# ============================================================================
+
+def build_pdf(pages: int, lines_per_page: int = 40) -> bytes:
+    """Build a minimal text-only PDF with the given number of pages"""
+    sentences = [
+        "Was versteht man unter Photosynthese in der Biologie?",
+        "Die Zellatmung bezeichnet den Abbau von Glucose in der Zelle.",
+        "Welche Rolle spielt das Chlorophyll bei der Lichtreaktion?",
+        "Das Verfahren der Destillation trennt Stoffe nach Siedepunkt.",
+    ]
+    objects = []
+    page_ids = []
+    font_id = 3
+    next_id = 4
+    for p in range(pages):
+        lines = []
+        for i in range(lines_per_page):
+            text = f"{p + 1}.{i + 1} {sentences[(p + i) % len(sentences)]}"
+            text = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            lines.append(f"({text}) Tj T*")
+        stream = ("BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(lines) + " ET").encode("latin-1")
+        content_id, page_id = next_id, next_id + 1
+        next_id += 2
+        objects.append((content_id, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"))
+        objects.append((page_id, (
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode()))
+        page_ids.append(page_id)
+
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects = [
+        (1, b"<< /Type /Catalog /Pages 2 0 R >>"),
+        (2, f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode()),
+        (font_id, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"),
+    ] + objects
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id, body in objects:
+        offsets[obj_id] = len(out)
+        out += b"%d 0 obj\n" % obj_id + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for obj_id in range(1, len(objects) + 1):
+        out += b"%010d 00000 n \n" % offsets[obj_id]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def build_corpus(size: int, with_questions: bool = True, seed: int = 0) -> str:
+    """Pseudo-random German-ish lecture text of roughly `size` characters"""
+    rng = random.Random(seed)
+    nouns = ["Photosynthese", "Zellatmung", "Mitochondrien", "Chlorophyll", "Enzymaktivität",
+             "Destillation", "Kristallisation", "Thermodynamik", "Entropie", "Katalyse",
+             "Genexpression", "Proteinbiosynthese", "Osmose", "Diffusion", "Membranpotential"]
+    words = ["der", "die", "das", "und", "wird", "bei", "einer", "durch", "im", "von",
+             "Prozess", "Energie", "Reaktion", "Temperatur", "Struktur", "Funktion",
+             "schnell", "langsam", "zwischen", "innerhalb", "bezeichnet", "Verfahren"]
+    openers = ["Was ist", "Wie funktioniert", "Warum verändert", "Welche Rolle spielt"]
+    parts = []
+    length = 0
+    while length < size:
+        body = " ".join(rng.choice(words + nouns) for _ in range(rng.randint(6, 14)))
+        roll = rng.random()
+        if with_questions and roll < 0.08:
+            sentence = f"{rng.choice(openers)} {body}?"
+        elif roll < 0.12:
+            sentence = f"{rng.choice(nouns)} {body}!"
+        else:
+            sentence = f"{rng.choice(nouns)} {body}."
+        if rng.random() < 0.1:
+            sentence += "\n\n"
+        parts.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(parts)
+
+
+def legacy_generate_questions_from_text(text: str, num_questions: int = 10) -> List[str]:
+    """
+    Reference: generate_questions_from_text before the single-pass rewrite,
+    only used to verify identical output.
+    Extract questions from the text and generate similar ones.
+    Strategy: 
+    1. First, extract existing questions from the document
+    2. Then generate contextual questions from content
+    3. Combine both for variety
+    """
+    questions = []
+    
+    # Clean text and normalize whitespace
+    text = re.sub(r'\s+', ' ', text.strip())
+    
+    if not text or len(text) < 50:
+        return [f"Frage {i+1}: Erklären Sie den Inhalt des Dokuments" for i in range(num_questions)]
+    
+    # ========================================================================
+    # STEP 1: Extract existing questions from the document
+    # ========================================================================
+    extracted_questions = []
+    
+    # Pattern 1: Sentences ending with question mark
+    question_pattern = r'([^.!?]*\?)'
+    potential_questions = re.findall(question_pattern, text)
+    
+    for q in potential_questions:
+        q = q.strip()
+        # Filter out very short or very long questions
+        if 10 < len(q) < 200:
+            # Clean up numbering (e.g., "1.", "a)", etc.)
+            q = re.sub(r'^\s*\d+[\.)]\s*', '', q)
+            q = re.sub(r'^\s*[a-z][\.)]\s*', '', q, flags=re.IGNORECASE)
+            q = q.strip()
+            if q and q not in extracted_questions:
+                extracted_questions.append(q)
+    
+    # Pattern 2: Common question starters (even without ?)
+    question_starters = [
+        r'(?:^|\n)\s*(?:Wie|Was|Warum|Wann|Wo|Welche|Welcher|Welches|Wer|Wozu|Womit|Wodurch)\s+[^.!?]{10,150}[.?]',
+        r'(?:^|\n)\s*(?:Erklären Sie|Beschreiben Sie|Nennen Sie|Erläutern Sie|Definieren Sie)\s+[^.!?]{10,150}[.?]',
+        r'(?:^|\n)\s*(?:Was versteht man unter|Was bedeutet|Was ist)\s+[^.!?]{10,150}[.?]',
+    ]
+    
+    for pattern in question_starters:
+        matches = re.findall(pattern, text, re.MULTILINE | re.IGNORECASE)
+        for match in matches:
+            q = match.strip()
+            if q and q not in extracted_questions and len(q) > 15:
+                # Clean up
+                q = re.sub(r'^\s*\d+[\.)]\s*', '', q)
+                q = re.sub(r'^\s*[a-z][\.)]\s*', '', q, flags=re.IGNORECASE)
+                q = q.strip()
+                if q:
+                    extracted_questions.append(q)
+    
+    # Add extracted questions to our list
+    questions.extend(extracted_questions[:num_questions])
+    
+    
+    # If we have enough questions, return them
+    if len(questions) >= num_questions:
+        return questions[:num_questions]
+    
+    # ========================================================================
+    # STEP 2: Generate additional questions from content
+    # ========================================================================
+    
+    # Identify potential key concepts (words that appear to be important)
+    # Look for capitalized words (except sentence starts), technical terms
+    potential_topics = []
+    
+    # Only generate additional questions if needed
+    remaining_needed = num_questions - len(questions)
+    if remaining_needed <= 0:
+        return questions[:num_questions]
+    
+    
+    # Extract capitalized phrases (potential proper nouns, technical terms)
+    capitalized_pattern = r'\b[A-ZÄÖÜ][a-zäöüß]+(?:\s+[A-ZÄÖÜ][a-zäöüß]+)*\b'
+    for match in re.finditer(capitalized_pattern, text):
+        word = match.group()
+        # Skip common sentence starters
+        if word not in ['Der', 'Die', 'Das', 'Ein', 'Eine', 'Im', 'In', 'Auf', 'Bei', 'Mit', 'Für']:
+            if len(word) > 3 and word not in potential_topics:
+                potential_topics.append(word)
+    
+    # Extract phrases after common patterns
+    concept_patterns = [
+        r'(?:wird bezeichnet als|ist|bedeutet|bezeichnet|definiert als)\s+([^.?!]{10,80})',
+        r'(?:Unter|Begriff|Konzept von)\s+([A-ZÄÖÜ][a-zäöüß\s]{5,50})',
+        r'(?:Verfahren|Methode|Prinzip|Ansatz)\s+(?:der|des|zur)\s+([^.?!]{10,60})'
+    ]
+    
+    for pattern in concept_patterns:
+        for match in re.finditer(pattern, text):
+            concept = match.group(1).strip()
+            if concept and len(concept) > 5:
+                potential_topics.append(concept)
+    
+    # Question templates with more variety
+    templates = [
+        ("Erkläre das Konzept: {}", 0.2),
+        ("Was versteht man unter {}?", 0.2),
+        ("Beschreibe die Bedeutung von: {}", 0.15),
+        ("Welche Rolle spielt {}?", 0.15),
+        ("Wie funktioniert {}?", 0.15),
+        ("Was sind die Hauptmerkmale von {}?", 0.15),
+    ]
+    
+    # Generate questions from topics
+    used_topics = set()
+    for topic in potential_topics[:remaining_needed * 2]:
+        if len(questions) >= num_questions:
+            break
+        
+        # Avoid duplicates
+        topic_lower = topic.lower()
+        if topic_lower in used_topics:
+            continue
+        
+        # Choose template based on weights
+        template = random.choices(
+            [t[0] for t in templates],
+            weights=[t[1] for t in templates],
+            k=1
+        )[0]
+        
+        # Truncate if too long
+        if len(topic) > 80:
+            topic = topic[:77] + "..."
+        
+        questions.append(template.format(topic))
+        used_topics.add(topic_lower)
+    
+    # Fill remaining with sentence-based questions
+    sentence_templates = [
+        "Erläutere folgenden Aspekt: {}",
+        "Was wird mit folgendem gemeint: {}",
+        "Erkläre den Zusammenhang: {}",
+    ]
+    
+    for sentence in sentences:
+        if len(questions) >= num_questions:
+            break
+        
+        # Skip very short or very long sentences
+        if len(sentence) < 30 or len(sentence) > 150:
+            continue
+        
+        # Truncate and add
+        snippet = sentence[:120]
+        if len(sentence) > 120:
+            snippet += "..."
+        
+        template = random.choice(sentence_templates)
+        questions.append(template.format(snippet))
+    
+    # Fill remaining with paragraph-based questions
+    for i, para in enumerate(paragraphs):
+        if len(questions) >= num_questions:
+            break
+        
+        snippet = para[:100]
+        if len(para) > 100:
+            snippet += "..."
+        questions.append(f"Erkläre den Inhalt: {snippet}")
+    
+    # If still not enough, add generic questions
+    while len(questions) < num_questions:
+        questions.append(f"Erläutere einen weiteren wichtigen Aspekt des Themas")
+    
+    return questions[:num_questions]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+async def wait_for_job(client, session_id: str, headers: dict, job_id: str) -> dict:
+    """Poll an upload job until it is finished"""
+    while True:
+        job = (await client.get(f"/session/{session_id}/jobs/{job_id}", headers=headers)).json()
+        if job["status"] in ("done", "failed"):
+            return job
+        await asyncio.sleep(0.05)
+
+
+# ============================================================================
+# Scenarios
+# ============================================================================
+
+async def bench_polling_during_upload(pages: int, pollers: int):
+    """p50/p95/p99 of concurrent /current polls while a large PDF is uploaded"""
+    import httpx
+    from app.main import app, lifespan
+
+    header(f"/current latency during {pages}-page upload ({pollers} pollers)")
+    pdf = build_pdf(pages)
+    info(f"PDF size: {len(pdf) / 1024:.0f} KB")
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            session = (await client.post("/session")).json()
+            session_id = session["session_id"]
+            examiner = {"X-Token": session["examiner_token"]}
+            learner_token = (await client.post(
+                f"/session/{session_id}/join", json={"role": "learner"}
+            )).json()["token"]
+            learner = {"X-Token": learner_token}
+
+            latencies: List[float] = []
+            done = asyncio.Event()
+
+            async def poll():
+                while not done.is_set():
+                    start = time.perf_counter()
+                    await client.get(f"/session/{session_id}/current", headers=learner)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    await asyncio.sleep(0.01)
+
+            async def upload():
+                start = time.perf_counter()
+                response = await client.post(
+                    f"/session/{session_id}/upload",
+                    headers=examiner,
+                    files={"files": ("bench.pdf", pdf, "application/pdf")},
+                    timeout=None,
+                )
+                accepted = time.perf_counter() - start
+                job = await wait_for_job(client, session_id, examiner, response.json()["job_id"])
+                elapsed = time.perf_counter() - start
+                done.set()
+                return response.status_code, accepted, job["status"], elapsed
+
+            poll_tasks = [asyncio.create_task(poll()) for _ in range(pollers)]
+            status, accepted, job_status, elapsed = await upload()
+            await asyncio.gather(*poll_tasks)
+
+    result(f"Upload: HTTP {status} after {accepted:.2f}s, job {job_status} after {elapsed:.2f}s")
+    result(f"Polls: {len(latencies)} requests")
+    if latencies:
+        result(
+            f"/current latency ms  p50={percentile(latencies, 50):.1f}  "
+            f"p95={percentile(latencies, 95):.1f}  p99={percentile(latencies, 99):.1f}  "
+            f"max={max(latencies):.1f}"
+        )
+
+
+async def bench_current_rps(requests: int, concurrency: int):
+    """Requests/sec of authenticated /current polls"""
+    import httpx
+    from app.main import app, lifespan
+
+    header(f"/current throughput ({requests} requests, concurrency {concurrency})")
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            session_id = (await client.post("/session")).json()["session_id"]
+            learner_token = (await client.post(
+                f"/session/{session_id}/join", json={"role": "learner"}
+            )).json()["token"]
+            learner = {"X-Token": learner_token}
+            url = f"/session/{session_id}/current"
+
+            remaining = requests
+
+            async def worker():
+                nonlocal remaining
+                while remaining > 0:
+                    remaining -= 1
+                    await client.get(url, headers=learner)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+
+    result(f"{requests / elapsed:.0f} requests/sec ({elapsed:.2f}s)")
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (Linux reports KB)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def bench_upload_memory(pages: int):
+    """Peak RSS while one large PDF is uploaded and parsed (run in a fresh process)"""
+    import httpx
+    from app.main import app, lifespan
+
+    header(f"Peak RSS for a {pages}-page upload")
+    pdf = build_pdf(pages)
+    info(f"PDF size: {len(pdf) / 1024 / 1024:.1f} MB")
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            session = (await client.post("/session")).json()
+            examiner = {"X-Token": session["examiner_token"]}
+            baseline = peak_rss_mb()
+            start = time.perf_counter()
+            response = await client.post(
+                f"/session/{session['session_id']}/upload",
+                headers=examiner,
+                files={"files": ("bench.pdf", pdf, "application/pdf")},
+                timeout=None,
+            )
+            job = await wait_for_job(client, session["session_id"], examiner, response.json()["job_id"])
+            elapsed = time.perf_counter() - start
+
+    result(f"Upload: HTTP {response.status_code}, job {job['status']} after {elapsed:.2f}s")
+    result(f"Peak RSS: {peak_rss_mb():.0f} MB (before upload: {baseline:.0f} MB)")
+
+
+def bench_questions(num_questions: int):
+    """generate_questions_from_text vs. the pre-rewrite implementation"""
+    from app.utils import generate_questions_from_text
+
+    header(f"Question generation ({num_questions} questions)")
+    for label, size in [("10 KB", 10_000), ("1 MB", 1_000_000), ("10 MB", 10_000_000)]:
+        for kind, with_questions in [("questions", True), ("prose", False)]:
+            corpus = build_corpus(size, with_questions=with_questions, seed=size)
+
+            timings = {}
+            outputs = {}
+            for name, func in [("legacy", legacy_generate_questions_from_text),
+                               ("current", generate_questions_from_text)]:
+                random.seed(1234)
+                start = time.perf_counter()
+                try:
+                    outputs[name] = func(corpus, num_questions=num_questions)
+                except NameError as e:
+                    # The old sentence fallback used undefined names
+                    outputs[name] = type(e).__name__
+                timings[name] = time.perf_counter() - start
+
+            # Regenerating from the same text reuses the cached document index
+            start = time.perf_counter()
+            generate_questions_from_text(corpus, num_questions=num_questions * 2)
+            regenerate = time.perf_counter() - start
+
+            line = (
+                f"{label:>6} {kind:<9}  legacy {timings['legacy'] * 1000:9.1f} ms  "
+                f"current {timings['current'] * 1000:8.2f} ms  "
+                f"x{timings['legacy'] / timings['current']:.0f}  "
+                f"regenerate {regenerate * 1000:7.2f} ms  "
+            )
+            if isinstance(outputs["legacy"], str):
+                result(line + f"legacy={outputs['legacy']} current={len(outputs['current'])} questions")
+            elif outputs["legacy"] == outputs["current"]:
+                result(line + "identical=True")
+            else:
+                print(f"{Colors.FAIL}✗ {line}identical=False{Colors.END}")
+
+async def bench_session_stress(clients: int, rounds: int):
+    """Many concurrent clients mutating one session, checks that no update is lost"""
+    import httpx
+    from app.main import app, lifespan
+
+    header(f"Session stress ({clients} clients x {rounds} rounds)")
+    violations: List[str] = []
+    # Switch threads as often as possible so races show up
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            session = (await client.post("/session")).json()
+            session_id = session["session_id"]
+            examiner = {"X-Token": session["examiner_token"]}
+
+            # Concurrent joins: a token of their own for every learner; the examiner
+            # token only goes back to whoever holds it already
+            joins = await asyncio.gather(*(
+                client.post(f"/session/{session_id}/join", json={"role": role}, headers=headers)
+                for _ in range(clients)
+                for role, headers in (("learner", {}), ("examiner", examiner), ("examiner", {}))
+            ))
+            learner_joins, examiner_joins, foreign_joins = joins[0::3], joins[1::3], joins[2::3]
+            if any(r.status_code != 200 for r in learner_joins + examiner_joins):
+                violations.append(f"join: {sum(r.status_code != 200 for r in learner_joins + examiner_joins)} failed requests")
+            tokens = {r.json()["token"] for r in learner_joins if r.status_code == 200}
+            if len(tokens) != clients:
+                violations.append(f"join: {len(tokens)} different learner tokens for {clients} learners")
+            examiner_tokens = {r.json()["token"] for r in examiner_joins if r.status_code == 200}
+            if examiner_tokens != {session["examiner_token"]}:
+                violations.append(f"join: {len(examiner_tokens)} examiner tokens")
+            if any(r.status_code != 403 for r in foreign_joins):
+                violations.append(f"join: examiner token handed out {sum(r.status_code == 200 for r in foreign_joins)} times")
+            learner = {"X-Token": tokens.pop()}
+
+            deck_size = min(clients * rounds + 1, 500)
+            corpus = build_corpus(50_000, seed=deck_size)
+            await client.post(
+                f"/session/{session_id}/generate",
+                headers=learner,
+                json={"pdf_texts": {"bench.pdf": corpus}, "num_questions": deck_size},
+            )
+
+            # Concurrent next: every 200 must advance the index by exactly one
+            async def advance(n: int) -> List[int]:
+                return [
+                    (await client.post(f"/session/{session_id}/next", headers=examiner)).status_code
+                    for _ in range(n)
+                ]
+
+            statuses = [code for codes in await asyncio.gather(
+                *(advance(rounds) for _ in range(clients))
+            ) for code in codes]
+            state = (await client.get(f"/session/{session_id}/questions", headers=examiner)).json()
+            advanced = statuses.count(200)
+            if state["current_index"] != min(advanced, deck_size - 1):
+                violations.append(f"next: {advanced} successful calls, index is {state['current_index']}")
+            if any(code not in (200, 400) for code in statuses):
+                violations.append(f"next: {sum(code not in (200, 400) for code in statuses)} failed requests")
+            result(f"next: {advanced} advanced, final index {state['current_index']}")
+
+            # Concurrent grades of different questions: none may get lost
+            graded = list(range(min(clients * rounds, deck_size)))
+            responses = await asyncio.gather(*(
+                client.post(f"/session/{session_id}/grade", headers=examiner,
+                            json={"index": index, "status": "ok"})
+                for index in graded
+            ))
+            if any(r.status_code != 200 for r in responses):
+                violations.append(f"grade: {sum(r.status_code != 200 for r in responses)} failed requests")
+            state = (await client.get(f"/session/{session_id}/questions", headers=examiner)).json()
+            if len(state["grades"]) != len(graded):
+                violations.append(f"grade: {len(graded)} graded, {len(state['grades'])} stored")
+            result(f"grade: {len(state['grades'])}/{len(graded)} stored")
+
+            # Reveal / jump while learners poll: a learner may only see questions
+            # the examiner revealed, and only the current one
+            deck = state["questions"]
+            stop = asyncio.Event()
+            revealing = set()
+            polls = 0
+
+            async def examine():
+                for index in range(len(deck)):
+                    await client.post(f"/session/{session_id}/jump/{index}", headers=examiner)
+                    revealing.add(index)
+                    await client.post(f"/session/{session_id}/reveal", headers=examiner)
+                stop.set()
+
+            async def watch():
+                nonlocal polls
+                while not stop.is_set():
+                    current = (await client.get(f"/session/{session_id}/current", headers=learner)).json()
+                    polls += 1
+                    if current["status"] == "revealed" and (
+                        current["question"] != deck[current["index"]] or current["index"] not in revealing
+                    ):
+                        violations.append(f"current: question {current['index']} shown before it was revealed")
+                    if current["status"] == "locked" and "question" in current:
+                        violations.append("current: locked state leaks the question")
+                    # In-process requests to async routes may never yield to the loop
+                    await asyncio.sleep(0)
+
+            await asyncio.gather(examine(), *(watch() for _ in range(clients)))
+            result(f"reveal/jump: {polls} learner polls checked")
+
+            # Regenerate while examiners read the deck
+            async def regenerate():
+                for i in range(rounds):
+                    r = await client.post(
+                        f"/session/{session_id}/generate",
+                        headers=learner,
+                        json={"pdf_texts": {"bench.pdf": corpus}, "num_questions": 10 + i},
+                    )
+                    if r.status_code != 200:
+                        violations.append(f"generate: HTTP {r.status_code}")
+
+            async def read():
+                for _ in range(rounds):
+                    r = await client.get(f"/session/{session_id}/questions", headers=examiner)
+                    if r.status_code != 200:
+                        violations.append(f"questions: HTTP {r.status_code}")
+
+            await asyncio.gather(regenerate(), *(read() for _ in range(clients)))
+
+    sys.setswitchinterval(switch_interval)
+    if violations:
+        for violation in violations[:10]:
+            print(f"{Colors.FAIL}✗ {violation}{Colors.END}")
+        print(f"{Colors.FAIL}✗ {len(violations)} invariant violations{Colors.END}")
+    else:
+        result("No invariant violations")
+
+
+def bench_session_memory(count: int):
+    """Bytes per session for many idle sessions (run in a fresh process)"""
+    import gc
+    import tracemalloc
+    from app.models import store
+    from app.services import SessionService
+
+    header(f"Memory of {count} sessions")
+    # One lecture shared by all sessions: half get the default deck, half a
+    # longer deck that is generated batch-wise
+    lecture = {"lecture.pdf": build_corpus(5_000, seed=1)}
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    for i in range(count):
+        session_id, _ = SessionService.create_session()
+        session = store.get_session(session_id)
+        SessionService.join_session(session_id, "learner")
+        SessionService.add_pdf_metadata(session, "lecture.pdf", 2_500_000)
+        SessionService.generate_questions(session, lecture, 10 if i % 2 else 30)
+        for index in range(3):
+            SessionService.grade_question(session, index, "ok")
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    result(f"{count} sessions created in {elapsed:.1f}s")
+    result(f"{used / 1024 / 1024:.1f} MB traced, {used / count:.0f} bytes per session")
+
+
+async def bench_serialization(requests: int):
+    """Cost of serializing GET /questions: plain dict vs. response model (vs. orjson)"""
+    import httpx
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from app.main import app, lifespan, DefaultResponse
+    from app.models import store
+    from app.schemas import SessionStatus
+    from app.services import SessionService
+
+    header(f"Serialization of /questions (response class {DefaultResponse.__name__})")
+    corpus = {"lecture.pdf": build_corpus(200_000, seed=7)}
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for count in (10, 100, 1000):
+                session_id, examiner_token = SessionService.create_session()
+                session = store.get_session(session_id)
+                SessionService.generate_questions(session, corpus, count)
+                SessionService._ensure_questions(session, count - 1)
+                for index in range(0, count, 3):
+                    SessionService.grade_question(session, index, "ok")
+                status = SessionService.get_session_status(session)
+
+                # What FastAPI does per request without / with a response model
+                rounds = max(20, 20_000 // count)
+                variants = [
+                    ("dict + jsonable_encoder", lambda: JSONResponse(jsonable_encoder(status)).body),
+                    ("model + JSONResponse   ", lambda: JSONResponse(
+                        SessionStatus.model_validate(status).model_dump(mode="json")).body),
+                    # Newer FastAPI: response models straight to JSON bytes
+                    ("model_dump_json        ", lambda: SessionStatus.model_validate(status).model_dump_json()),
+                ]
+                try:
+                    import orjson
+                    variants.append(("model + orjson         ", lambda: orjson.dumps(
+                        SessionStatus.model_validate(status).model_dump(mode="json"))))
+                except ImportError:
+                    pass
+                for name, serialize in variants:
+                    start = time.perf_counter()
+                    for _ in range(rounds):
+                        body = serialize()
+                    elapsed = (time.perf_counter() - start) / rounds
+                    result(f"{count:5} questions  {name}  {elapsed * 1e6:8.1f} us  ({len(body)} bytes)")
+
+                # End to end through the app
+                headers = {"X-Token": examiner_token}
+                url = f"/session/{session_id}/questions"
+                rounds = max(10, requests // count)
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    response = await client.get(url, headers=headers)
+                elapsed = (time.perf_counter() - start) / rounds
+                info(f"{count:5} questions  GET /questions          {elapsed * 1e6:8.1f} us  "
+                     f"(status {response.status_code})")
+
+
+async def bench_compression(requests: int):
+    """Bytes on the wire and latency of /questions and /deck, identity vs. gzip"""
+    import httpx
+    from app.main import app, lifespan
+    from app.models import store
+    from app.services import SessionService
+
+    header("Response compression (/questions vs. /deck)")
+    corpus = {"lecture.pdf": build_corpus(200_000, seed=7)}
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for count in (100, 1000):
+                session_id, examiner_token = SessionService.create_session()
+                session = store.get_session(session_id)
+                SessionService.generate_questions(session, corpus, count)
+                SessionService._ensure_questions(session, count - 1)
+
+                rounds = max(10, requests // count)
+                for path in ("questions", "deck"):
+                    url = f"/session/{session_id}/{path}"
+                    for encoding in ("identity", "gzip"):
+                        headers = {"X-Token": examiner_token, "Accept-Encoding": encoding}
+                        start = time.perf_counter()
+                        for _ in range(rounds):
+                            response = await client.get(url, headers=headers)
+                        elapsed = (time.perf_counter() - start) / rounds
+                        wire = int(response.headers["content-length"])
+                        result(f"{count:5} questions  /{path:9} {encoding:8}  {wire:8} bytes  "
+                               f"{elapsed * 1e6:8.1f} us")
+
+
+async def bench_pollers(pollers: int, rounds: int):
+    """Many concurrent pollers without ETags: every poll gets a full /current or /questions body"""
+    import httpx
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from app.main import app, lifespan
+    from app.models import store
+    from app.services import SessionService
+
+    sessions = max(1, pollers // 100)
+    header(f"{pollers} concurrent pollers in {sessions} sessions ({rounds} polls each)")
+    corpus = {"lecture.pdf": build_corpus(100_000, seed=3)}
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            setups = []
+            for _ in range(sessions):
+                session_id, examiner_token = SessionService.create_session()
+                session = store.get_session(session_id)
+                SessionService.generate_questions(session, corpus, 200)
+                setups.append((session, examiner_token))
+
+            # One examiner per session polls /questions for new questions, the rest are learners
+            clients = []
+            for number in range(pollers):
+                session, examiner_token = setups[number % sessions]
+                if number < sessions:
+                    clients.append(("questions", session, examiner_token))
+                else:
+                    clients.append(("current", session, SessionService.join_session(session.id, "learner")))
+
+            latencies = {"current": [], "questions": []}
+            done = asyncio.Event()
+
+            async def poll(kind: str, session, token: str):
+                headers = {"X-Token": token}
+                url = f"/session/{session.id}/{kind}"
+                params = {"offset": len(session.questions)} if kind == "questions" else None
+                for _ in range(rounds):
+                    start = time.perf_counter()
+                    await client.get(url, headers=headers, params=params)
+                    latencies[kind].append((time.perf_counter() - start) * 1000)
+
+            async def examiner(session, examiner_token: str):
+                # Keeps the sessions changing: every change is a new version to serialize
+                headers = {"X-Token": examiner_token}
+                while not done.is_set():
+                    await client.post(f"/session/{session.id}/reveal", headers=headers)
+                    await client.post(f"/session/{session.id}/next", headers=headers)
+                    await asyncio.sleep(0.05)
+
+            drivers = [asyncio.create_task(examiner(*setup)) for setup in setups]
+            start = time.perf_counter()
+            await asyncio.gather(*(poll(*c) for c in clients))
+            elapsed = time.perf_counter() - start
+            done.set()
+            await asyncio.gather(*drivers)
+
+        total = sum(len(values) for values in latencies.values())
+        result(f"{total / elapsed:.0f} polls/sec ({total} polls in {elapsed:.2f}s)")
+        for kind, values in latencies.items():
+            result(f"/{kind:9}  p50={percentile(values, 50):.1f}  p95={percentile(values, 95):.1f}  "
+                   f"p99={percentile(values, 99):.1f}  max={max(values):.1f} ms")
+
+        # Per poll: building the response vs. picking up the snapshot
+        session = setups[0][0]
+        n = 20_000
+        views = [
+            ("/current   built per poll", lambda: JSONResponse(jsonable_encoder(
+                SessionService.get_learner_current(session))).body),
+            ("/questions built per poll", lambda: JSONResponse(jsonable_encoder(
+                SessionService.get_session_status(session, len(session.questions)))).body),
+            ("snapshot                 ", lambda: SessionService.get_snapshot(session).learner),
+        ]
+        for name, build in views:
+            start = time.perf_counter()
+            for _ in range(n):
+                build()
+            info(f"{name}  {(time.perf_counter() - start) / n * 1e6:6.2f} us")
+
+
+async def bench_upload_pipeline(files: int, pages: int):
+    """Job time for a multi-file upload (plus one broken file), one file at a time vs. concurrently"""
+    import httpx
+    from app import main
+    from app.main import app, lifespan
+
+    header(f"Upload pipeline: {files} PDFs x {pages} pages + 1 broken file")
+    # Different page counts: different content, so the text cache does not answer
+    pdfs = [build_pdf(pages + i) for i in range(files)]
+    concurrency = main.UPLOAD_CONCURRENCY
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # Warm up the extraction workers
+            session = (await client.post("/session")).json()
+            examiner = {"X-Token": session["examiner_token"]}
+            response = await client.post(f"/session/{session['session_id']}/upload", headers=examiner,
+                                         files={"files": ("warmup.pdf", build_pdf(1), "application/pdf")})
+            await wait_for_job(client, session["session_id"], examiner, response.json()["job_id"])
+
+            for limit in (1, concurrency):
+                main.UPLOAD_CONCURRENCY = limit
+                main.pdf_text_cache._entries.clear()
+                session = (await client.post("/session")).json()
+                examiner = {"X-Token": session["examiner_token"]}
+                upload = [("files", (f"part{i}.pdf", pdf, "application/pdf")) for i, pdf in enumerate(pdfs)]
+                upload.append(("files", ("broken.pdf", b"%PDF-1.4 broken", "application/pdf")))
+                start = time.perf_counter()
+                response = await client.post(f"/session/{session['session_id']}/upload", headers=examiner,
+                                             files=upload, params={"num_questions": 50}, timeout=None)
+                job = await wait_for_job(client, session["session_id"], examiner, response.json()["job_id"])
+                elapsed = time.perf_counter() - start
+
+                failed = [f["filename"] for f in job["files"] if f["status"] == "failed"]
+                extract = sum(f["timings"].get("extract", 0) for f in job["files"])
+                (result if job["status"] == "done" else fail)(
+                    f"UPLOAD_CONCURRENCY={limit}: job {job['status']} after {elapsed:.2f}s, "
+                    f"{job['question_count']} questions, failed: {', '.join(failed) or '-'}"
+                )
+                info(f"  sum of per-file extraction time {extract:.2f}s")
+            main.UPLOAD_CONCURRENCY = concurrency
+
+
+async def bench_worker_crash(pages: int):
+    """A killed extraction worker fails the running job only, the next upload works again"""
+    import signal
+    import httpx
+    from app import main, workers
+    from app.main import app, lifespan
+
+    header(f"Extraction worker killed during a {pages}-page upload")
+    if workers.EXTRACTION_BACKEND != "process":
+        info("Only meaningful with EXTRACTION_BACKEND=process, skipped")
+        return
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            session = (await client.post("/session")).json()
+            session_id = session["session_id"]
+            examiner = {"X-Token": session["examiner_token"]}
+
+            async def upload(name: str, pdf: bytes) -> str:
+                response = await client.post(f"/session/{session_id}/upload", headers=examiner,
+                                             files={"files": (name, pdf, "application/pdf")}, timeout=None)
+                return response.json()["job_id"]
+
+            # Kill every worker process while the file is being extracted
+            main.pdf_text_cache._entries.clear()
+            job_id = await upload("large.pdf", build_pdf(pages))
+            while True:
+                job = (await client.get(f"/session/{session_id}/jobs/{job_id}", headers=examiner)).json()
+                if job["files"][0]["status"] != "queued":
+                    break
+                await asyncio.sleep(0.01)
+            executor = workers.get_executor()
+            for process in list(executor._processes.values()):
+                os.kill(process.pid, signal.SIGKILL)
+            job = await wait_for_job(client, session_id, examiner, job_id)
+            crashed = job["files"][0]
+            (result if crashed["status"] == "failed" else fail)(
+                f"job with the killed worker: file {crashed['status']} ({crashed.get('error') or '-'})"
+            )
+
+            for attempt in range(2):
+                job = await wait_for_job(client, session_id, examiner, await upload(f"next{attempt}.pdf", build_pdf(3 + attempt)))
+                (result if job["files"][0]["status"] == "done" else fail)(
+                    f"upload {attempt + 1} after the crash: file {job['files'][0]['status']}, "
+                    f"{job['question_count']} questions"
+                )
+            (result if workers.get_executor() is not executor else fail)("process pool was replaced")
+
+
+def bench_append(files: int, num_questions: int):
+    """Latency of adding one document to a session: append vs. regenerating from all documents"""
+    from app.cache import document_index_cache, question_cache
+    from app.models import store
+    from app.services import SessionService
+
+    header(f"Adding documents one by one ({files} x 1 MB, {num_questions} questions each)")
+    documents = {f"lecture{i}.pdf": build_corpus(1_000_000, seed=100 + i) for i in range(files)}
+    sessions = {}
+    for mode in ("regenerate", "append"):
+        session_id, _ = SessionService.create_session()
+        sessions[mode] = store.get_session(session_id)
+
+    names = list(documents)
+    for count in range(1, files + 1):
+        added = {name: documents[name] for name in names[count - 1:count]}
+        timings = {}
+        for mode, session in sessions.items():
+            # Cold caches: the material is scanned (and indexed) again where it is used
+            document_index_cache._entries.clear()
+            question_cache._entries.clear()
+            start = time.perf_counter()
+            if mode == "append":
+                SessionService.generate_questions(session, added, num_questions, append=True)
+            else:
+                everything = {name: documents[name] for name in names[:count]}
+                SessionService.generate_questions(session, everything, num_questions * count)
+            timings[mode] = time.perf_counter() - start
+        result(
+            f"{count} documents: regenerate {timings['regenerate'] * 1000:8.1f} ms  "
+            f"append {timings['append'] * 1000:7.1f} ms  "
+            f"({sessions['append'].question_count} questions)"
+        )
+
+
+def bench_codes(count: int, sessions: int):
+    """Session code / token generation and collision-free allocation"""
+    import string
+    from app import services
+    from app.models import SessionExistsError, store
+    from app.services import SessionService
+    from app.utils import generate_session_code, generate_token
+
+    header(f"Session codes and tokens ({count} generated, {sessions} allocated)")
+
+    # Previous implementation (random.choices, predictable Mersenne Twister)
+    code_chars = string.ascii_uppercase + string.digits
+    token_chars = string.ascii_letters + string.digits
+    for name, generate in [
+        ("legacy code ", lambda: ''.join(random.choices(code_chars, k=8))),
+        ("code        ", generate_session_code),
+        ("legacy token", lambda: ''.join(random.choices(token_chars, k=32))),
+        ("token       ", generate_token),
+    ]:
+        start = time.perf_counter()
+        for _ in range(count):
+            generate()
+        elapsed = time.perf_counter() - start
+        result(f"{name}: {elapsed * 1e9 / count:6.0f} ns each ({count / elapsed / 1e6:.2f} M/s)")
+
+    codes = [generate_session_code() for _ in range(count)]
+    expected = count * (count - 1) / 2 / 2 ** 40
+    result(f"{count - len(set(codes))} duplicate codes among {count} (expected ~{expected:.2f})")
+
+    # Allocation through the store, a taken code must never be overwritten
+    start = time.perf_counter()
+    created = [SessionService.create_session()[0] for _ in range(sessions)]
+    elapsed = time.perf_counter() - start
+    distinct = len(set(created))
+    stored = sum(1 for session_id in created if store.get_session(session_id) is not None)
+    result(f"{sessions} sessions allocated in {elapsed:.1f}s ({sessions / elapsed:.0f}/s)")
+    (result if distinct == stored == sessions else fail)(f"{distinct} distinct ids, {stored} in the store")
+
+    try:
+        store.create_session(created[0])
+        fail("create_session overwrote an existing session")
+    except SessionExistsError:
+        result("create_session rejects a taken code")
+
+    # Forced collisions: the first codes drawn are all taken
+    draws = iter(created[:3] + [generate_session_code()])
+    original = services.generate_session_code
+    services.generate_session_code = lambda: next(draws)
+    try:
+        session_id, _ = SessionService.create_session()
+    finally:
+        services.generate_session_code = original
+    (result if session_id not in created else fail)(f"3 collisions retried, got {session_id}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="StudyDuel benchmarks")
+    parser.add_argument("scenario", nargs="?", default="all",
+                        choices=["all", "upload", "current-rps", "memory", "questions", "stress", "sessions", "codes", "serialization",
+                                 "compression", "pollers",
+                                 "upload-files", "append", "worker-crash"])
+    parser.add_argument("--backend", choices=["process", "thread", "inline"], default=None,
+                        help="EXTRACTION_BACKEND to benchmark")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--pollers", type=int, default=None, help="default: 20 (upload), 1000 (pollers)")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--codes", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    if args.backend:
+        os.environ["EXTRACTION_BACKEND"] = args.backend
+    info(f"EXTRACTION_BACKEND={os.getenv('EXTRACTION_BACKEND', 'process')}")
+
+    if args.scenario in ("all", "upload"):
+        asyncio.run(bench_polling_during_upload(args.pages, args.pollers or 20))
+    if args.scenario in ("all", "current-rps"):
+        asyncio.run(bench_current_rps(args.requests, args.concurrency))
+    if args.scenario in ("all", "questions"):
+        bench_questions(args.questions)
+    if args.scenario in ("all", "stress"):
+        asyncio.run(bench_session_stress(args.concurrency, args.rounds))
+    if args.scenario == "memory":
+        # Not part of "all": peak RSS only means something in a fresh process
+        asyncio.run(bench_upload_memory(args.pages))
+    if args.scenario == "sessions":
+        bench_session_memory(args.sessions)
+    if args.scenario in ("all", "serialization"):
+        asyncio.run(bench_serialization(args.requests))
+    if args.scenario in ("all", "compression"):
+        asyncio.run(bench_compression(args.requests))
+    if args.scenario in ("all", "pollers"):
+        asyncio.run(bench_pollers(args.pollers or 1000, args.rounds))
+    if args.scenario == "upload-files":
+        asyncio.run(bench_upload_pipeline(args.files, args.pages))
+    if args.scenario == "append":
+        bench_append(args.files, args.questions)
+    if args.scenario == "worker-crash":
+        asyncio.run(bench_worker_crash(args.pages))
+    if args.scenario == "codes":
+        bench_codes(args.codes, args.sessions)
+
+
+if __name__ == "__main__":
+    main()
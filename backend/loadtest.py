@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+StudyDuel - Load Test
+
+Simuliert ganze Klassen in-process (ASGI, kein Server, kein Netzwerk):
+N Sessions mit je einem Examiner, der /questions pollt und durch die Fragen
+blättert, und M Learnern, die /current pollen - optional mit parallelen
+PDF-Uploads. Pro Szenario: Durchsatz, p50/p95/p99 pro Route und RSS.
+
+Usage:
+    python loadtest.py                                    # Alle Szenarien
+    python loadtest.py poll --sessions 50 --learners 30 --duration 10
+    python loadtest.py poll --think-ms 1000               # Wie das Frontend: 1 Poll/Sekunde
+    python loadtest.py mixed --uploads 4 --pages 100      # Polling + parallele Uploads
+    python loadtest.py lifecycle --sessions 20            # Erstellen -> Upload -> alle Fragen bewerten
+    python loadtest.py --json results.json                # Ergebnisse als JSON ("-" = stdout)
+    python loadtest.py --json new.json --compare old.json # Regressionen gegenüber einem früheren Lauf
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from benchmark import Colors, build_corpus, build_pdf, fail, header, info, peak_rss_mb, percentile, result, wait_for_job
+
+# Statuses that are not errors, per route
+EXPECTED = {
+    "GET /current": (200, 304),
+    "GET /questions": (200, 304),
+    "POST /upload": (202,),
+}
+
+
+def current_rss_mb() -> Optional[float]:
+    """Resident set size of this process in MB right now (Linux only)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+class Recorder:
+    """Latencies (ms) and unexpected statuses per route of one scenario"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def request(self, client, method: str, path: str, route: str, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, path, **kwargs)
+        self.latencies[route].append((time.perf_counter() - start) * 1000)
+        if response.status_code not in EXPECTED.get(route, (200,)):
+            self.errors[route] += 1
+        return response
+
+    def summary(self, elapsed: float, **extra) -> dict:
+        routes = {}
+        for route, values in sorted(self.latencies.items()):
+            routes[route] = {
+                "requests": len(values),
+                "errors": self.errors.get(route, 0),
+                "rps": round(len(values) / elapsed, 1),
+                "p50_ms": round(percentile(values, 50), 3),
+                "p95_ms": round(percentile(values, 95), 3),
+                "p99_ms": round(percentile(values, 99), 3),
+                "max_ms": round(max(values), 3),
+            }
+        requests = sum(route["requests"] for route in routes.values())
+        rss = current_rss_mb()
+        summary = {
+            "duration_s": round(elapsed, 3),
+            "requests": requests,
+            "errors": sum(route["errors"] for route in routes.values()),
+            "throughput_rps": round(requests / elapsed, 1),
+            "rss_mb": None if rss is None else round(rss, 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "routes": routes,
+        }
+        summary.update(extra)
+        return summary
+
+
+def report(summary: dict):
+    result(f"{summary['requests']} requests in {summary['duration_s']:.2f}s, "
+           f"{summary['throughput_rps']:.0f} requests/sec, {summary['errors']} errors")
+    for route, stats in summary["routes"].items():
+        line = (f"{route:18} {stats['requests']:7}  p50={stats['p50_ms']:.1f}  p95={stats['p95_ms']:.1f}  "
+                f"p99={stats['p99_ms']:.1f}  max={stats['max_ms']:.1f} ms")
+        (fail if stats["errors"] else result)(line + (f"  ({stats['errors']} errors)" if stats["errors"] else ""))
+    rss = "n/a" if summary["rss_mb"] is None else f"{summary['rss_mb']:.0f} MB"
+    info(f"RSS: {rss} (peak {summary['peak_rss_mb']:.0f} MB)")
+
+
+# ============================================================================
+# Simulated clients
+# ============================================================================
+
+async def open_session(client, recorder: Recorder, learners: int) -> dict:
+    """New session with one examiner and `learners` joined learners"""
+    created = (await recorder.request(client, "POST", "/session", "POST /session")).json()
+    session_id = created["session_id"]
+    tokens = []
+    for _ in range(learners):
+        response = await recorder.request(
+            client, "POST", f"/session/{session_id}/join", "POST /join", json={"role": "learner"}
+        )
+        tokens.append(response.json()["token"])
+    return {"id": session_id, "examiner": created["examiner_token"], "learners": tokens}
+
+
+async def poll_current(client, recorder: Recorder, session: dict, token: str, think: float, done: asyncio.Event):
+    """Learner: poll /current, revalidating with the last ETag like a browser cache"""
+    headers = {"X-Token": token}
+    url = f"/session/{session['id']}/current"
+    while not done.is_set():
+        response = await recorder.request(client, "GET", url, "GET /current", headers=headers)
+        if "etag" in response.headers:
+            headers["If-None-Match"] = response.headers["etag"]
+        await asyncio.sleep(think)
+
+
+async def poll_questions(client, recorder: Recorder, session: dict, think: float, done: asyncio.Event):
+    """Examiner: poll /questions for questions not loaded yet, like the examiner page"""
+    headers = {"X-Token": session["examiner"]}
+    url = f"/session/{session['id']}/questions"
+    loaded = 0
+    while not done.is_set():
+        response = await recorder.request(
+            client, "GET", url, "GET /questions", headers=headers, params={"offset": loaded}
+        )
+        if response.status_code == 200:
+            data = response.json()
+            loaded = data["offset"] + len(data["questions"])
+            headers["If-None-Match"] = response.headers["etag"]
+        await asyncio.sleep(think)
+
+
+async def drive_examiner(client, recorder: Recorder, session: dict, question_count: int, step: float,
+                         done: asyncio.Event):
+    """Examiner: reveal, grade and advance every `step` seconds, wrapping around at the end"""
+    headers = {"X-Token": session["examiner"]}
+    base = f"/session/{session['id']}"
+    index = 0
+    while not done.is_set():
+        await asyncio.sleep(step)
+        await recorder.request(client, "POST", f"{base}/reveal", "POST /reveal", headers=headers)
+        await recorder.request(client, "POST", f"{base}/grade", "POST /grade", headers=headers,
+                               json={"index": index, "status": "ok"})
+        if index + 1 < question_count:
+            await recorder.request(client, "POST", f"{base}/next", "POST /next", headers=headers)
+            index += 1
+        else:
+            await recorder.request(client, "POST", f"{base}/jump/0", "POST /jump", headers=headers)
+            index = 0
+
+
+async def upload(client, recorder: Recorder, session: dict, pdf: bytes, question_count: int) -> dict:
+    """Upload one PDF and wait for its job; returns the job with its wall time"""
+    headers = {"X-Token": session["examiner"]}
+    start = time.perf_counter()
+    response = await recorder.request(
+        client, "POST", f"/session/{session['id']}/upload", "POST /upload", headers=headers,
+        params={"num_questions": question_count}, files={"files": ("load.pdf", pdf, "application/pdf")},
+        timeout=None,
+    )
+    if response.status_code != 202:
+        return {"status": "failed", "seconds": time.perf_counter() - start}
+    job = await wait_for_job(client, session["id"], headers, response.json()["job_id"])
+    job["seconds"] = time.perf_counter() - start
+    return job
+
+
+# ============================================================================
+# Scenarios
+# ============================================================================
+
+async def scenario_poll(args, uploads: int = 0) -> dict:
+    """N sessions polled by their examiner and M learners each, optionally during uploads"""
+    import httpx
+    from app.main import app, lifespan
+
+    name = "mixed" if uploads else "poll"
+    header(f"{name}: {args.sessions} sessions x {args.learners} learners, {args.duration:.0f}s"
+           + (f", {uploads} uploads of {args.pages} pages" if uploads else ""))
+    corpus = {"lecture.pdf": build_corpus(100_000, seed=1)}
+    pdf = build_pdf(args.pages) if uploads else b""
+    think = args.think_ms / 1000
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load") as client:
+            setup = Recorder()
+            sessions = [await open_session(client, setup, args.learners) for _ in range(args.sessions)]
+            for session in sessions:
+                # Generating is a learner action; with --learners 0 a learner joins just for it
+                learner = session["learners"][0] if session["learners"] else (await setup.request(
+                    client, "POST", f"/session/{session['id']}/join", "POST /join", json={"role": "learner"}
+                )).json()["token"]
+                await setup.request(
+                    client, "POST", f"/session/{session['id']}/generate", "POST /generate",
+                    headers={"X-Token": learner},
+                    json={"pdf_texts": corpus, "num_questions": args.questions},
+                )
+            upload_sessions = [await open_session(client, setup, 0) for _ in range(uploads)]
+            if setup.errors:
+                fail(f"Setup failed: {dict(setup.errors)}")
+
+            recorder = Recorder()
+            done = asyncio.Event()
+            tasks = []
+            for session in sessions:
+                tasks.append(poll_questions(client, recorder, session, think, done))
+                tasks.append(drive_examiner(client, recorder, session, args.questions, args.step_ms / 1000, done))
+                tasks += [poll_current(client, recorder, session, token, think, done)
+                          for token in session["learners"]]
+            upload_tasks = [asyncio.create_task(upload(client, recorder, session, pdf, args.questions))
+                            for session in upload_sessions]
+
+            start = time.perf_counter()
+            running = [asyncio.create_task(task) for task in tasks]
+            await asyncio.sleep(args.duration)
+            jobs = await asyncio.gather(*upload_tasks)
+            done.set()
+            await asyncio.gather(*running)
+            elapsed = time.perf_counter() - start
+
+    extra = {}
+    if uploads:
+        seconds = [job["seconds"] for job in jobs]
+        extra["uploads"] = {
+            "count": len(jobs),
+            "failed": sum(job["status"] != "done" for job in jobs),
+            "pages": args.pages,
+            "p50_s": round(percentile(seconds, 50), 3),
+            "max_s": round(max(seconds), 3),
+        }
+    summary = recorder.summary(elapsed, **extra)
+    report(summary)
+    if uploads:
+        stats = summary["uploads"]
+        (fail if stats["failed"] else result)(
+            f"Uploads: {stats['count']} jobs, {stats['failed']} failed, "
+            f"p50={stats['p50_s']:.2f}s  max={stats['max_s']:.2f}s"
+        )
+    return summary
+
+
+async def scenario_lifecycle(args) -> dict:
+    """Whole sessions end to end: create, join, upload, walk through and grade every question"""
+    import httpx
+    from app.main import app, lifespan
+
+    header(f"lifecycle: {args.sessions} sessions x {args.learners} learners, "
+           f"{args.questions} questions, {args.pages}-page PDF")
+    pdf = build_pdf(args.pages)
+
+    async def run_session(client, recorder: Recorder) -> bool:
+        session = await open_session(client, recorder, args.learners)
+        base = f"/session/{session['id']}"
+        examiner = {"X-Token": session["examiner"]}
+        job = await upload(client, recorder, session, pdf, args.questions)
+        if job["status"] != "done":
+            return False
+        for index in range(job["question_count"]):
+            await recorder.request(client, "GET", f"{base}/questions", "GET /questions", headers=examiner,
+                                   params={"offset": index})
+            await recorder.request(client, "POST", f"{base}/reveal", "POST /reveal", headers=examiner)
+            await asyncio.gather(*(
+                recorder.request(client, "GET", f"{base}/current", "GET /current", headers={"X-Token": token})
+                for token in session["learners"]
+            ))
+            await recorder.request(client, "POST", f"{base}/grade", "POST /grade", headers=examiner,
+                                   json={"index": index, "status": "ok"})
+            if index + 1 < job["question_count"]:
+                await recorder.request(client, "POST", f"{base}/next", "POST /next", headers=examiner)
+        return True
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load") as client:
+            recorder = Recorder()
+            start = time.perf_counter()
+            completed = await asyncio.gather(*(run_session(client, recorder) for _ in range(args.sessions)))
+            elapsed = time.perf_counter() - start
+
+    summary = recorder.summary(elapsed, sessions_completed=sum(completed),
+                               sessions_per_sec=round(sum(completed) / elapsed, 2))
+    report(summary)
+    (fail if sum(completed) < args.sessions else result)(
+        f"{sum(completed)}/{args.sessions} sessions completed ({summary['sessions_per_sec']:.1f}/s)"
+    )
+    return summary
+
+
+# ============================================================================
+# JSON output and comparison
+# ============================================================================
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> int:
+    """Print throughput and p95/p99 changes per scenario; returns the number of regressions"""
+    header(f"Comparison with {baseline['meta'].get('commit') or 'baseline'} (tolerance {tolerance:.0f}%)")
+    regressions = 0
+
+    def check(label: str, old: float, new: float, higher_is_better: bool):
+        nonlocal regressions
+        if not old:
+            return
+        change = (new - old) / old * 100
+        worse = -change if higher_is_better else change
+        line = f"{label:44} {old:10.2f} -> {new:10.2f}  ({change:+.1f}%)"
+        if worse > tolerance:
+            regressions += 1
+            fail(line)
+        else:
+            result(line)
+
+    for name, scenario in current["scenarios"].items():
+        old = baseline["scenarios"].get(name)
+        if old is None:
+            info(f"{name}: not in baseline")
+            continue
+        check(f"{name} requests/sec", old["throughput_rps"], scenario["throughput_rps"], True)
+        for route, stats in scenario["routes"].items():
+            old_stats = old["routes"].get(route)
+            if old_stats is None:
+                continue
+            check(f"{name} {route} p95 ms", old_stats["p95_ms"], stats["p95_ms"], False)
+            check(f"{name} {route} p99 ms", old_stats["p99_ms"], stats["p99_ms"], False)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="StudyDuel load test (in-process)")
+    parser.add_argument("scenario", nargs="?", default="all", choices=["all", "poll", "mixed", "lifecycle"])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--learners", type=int, default=10, help="learners per session")
+    parser.add_argument("--questions", type=int, default=20, help="questions per session")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of polling (poll, mixed)")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="pause between two polls of one client")
+    parser.add_argument("--step-ms", type=float, default=200.0, help="pause between two examiner actions")
+    parser.add_argument("--uploads", type=int, default=4, help="concurrent uploads (mixed)")
+    parser.add_argument("--pages", type=int, default=50, help="pages per synthetic PDF")
+    parser.add_argument("--backend", choices=["process", "thread", "inline"], default=None,
+                        help="EXTRACTION_BACKEND")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+    parser.add_argument("--compare", metavar="PATH", help="baseline JSON of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=10.0,
+                        help="percent a metric may get worse before --compare fails")
+    args = parser.parse_args()
+
+    if args.backend:
+        os.environ["EXTRACTION_BACKEND"] = args.backend
+
+    scenarios = {}
+    # With --json - the report goes to stderr, stdout is the JSON document only
+    with contextlib.redirect_stdout(sys.stderr if args.json == "-" else sys.stdout):
+        info(f"EXTRACTION_BACKEND={os.getenv('EXTRACTION_BACKEND', 'process')}, "
+             f"SESSION_BACKEND={os.getenv('SESSION_BACKEND', 'memory')}")
+        if args.scenario in ("all", "poll"):
+            scenarios["poll"] = asyncio.run(scenario_poll(args))
+        if args.scenario in ("all", "mixed"):
+            scenarios["mixed"] = asyncio.run(scenario_poll(args, uploads=args.uploads))
+        if args.scenario in ("all", "lifecycle"):
+            scenarios["lifecycle"] = asyncio.run(scenario_lifecycle(args))
+
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "extraction_backend": os.getenv("EXTRACTION_BACKEND", "process"),
+            "session_backend": os.getenv("SESSION_BACKEND", "memory"),
+            "args": {key: value for key, value in vars(args).items() if key not in ("json", "compare")},
+        },
+        "scenarios": scenarios,
+    }
+    if args.json == "-":
+        print(json.dumps(output, indent=2))
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2)
+        info(f"Results written to {args.json}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(output, baseline, args.tolerance)
+        if regressions:
+            print(f"{Colors.FAIL}{regressions} regression(s){Colors.END}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -104,6 +104,34 @@ def test_get_questions(session_id: str, token: str):
     
     return data
 
+def test_generate_questions(session_id: str, learner_token: str):
+    test_header("Generate Questions (Learner)")
+    
+    headers = {**HEADERS, "X-Token": learner_token}
+    payload = {
+        "pdf_texts": {
+            "test.pdf": (
+                "Was ist Photosynthese? Photosynthese wandelt Lichtenergie in chemische Energie um. "
+                "Welche Rolle spielt Chlorophyll? Chlorophyll absorbiert das Licht. "
+                "Wo findet die Zellatmung statt? Die Zellatmung findet in den Mitochondrien statt."
+            )
+        },
+        "num_questions": 5
+    }
+    response = requests.post(
+        f"{BASE_URL}/session/{session_id}/generate",
+        json=payload,
+        headers=headers
+    )
+    
+    if response.status_code != 200:
+        fail(f"Expected 200, got {response.status_code}: {response.json()}")
+        return None
+    
+    data = response.json()
+    success(f"Generated {data['question_count']} questions")
+    return data
+
 def test_role_denied(session_id: str, learner_token: str):
     test_header("Role Permission Denied (Learner)")
     
@@ -186,6 +214,23 @@ def test_grade_question(session_id: str, examiner_token: str, index: int, status
     success(f"Question {index} graded as '{status}'")
     return True
 
+def test_grade_out_of_range(session_id: str, examiner_token: str, index: int):
+    test_header(f"Grade Question Out Of Range (index={index})")
+    
+    headers = {**HEADERS, "X-Token": examiner_token}
+    response = requests.post(
+        f"{BASE_URL}/session/{session_id}/grade",
+        json={"index": index, "status": "ok"},
+        headers=headers
+    )
+    
+    if response.status_code == 400:
+        success("Grade outside the deck correctly rejected")
+        return True
+    else:
+        fail(f"Expected 400, got {response.status_code}")
+        return False
+
 def test_next_question(session_id: str, examiner_token: str):
     test_header("Move to Next Question")
     
@@ -253,30 +298,38 @@ def run_all_tests():
     # Test 2: Join as learner
     learner_token = test_join_session(session_id, "learner")
     
-    # Test 3: Security tests
+    # Test 3: Generate questions (learner) - grading is bounded by the deck size
+    generated = test_generate_questions(session_id, learner_token)
+    if not generated:
+        return
+    
+    # Test 4: Security tests
     test_role_denied(session_id, learner_token)
     test_missing_token(session_id)
     test_invalid_session()
     
-    # Test 4: Get questions (examiner)
+    # Test 5: Get questions (examiner)
     questions_data = test_get_questions(session_id, examiner_token)
     
-    # Test 5: Learner sees locked question
+    # Test 6: Learner sees locked question
     test_learner_current(session_id, learner_token)
     
-    # Test 6: Reveal question
+    # Test 7: Reveal question
     test_reveal_question(session_id, examiner_token)
     
-    # Test 7: Learner sees revealed question
+    # Test 8: Learner sees revealed question
     test_learner_current(session_id, learner_token)
     
-    # Test 8: Grade question
+    # Test 9: Grade question
     test_grade_question(session_id, examiner_token, 0, "ok")
     
-    # Test 9: Move to next
+    # Test 10: Grade outside the deck
+    test_grade_out_of_range(session_id, examiner_token, generated["question_count"])
+    
+    # Test 11: Move to next
     test_next_question(session_id, examiner_token)
     
-    # Test 10: Final questions check
+    # Test 12: Final questions check
     test_get_questions(session_id, examiner_token)
     
     print(f"\n{Colors.INFO}{'='*60}")
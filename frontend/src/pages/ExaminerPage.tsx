@@ -1,5 +1,5 @@
-import React, { useState, useEffect } from 'react';
-import { sessionAPI, QuestionsResponse } from '../services/api';
+import React, { useState, useEffect, useRef } from 'react';
+import { sessionAPI, subscribeSessionEvents, QuestionsResponse } from '../services/api';
 import '../styles/App.css';
 
 type View = 'landing' | 'learner' | 'examiner';
@@ -15,17 +15,85 @@ export const ExaminerPage: React.FC<ExaminerPageProps> = ({ sessionId, token, on
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [actionLoading, setActionLoading] = useState(false);
+  // Questions already loaded, polling only fetches the ones after them
+  const loadedCount = useRef(0);
+  const deckId = useRef('');
+
+  const applySession = (data: QuestionsResponse) => {
+    setSession(prev => {
+      if (data.offset === 0 || !prev) {
+        loadedCount.current = data.questions.length;
+        deckId.current = data.deck_id;
+        return data;
+      }
+      if (data.deck_id !== deckId.current) {
+        // Deck was regenerated, load it from the start on the next poll
+        loadedCount.current = 0;
+        return prev;
+      }
+      const questions = prev.questions.slice(0, data.offset).concat(data.questions);
+      loadedCount.current = questions.length;
+      return { ...data, questions, offset: 0 };
+    });
+  };
 
   useEffect(() => {
     loadSession();
-    const interval = setInterval(loadSession, 1000);
-    return () => clearInterval(interval);
+
+    // Prefer server push (deltas only), fall back to polling every second
+    let interval: number | null = null;
+    const closeEvents = subscribeSessionEvents(
+      sessionId,
+      token,
+      {
+        snapshot: (data: QuestionsResponse) => {
+          applySession(data);
+          setLoading(false);
+        },
+        questions: (data) => setSession(prev => prev && { ...prev, ...data }),
+        batch: (data) => setSession(prev => prev && {
+          ...prev,
+          questions: prev.questions.slice(0, data.offset).concat(data.questions)
+        }),
+        position: (data) => setSession(prev => prev && { ...prev, ...data }),
+        grade: (data) => setSession(prev => prev && {
+          ...prev,
+          grades: { ...prev.grades, [data.index]: data.status }
+        })
+      },
+      () => {
+        closeEvents();
+        if (interval === null) {
+          interval = setInterval(loadSession, 1000);
+        }
+      }
+    );
+
+    return () => {
+      closeEvents();
+      if (interval !== null) {
+        clearInterval(interval);
+      }
+    };
   }, []);
 
+  // Full load: questions from the cached deck, then only the status behind them
+  const loadFullSession = async (): Promise<QuestionsResponse> => {
+    const deck = await sessionAPI.getDeck(sessionId, token);
+    const status = await sessionAPI.getAllQuestions(sessionId, token, deck.questions.length);
+    if (status.deck_id !== deck.deck_id) {
+      // Regenerated in between
+      return sessionAPI.getAllQuestions(sessionId, token, 0);
+    }
+    return { ...status, questions: deck.questions.concat(status.questions), offset: 0 };
+  };
+
   const loadSession = async () => {
     try {
-      const data = await sessionAPI.getAllQuestions(sessionId, token);
-      setSession(data);
+      const data = loadedCount.current === 0
+        ? await loadFullSession()
+        : await sessionAPI.getAllQuestions(sessionId, token, loadedCount.current);
+      applySession(data);
       setLoading(false);
       setError(''); // Clear any previous errors
     } catch (err: any) {
@@ -123,7 +191,7 @@ export const ExaminerPage: React.FC<ExaminerPageProps> = ({ sessionId, token, on
   }
 
   const currentQuestion = session.questions[session.current_index];
-  const isAtEnd = session.current_index >= session.questions.length - 1;
+  const isAtEnd = session.current_index >= session.question_count - 1;
 
   return (
     <div className="container">
@@ -143,7 +211,7 @@ export const ExaminerPage: React.FC<ExaminerPageProps> = ({ sessionId, token, on
           <div className="current-question-box">
             <h2>Aktuelle Frage</h2>
             <div className="progress-text">
-              Frage {session.current_index + 1} von {session.questions.length}
+              Frage {session.current_index + 1} von {session.question_count}
             </div>
 
             <div className="question-preview">
@@ -207,7 +275,7 @@ export const ExaminerPage: React.FC<ExaminerPageProps> = ({ sessionId, token, on
 
           {/* Questions List */}
           <div className="questions-list-box">
-            <h3>Fragenliste ({session.questions.length})</h3>
+            <h3>Fragenliste ({session.question_count})</h3>
             <ul className="questions-list">
               {session.questions.map((q, idx) => (
                 <li
@@ -1,5 +1,5 @@
 import React, { useState } from 'react';
-import { sessionAPI } from '../services/api';
+import { normalizeSessionCode, sessionAPI } from '../services/api';
 import '../styles/App.css';
 
 interface LandingProps {
@@ -33,9 +33,9 @@ export const Landing: React.FC<LandingProps> = ({ onNavigate }) => {
     setLoading(true);
     setError('');
     try {
-      const result = await sessionAPI.joinSession(sessionCode.toUpperCase(), 'learner');
+      const result = await sessionAPI.joinSession(sessionCode, 'learner');
       onNavigate('learner', {
-        sessionId: sessionCode.toUpperCase(),
+        sessionId: sessionCode,
         token: result.token,
         role: 'learner'
       });
@@ -50,9 +50,9 @@ export const Landing: React.FC<LandingProps> = ({ onNavigate }) => {
     setLoading(true);
     setError('');
     try {
-      const result = await sessionAPI.joinSession(sessionCode.toUpperCase(), 'examiner');
+      const result = await sessionAPI.joinSession(sessionCode, 'examiner');
       onNavigate('examiner', {
-        sessionId: sessionCode.toUpperCase(),
+        sessionId: sessionCode,
         token: result.token,
         role: 'examiner'
       });
@@ -100,7 +100,7 @@ export const Landing: React.FC<LandingProps> = ({ onNavigate }) => {
               type="text"
               placeholder="Session Code eingeben"
               value={sessionCode}
-              onChange={(e) => setSessionCode(e.target.value.toUpperCase())}
+              onChange={(e) => setSessionCode(normalizeSessionCode(e.target.value))}
               maxLength={8}
               className="input"
             />
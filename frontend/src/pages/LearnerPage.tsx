@@ -1,5 +1,5 @@
 import React, { useState, useEffect, useRef } from 'react';
-import { sessionAPI, CurrentQuestionResponse } from '../services/api';
+import { sessionAPI, subscribeSessionEvents, CurrentQuestionResponse } from '../services/api';
 import '../styles/App.css';
 
 type View = 'landing' | 'learner' | 'examiner';
@@ -17,9 +17,11 @@ export const LearnerPage: React.FC<LearnerPageProps> = ({ sessionId, token, role
   );
   const [selectedFiles, setSelectedFiles] = useState<File[]>([]);
   const [uploading, setUploading] = useState(false);
+  const [uploadProgress, setUploadProgress] = useState('');
   const [currentQuestion, setCurrentQuestion] = useState<CurrentQuestionResponse | null>(null);
   const [error, setError] = useState('');
   const pollingIntervalRef = useRef<number | null>(null);
+  const closeEventsRef = useRef<(() => void) | null>(null);
 
   const handleFileSelect = (e: React.ChangeEvent<HTMLInputElement>) => {
     if (e.target.files) {
@@ -37,17 +39,53 @@ export const LearnerPage: React.FC<LearnerPageProps> = ({ sessionId, token, role
     setUploading(true);
     setError('');
     try {
-      await sessionAPI.uploadPdfs(sessionId, selectedFiles, token);
-      
+      const { job_id } = await sessionAPI.uploadPdfs(sessionId, selectedFiles, token);
+
+      // Parsing and question generation run in the background, wait for the job
+      while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const job = await sessionAPI.getJob(sessionId, job_id, token);
+        if (job.status === 'failed') {
+          throw new Error(job.error || 'Verarbeitung fehlgeschlagen');
+        }
+        if (job.status === 'done') {
+          break;
+        }
+        setUploadProgress(
+          job.stage === 'generating'
+            ? 'Fragen werden generiert...'
+            : `Verarbeite PDFs (${job.files_done}/${job.files.length})...`
+        );
+      }
+
       // After successful upload, navigate to examiner view
       onNavigate('examiner', { sessionId, token, role });
     } catch (err: any) {
-      setError(err.response?.data?.detail || 'Upload fehlgeschlagen');
+      if (err.response?.status === 429) {
+        setError('Server ist ausgelastet, bitte in ein paar Sekunden erneut versuchen');
+      } else {
+        setError(err.response?.data?.detail || err.message || 'Upload fehlgeschlagen');
+      }
     } finally {
       setUploading(false);
+      setUploadProgress('');
     }
   };
 
+  const startUpdates = () => {
+    // Prefer server push, fall back to polling if the stream is unavailable
+    closeEventsRef.current = subscribeSessionEvents(
+      sessionId,
+      token,
+      { current: applyCurrentQuestion },
+      () => {
+        closeEventsRef.current?.();
+        closeEventsRef.current = null;
+        startPolling();
+      }
+    );
+  };
+
   const startPolling = () => {
     // Immediate first call
     fetchCurrentQuestion();
@@ -59,20 +97,28 @@ export const LearnerPage: React.FC<LearnerPageProps> = ({ sessionId, token, role
   const fetchCurrentQuestion = async () => {
     try {
       const response = await sessionAPI.getCurrentQuestion(sessionId, token);
-      setCurrentQuestion(response);
-
-      if (response.status === 'revealed') {
-        setStep('question');
-      } else if (response.status === 'completed') {
-        setStep('waiting');
-      }
+      applyCurrentQuestion(response);
     } catch (err) {
       // Silently fail during polling
       console.error('Polling error:', err);
     }
   };
 
+  const applyCurrentQuestion = (response: CurrentQuestionResponse) => {
+    setCurrentQuestion(response);
+
+    if (response.status === 'revealed') {
+      setStep('question');
+    } else if (response.status === 'completed') {
+      setStep('waiting');
+    }
+  };
+
   const stopPolling = () => {
+    if (closeEventsRef.current) {
+      closeEventsRef.current();
+      closeEventsRef.current = null;
+    }
     if (pollingIntervalRef.current) {
       clearInterval(pollingIntervalRef.current);
       pollingIntervalRef.current = null;
@@ -81,7 +127,7 @@ export const LearnerPage: React.FC<LearnerPageProps> = ({ sessionId, token, role
 
   useEffect(() => {
     if (role === 'learner') {
-      startPolling();
+      startUpdates();
     }
     return () => stopPolling();
   }, [role]);
@@ -137,7 +183,7 @@ export const LearnerPage: React.FC<LearnerPageProps> = ({ sessionId, token, role
               disabled={uploading || selectedFiles.length === 0}
               className="btn btn-primary btn-large"
             >
-              {uploading ? 'Wird hochgeladen...' : 'Hochladen'}
+              {uploading ? uploadProgress || 'Wird hochgeladen...' : 'Hochladen'}
             </button>
           </div>
         )}
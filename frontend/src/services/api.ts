@@ -19,12 +19,38 @@ export interface CurrentQuestionResponse {
 export interface QuestionsResponse {
   session_id: string;
   questions: string[];
+  offset: number;
+  question_count: number;
+  deck_id: string;
   current_index: number;
   revealed: boolean;
   grades: Record<number, string>;
   pdfs: Array<{ filename: string; size: number }>;
 }
 
+export interface DeckResponse {
+  deck_id: string;
+  question_count: number;
+  questions: string[];
+}
+
+export interface JobResponse {
+  job_id: string;
+  status: 'queued' | 'running' | 'done' | 'failed';
+  stage: 'queued' | 'extracting' | 'generating' | 'done';
+  files: Array<{
+    filename: string;
+    size: number;
+    status: string;
+    characters: number;
+    error?: string | null;
+    timings?: Record<string, number>;
+  }>;
+  files_done: number;
+  question_count: number;
+  error: string | null;
+}
+
 const api = axios.create({
   baseURL: API_BASE_URL,
   headers: {
@@ -39,18 +65,36 @@ const withToken = (token: string) => ({
   }
 });
 
+// Tokens survive a page reload: joining again with the same token does not
+// use up another learner slot. Learners per tab, the examiner across tabs.
+const tokenStorage = (role: 'learner' | 'examiner') =>
+  role === 'examiner' ? window.localStorage : window.sessionStorage;
+const tokenKey = (sessionId: string, role: 'learner' | 'examiner') => `studyduel:${sessionId}:${role}`;
+
+// Session codes as typed: upper case, O/I/L read as 0/1, separators dropped
+// (same mapping as the backend, so token storage uses the canonical code)
+export const normalizeSessionCode = (code: string) =>
+  code.toUpperCase().replace(/O/g, '0').replace(/[IL]/g, '1').replace(/[\s-]/g, '');
+
 export const sessionAPI = {
   createSession: async (): Promise<SessionResponse> => {
     const response = await api.post('/session');
+    tokenStorage('examiner').setItem(tokenKey(response.data.session_id, 'examiner'), response.data.examiner_token);
     return response.data;
   },
 
   joinSession: async (sessionId: string, role: 'learner' | 'examiner'): Promise<SessionResponse> => {
-    const response = await api.post(`/session/${sessionId}/join`, { role });
+    const storedToken = tokenStorage(role).getItem(tokenKey(sessionId, role));
+    const response = await api.post(
+      `/session/${sessionId}/join`,
+      { role },
+      storedToken ? withToken(storedToken) : undefined
+    );
+    tokenStorage(role).setItem(tokenKey(sessionId, role), response.data.token);
     return response.data;
   },
 
-  uploadPdfs: async (sessionId: string, files: File[], token: string): Promise<any> => {
+  uploadPdfs: async (sessionId: string, files: File[], token: string, numQuestions?: number): Promise<any> => {
     const formData = new FormData();
     files.forEach(file => formData.append('files', file));
 
@@ -61,16 +105,25 @@ export const sessionAPI = {
         headers: {
           'X-Token': token,
           'Content-Type': 'multipart/form-data'
-        }
+        },
+        params: numQuestions ? { num_questions: numQuestions } : undefined
       }
     );
     return response.data;
   },
 
-  generateQuestions: async (sessionId: string, pdfTexts: Record<string, string>, token: string): Promise<any> => {
+  getJob: async (sessionId: string, jobId: string, token: string): Promise<JobResponse> => {
+    const response = await api.get(
+      `/session/${sessionId}/jobs/${jobId}`,
+      withToken(token)
+    );
+    return response.data;
+  },
+
+  generateQuestions: async (sessionId: string, pdfTexts: Record<string, string>, token: string, numQuestions?: number): Promise<any> => {
     const response = await api.post(
       `/session/${sessionId}/generate`,
-      { pdf_texts: pdfTexts },
+      { pdf_texts: pdfTexts, num_questions: numQuestions },
       withToken(token)
     );
     return response.data;
@@ -84,14 +137,24 @@ export const sessionAPI = {
     return response.data;
   },
 
-  getAllQuestions: async (sessionId: string, token: string): Promise<QuestionsResponse> => {
+  // Questions generated so far, a cached body the browser revalidates via ETag
+  getDeck: async (sessionId: string, token: string): Promise<DeckResponse> => {
     const response = await api.get(
-      `/session/${sessionId}/questions`,
+      `/session/${sessionId}/deck`,
       withToken(token)
     );
     return response.data;
   },
 
+  // offset > 0 only returns the questions from that index on
+  getAllQuestions: async (sessionId: string, token: string, offset = 0): Promise<QuestionsResponse> => {
+    const response = await api.get(
+      `/session/${sessionId}/questions`,
+      { ...withToken(token), params: { offset } }
+    );
+    return response.data;
+  },
+
   revealQuestion: async (sessionId: string, token: string): Promise<any> => {
     const response = await api.post(
       `/session/${sessionId}/reveal`,
@@ -119,6 +182,16 @@ export const sessionAPI = {
     return response.data;
   },
 
+  // Single-use ticket for opening the event stream (EventSource cannot send X-Token)
+  createEventsTicket: async (sessionId: string, token: string): Promise<{ ticket: string; expires_in: number }> => {
+    const response = await api.post(
+      `/session/${sessionId}/events/ticket`,
+      {},
+      withToken(token)
+    );
+    return response.data;
+  },
+
   gradeQuestion: async (sessionId: string, index: number, status: 'ok' | 'meh' | 'fail', token: string): Promise<any> => {
     const response = await api.post(
       `/session/${sessionId}/grade`,
@@ -129,6 +202,66 @@ export const sessionAPI = {
   }
 };
 
+export type SessionEventHandlers = Record<string, (data: any) => void>;
+
+// Server-push channel (Server-Sent Events). Returns a function that closes the stream.
+// onError is called once when the stream fails, callers fall back to polling.
+export const subscribeSessionEvents = (
+  sessionId: string,
+  token: string,
+  handlers: SessionEventHandlers,
+  onError: () => void
+): (() => void) => {
+  if (typeof EventSource === 'undefined') {
+    setTimeout(onError, 0);
+    return () => {};
+  }
+
+  let source: EventSource | null = null;
+  let closed = false;
+
+  const connect = async () => {
+    let ticket: string;
+    try {
+      ({ ticket } = await sessionAPI.createEventsTicket(sessionId, token));
+    } catch {
+      if (!closed) onError();
+      return;
+    }
+    if (closed) return;
+
+    let opened = false;
+    const current = new EventSource(
+      `${API_BASE_URL}/session/${sessionId}/events?ticket=${encodeURIComponent(ticket)}`
+    );
+    source = current;
+    Object.entries(handlers).forEach(([event, handler]) => {
+      current.addEventListener(event, (e) => handler(JSON.parse((e as MessageEvent).data)));
+    });
+    current.onopen = () => {
+      opened = true;
+    };
+    current.onerror = () => {
+      // The ticket is used up, so the browser cannot reconnect by itself:
+      // reconnect with a new one while the stream was working before,
+      // give up if it never opened
+      current.close();
+      if (closed) return;
+      if (opened) {
+        setTimeout(connect, 1000);
+      } else {
+        onError();
+      }
+    };
+  };
+  connect();
+
+  return () => {
+    closed = true;
+    source?.close();
+  };
+};
+
 export const extractPdfText = async (file: File): Promise<string> => {
   // For MVP, we'll use a simple approach: store file content as base64
   // In real scenario, backend would handle PDF parsing